@@ -0,0 +1,775 @@
+# The classes in in_memory_structures represent every <q, u> pair as an instance of a URL stats class
+# held in a dictionary inside a Query held in a dictionary inside a QueryCollection.  At the scale of
+# the AOL dataset, the per instance overhead of those objects dominates memory consumption.
+
+# This module is an alternative, columnar implementation of the same mapping of mappings. Queries and
+# URLs are given dense integer ids and each unique <q, u> pair is a row in a set of parallel NumPy
+# arrays holding the query id, the url id, the number of repetitions, the probability and the variance.
+# URL ids are those of the process wide blender.vocabulary, so they are the same in every collection.
+# Query ids are local to a collection because they index its per query arrays.
+# Per query statistics are held in arrays indexed by query id.  This allows the Blender algorithms to
+# be implemented as whole array expressions rather than as method calls on millions of objects.
+
+# The mapping interface is retained through lightweight view classes, ArrayQuery and ArrayURLStats,
+# that are created on demand when a query or url is looked up by string.  They hold only a reference
+# to the collection and a row number, so they are transient: they must not be kept across an operation
+# that removes <q, u> pairs from the collection.
+
+# The top level classes are intended to be injected together, replacing all four of the classes in
+# main.default_data_structures.  See main.array_data_structures.  The vectorized algorithms expect the
+# other collections they are given to be array backed too.
+
+from collections import (
+    MutableMapping
+)
+from math import (
+    exp
+)
+from configman import (
+    Namespace,
+    RequiredConfig,
+    class_converter,
+)
+
+from numpy import (
+    arange,
+    argsort,
+    array,
+    bincount,
+    float64,
+    int64,
+    isin,
+    nonzero,
+    ones,
+    searchsorted,
+    unique,
+    where,
+    zeros,
+)
+from numpy.random import (
+    laplace
+)
+
+from blender.in_memory_structures import (
+    QueryCollection
+)
+from blender.head_list import (
+    HeadList,
+    HeadListQuery,
+    read_snapshot,
+)
+from blender.client_structures import (
+    estimate_query_probabilities,
+    estimate_url_probabilities,
+)
+from blender.final_structures import (
+    blend_url_probabilities
+)
+from blender.vocabulary import (
+    vocabulary
+)
+
+
+# pair keys combine a query id and a url id into a single integer: query_id << URL_ID_BITS | url_id
+URL_ID_BITS = 32
+
+
+def _resized(an_array, new_size):
+    new_array = zeros(new_size, dtype=an_array.dtype)
+    new_array[:len(an_array)] = an_array
+    return new_array
+
+
+# --------------------------------------------------------------------------------------------------------
+# 3rd Level Structures
+#     A view of a single url's stats - a row in the pair columns of an ArrayQueryCollection
+
+class ArrayURLStats(object):
+    """A view of one <q, u> pair of an ArrayQueryCollection presenting the same attributes as the
+    URLStats class of in_memory_structures."""
+    def __init__(self, collection, pair_row):
+        self.collection = collection
+        self.pair_row = pair_row
+
+    @property
+    def number_of_repetitions(self):
+        return int(self.collection.counts[self.pair_row])
+
+    @number_of_repetitions.setter
+    def number_of_repetitions(self, value):
+        query_id = self.collection.pair_query_ids[self.pair_row]
+        self.collection.query_counts[query_id] += value - self.collection.counts[self.pair_row]
+        self.collection.counts[self.pair_row] = value
+
+    @property
+    def probability(self):
+        return float(self.collection.probabilities[self.pair_row])
+
+    @probability.setter
+    def probability(self, value):
+        self.collection.probabilities[self.pair_row] = value
+
+    @property
+    def variance(self):
+        return float(self.collection.variances[self.pair_row])
+
+    @variance.setter
+    def variance(self, value):
+        self.collection.variances[self.pair_row] = value
+
+    def increment_count(self, amount=1):
+        self.number_of_repetitions += amount
+
+    def print(self, indent=0):
+        print('{}count={}'.format(' ' * indent, self.number_of_repetitions))
+        print("{}prob={}".format(' ' * indent, self.probability))
+        print("{}vari={}".format(' ' * indent, self.variance))
+
+
+class ArrayFinalURLStats(ArrayURLStats):
+    """the view used by ArrayFinalQueryCollection, it adds the omega of Figure 7"""
+    @property
+    def omega(self):
+        return float(self.collection.omegas[self.pair_row])
+
+    @omega.setter
+    def omega(self, value):
+        self.collection.omegas[self.pair_row] = value
+
+    def calculate_probability_relative_to(self, other_query_url_mapping, query_str='*', url_str='*', head_list=None):
+        # this is the scalar form of ArrayFinalQueryCollection.calculate_probability_relative_to
+        client_url = other_query_url_mapping[query_str][url_str]
+        head_list_url = head_list[query_str][url_str]
+        # from Figure 7, line 3
+        self.omega = client_url.variance / (head_list_url.variance + client_url.variance)
+        self.probability = self.omega * head_list_url.probability + (1 - self.omega) * client_url.probability
+
+
+# --------------------------------------------------------------------------------------------------------
+# 2nd Level Structures
+#     A view of a single query's stats and urls
+#     Mapping
+#         urls are the key
+#         3rd Level structure views as the value
+
+class ArrayQuery(MutableMapping, RequiredConfig):
+    """A view of one query of an ArrayQueryCollection presenting the same interface as the Query
+    classes of in_memory_structures and head_list."""
+    frozen_attributes = HeadListQuery.frozen_attributes
+
+    required_config = Namespace()
+    required_config.add_option(
+        name="url_stats_class",
+        default="blender.array_structures.ArrayURLStats",
+        from_string_converter=class_converter,
+        doc="dependency injection of a class to view the statistics of URLs"
+    )
+
+    def __init__(self, collection, query_id):
+        self.collection = collection
+        self.query_id = query_id
+
+    @property
+    def query_str(self):
+        return self.collection.query_strs[self.query_id]
+
+    @property
+    def number_of_urls(self):
+        return int(self.collection.query_counts[self.query_id])
+
+    @property
+    def number_of_unique_urls(self):
+        return len(self)
+
+    @property
+    def kappa_q(self):
+        return self.number_of_unique_urls
+
+    @property
+    def probability(self):
+        return float(self.collection.query_probabilities[self.query_id])
+
+    @probability.setter
+    def probability(self, value):
+        self.collection.query_probabilities[self.query_id] = value
+
+    @property
+    def variance(self):
+        return float(self.collection.query_variances[self.query_id])
+
+    @variance.setter
+    def variance(self, value):
+        self.collection.query_variances[self.query_id] = value
+
+    @property
+    def tau(self):
+        return float(self.collection.query_taus[self.query_id])
+
+    def touch(self, url):
+        """add a url without incrementing the count - this is used to add the star url *"""
+        self.collection.find_pair_row(self.query_str, url)
+
+    def add(self, url, amount=1):
+        self.collection.add((self.query_str, url), amount)
+
+    def print(self, indent):
+        print('{}tau={}'.format(' ' * indent, self.tau))
+        print('{}count={}'.format(' ' * indent, self.number_of_urls))
+        print('{}prob={}'.format(' ' * indent, self.probability))
+        print('{}vari={}'.format(' ' * indent, self.variance))
+        for url in self:
+            print('{}{}'.format(' ' * indent, url))
+            self[url].print(indent + 4)
+
+    def __getitem__(self, url):
+        return self.collection.config.url_stats_class(
+            self.collection,
+            self.collection.find_pair_row(self.query_str, url)
+        )
+
+    def __setitem__(self, url, item):
+        url_stats = self[url]
+        url_stats.number_of_repetitions = item.number_of_repetitions
+        url_stats.probability = item.probability
+        url_stats.variance = item.variance
+
+    def __delitem__(self, url):
+        if url not in self:
+            raise KeyError(url)
+        self.collection.remove_pairs(((self.query_str, url),))
+
+    def clear(self):
+        # one compaction rather than the one per url of MutableMapping.clear
+        self.collection.remove_pairs((self.query_str, url) for url in list(self))
+
+    def __iter__(self):
+        url_strs = self.collection.vocabulary.strs
+        for url_id in self.collection.pair_url_ids[self.collection.rows_of_query(self.query_id)]:
+            yield url_strs[url_id]
+
+    def __len__(self):
+        return len(self.collection.rows_of_query(self.query_id))
+
+    def __contains__(self, url):
+        return self.collection.find_pair_row(self.query_str, url, create=False) is not None
+
+
+# --------------------------------------------------------------------------------------------------------
+# Top Level Structures -
+#    Mapping
+#        queries serve as the key
+#        2nd Level structure views as the value
+
+class ArrayQueryCollection(QueryCollection):
+    """A columnar implementation of QueryCollection.  Each unique <q, u> pair is a row in the
+    pair columns, each query is a row in the query columns."""
+    # other collections read the columns directly
+    frozen_attributes = QueryCollection.frozen_attributes + (
+        'number_of_pairs',
+        'pair_keys',
+        'pair_query_ids',
+        'query_vocabulary_ids',
+        'counts',
+        'probabilities',
+        'variances',
+        'query_counts',
+        'query_probabilities',
+        'query_variances',
+        'query_taus',
+    )
+
+    required_config = Namespace()
+    required_config.add_option(
+        name="query_class",
+        default="blender.array_structures.ArrayQuery",
+        from_string_converter=class_converter,
+        doc="dependency injection of a class to view a mapping of URLs to URL stats"
+    )
+
+    # the names and types of the arrays indexed by pair row
+    pair_columns = (
+        ('pair_query_ids', int64),
+        ('pair_url_ids', int64),
+        ('counts', int64),
+        ('probabilities', float64),
+        ('variances', float64),
+    )
+    # the names and types of the arrays indexed by query id
+    query_columns = (
+        ('query_counts', int64),
+        ('query_probabilities', float64),
+        ('query_variances', float64),
+        ('query_taus', float64),
+    )
+
+    def __init__(self, config):
+        self.config = config
+        self.vocabulary = vocabulary  # shared strings and the ids of urls
+        self.query_ids = {}  # query string to query id
+        self.query_strs = []  # query id to query string
+        self.query_vocabulary_ids = []  # query id to the id of the query string in the vocabulary
+        self.pair_rows = {}  # pair key to pair row
+        self.number_of_pairs = 0  # the number of rows in use in the pair columns
+        for name, dtype in self.pair_columns + self.query_columns:
+            setattr(self, name, zeros(0, dtype=dtype))
+        self.number_of_query_url_pairs = 0
+        # pair rows ordered by query id and the offsets of each query into that ordering.  This is
+        # calculated on demand and discarded whenever pairs are added or removed
+        self._rows_by_query = None
+
+    # the following methods manage the ids and columns
+
+    def find_query_id(self, query_str, create=True):
+        try:
+            return self.query_ids[query_str]
+        except KeyError:
+            if not create:
+                return None
+        query_id = len(self.query_strs)
+        if query_id == len(self.query_counts):
+            for name, dtype in self.query_columns:
+                setattr(self, name, _resized(getattr(self, name), max(16, 2 * query_id)))
+        vocabulary_id = self.vocabulary.find_id(query_str)
+        query_str = self.vocabulary[vocabulary_id]
+        self.query_ids[query_str] = query_id
+        self.query_strs.append(query_str)
+        self.query_vocabulary_ids.append(vocabulary_id)
+        self._rows_by_query = None
+        return query_id
+
+    def find_url_id(self, url_str, create=True):
+        return self.vocabulary.find_id(url_str, create)
+
+    def find_pair_row(self, query_str, url_str, create=True):
+        """return the row of the <q, u> pair in the pair columns creating it if it doesn't exist"""
+        query_id = self.find_query_id(query_str, create)
+        url_id = self.find_url_id(url_str, create)
+        if query_id is None or url_id is None:
+            return None
+        pair_key = query_id << URL_ID_BITS | url_id
+        try:
+            return self.pair_rows[pair_key]
+        except KeyError:
+            if not create:
+                return None
+        pair_row = self.number_of_pairs
+        if pair_row == len(self.counts):
+            for name, dtype in self.pair_columns:
+                setattr(self, name, _resized(getattr(self, name), max(16, 2 * pair_row)))
+        self.pair_query_ids[pair_row] = query_id
+        self.pair_url_ids[pair_row] = url_id
+        self.pair_rows[pair_key] = pair_row
+        self.number_of_pairs += 1
+        self._rows_by_query = None
+        return pair_row
+
+    def pair_keys(self):
+        n = self.number_of_pairs
+        return self.pair_query_ids[:n] << URL_ID_BITS | self.pair_url_ids[:n]
+
+    def all_pairs(self):
+        """a boolean array selecting every pair row, for use with 'compact'"""
+        return ones(self.number_of_pairs, dtype=bool)
+
+    def remove_pairs(self, q_u_pairs):
+        """remove the rows of the given <q, u> pairs with a single compaction.  Each compaction
+        rebuilds the columns, so removing many pairs should be done here rather than one by one
+        through 'del'.  Pairs that are not in the collection are ignored."""
+        keep = self.all_pairs()
+        for query_str, url_str in q_u_pairs:
+            pair_row = self.find_pair_row(query_str, url_str, create=False)
+            if pair_row is not None:
+                keep[pair_row] = False
+        if not keep.all():
+            self.compact(keep)
+
+    def rows_of_query(self, query_id):
+        """the pair rows belonging to a query in the order that they were added"""
+        if self._rows_by_query is None:
+            pair_query_ids = self.pair_query_ids[:self.number_of_pairs]
+            offsets = zeros(len(self.query_strs) + 1, dtype=int64)
+            offsets[1:] = bincount(pair_query_ids, minlength=len(self.query_strs)).cumsum()
+            self._rows_by_query = (argsort(pair_query_ids, kind='stable'), offsets)
+        ordered_rows, offsets = self._rows_by_query
+        return ordered_rows[offsets[query_id]:offsets[query_id + 1]]
+
+    def compact(self, keep, dropped_query_ids=()):
+        """retain only the pair rows selected by the boolean array 'keep'.  Queries that lose all of
+        their urls and those listed in 'dropped_query_ids' are removed.  The remaining queries are
+        renumbered."""
+        n = self.number_of_pairs
+        number_of_queries = len(self.query_strs)
+        had_pairs = bincount(self.pair_query_ids[:n], minlength=number_of_queries) > 0
+        rows = nonzero(keep)[0]
+        for name, dtype in self.pair_columns:
+            setattr(self, name, getattr(self, name)[rows])
+        self.number_of_pairs = len(rows)
+
+        has_pairs = bincount(self.pair_query_ids, minlength=number_of_queries) > 0
+        surviving_queries = has_pairs | ~had_pairs
+        surviving_queries[list(dropped_query_ids)] = False
+        for name, dtype in self.query_columns:
+            setattr(self, name, getattr(self, name)[:number_of_queries][surviving_queries])
+        new_query_ids = surviving_queries.cumsum() - 1
+        self.pair_query_ids = new_query_ids[self.pair_query_ids]
+        self.query_strs = [
+            query_str for query_str, survives in zip(self.query_strs, surviving_queries) if survives
+        ]
+        self.query_vocabulary_ids = [
+            vocabulary_id for vocabulary_id, survives in zip(self.query_vocabulary_ids, surviving_queries) if survives
+        ]
+        self.query_ids = {query_str: query_id for query_id, query_str in enumerate(self.query_strs)}
+        self.query_counts = bincount(
+            self.pair_query_ids,
+            weights=self.counts,
+            minlength=len(self.query_strs)
+        ).astype(int64)
+        self.pair_rows = {pair_key: pair_row for pair_row, pair_key in enumerate(self.pair_keys().tolist())}
+        self._rows_by_query = None
+
+    def query_ids_in(self, other_query_collection):
+        """for each query id in this collection, the id of the same query in another array backed
+        collection or -1 if the other collection doesn't have that query.  Both collections must share
+        a vocabulary."""
+        vocabulary_ids = array(self.query_vocabulary_ids, dtype=int64)
+        other_vocabulary_ids = array(other_query_collection.query_vocabulary_ids, dtype=int64)
+        if not len(other_vocabulary_ids):
+            return zeros(len(vocabulary_ids), dtype=int64) - 1
+        order = argsort(other_vocabulary_ids)
+        sorted_ids = other_vocabulary_ids[order]
+        positions = searchsorted(sorted_ids, vocabulary_ids).clip(0, len(order) - 1)
+        return where(sorted_ids[positions] == vocabulary_ids, order[positions], -1)
+
+    def rows_in(self, other_query_collection):
+        """for each pair row in this collection, the row of the same <q, u> pair in another array backed
+        collection or -1 if the other collection doesn't have that pair.  Both collections must share
+        a vocabulary."""
+        n = self.number_of_pairs
+        if not n or not other_query_collection.number_of_pairs:
+            return zeros(n, dtype=int64) - 1
+        # the urls have the same ids in both collections, only the query ids need translation
+        other_query_ids = self.query_ids_in(other_query_collection)[self.pair_query_ids[:n]]
+        wanted_keys = other_query_ids << URL_ID_BITS | self.pair_url_ids[:n]
+
+        other_keys = other_query_collection.pair_keys()
+        order = argsort(other_keys)
+        sorted_keys = other_keys[order]
+        positions = searchsorted(sorted_keys, wanted_keys).clip(0, len(order) - 1)
+        found = (sorted_keys[positions] == wanted_keys) & (other_query_ids >= 0)
+        return where(found, order[positions], -1)
+
+    @property
+    def number_of_queries(self):
+        return len(self)
+
+    def append_star_values(self):
+        # from 1-3 of EstimateClientProbabilities Figure 5.
+        for query_str in list(self.query_strs):
+            self.find_pair_row(query_str, '*')
+
+    def add(self, q_u_tuple, amount=1):
+        """add a new <q, u> tuple to this collecton"""
+        q, u = q_u_tuple
+        pair_row = self.find_pair_row(q, u)
+        self.counts[pair_row] += amount
+        self.query_counts[self.pair_query_ids[pair_row]] += amount
+        self.number_of_query_url_pairs += amount
+
+    def subsume_those_not_present_in(self, other_query_collection):
+        """take all <q, u> records in this collection that are not in the other_query_url_mapping and
+        merge their statistics into this collection's <*, *> entry"""
+        star_row = self.find_pair_row('*', '*')
+        star_query_id = self.query_ids['*']
+        n = self.number_of_pairs
+        keep = (self.rows_in(other_query_collection) >= 0) | (self.pair_query_ids[:n] == star_query_id)
+        subsumed = ~keep
+        subsumed_count = self.counts[:n][subsumed].sum()
+        subsumed_probability = self.probabilities[:n][subsumed].sum()
+        self.counts[star_row] += subsumed_count
+        self.probabilities[star_row] += subsumed_probability
+        self.query_probabilities[star_query_id] += subsumed_probability
+        self.query_probabilities[:len(self.query_strs)] -= bincount(
+            self.pair_query_ids[:n][subsumed],
+            weights=self.probabilities[:n][subsumed],
+            minlength=len(self.query_strs)
+        )
+        self.compact(keep)
+
+    def iter_records(self):
+        """an alternative iterator that returns unique <q, u> pairs"""
+        for query_id, query_str in enumerate(self.query_strs):
+            for url_id in self.pair_url_ids[self.rows_of_query(query_id)]:
+                yield query_str, self.vocabulary[url_id]
+
+    # this class implements the MuteableMapping Abstract Base Class.  These are the implementation of
+    # the required methods for that ABC.
+    def __getitem__(self, query_str):
+        return self.config.query_class(self, self.find_query_id(query_str))
+
+    def __setitem__(self, query_str, a_query):
+        for url_str in a_query:
+            self[query_str][url_str] = a_query[url_str]
+
+    def __delitem__(self, query_str):
+        query_id = self.find_query_id(query_str, create=False)
+        if query_id is None:
+            raise KeyError(query_str)
+        self.compact(self.pair_query_ids[:self.number_of_pairs] != query_id, (query_id,))
+
+    def clear(self):
+        # one compaction rather than the one per query of MutableMapping.clear
+        self.compact(zeros(self.number_of_pairs, dtype=bool), range(len(self.query_strs)))
+
+    def __iter__(self):
+        for query_str in list(self.query_strs):
+            yield query_str
+
+    def __len__(self):
+        return len(self.query_strs)
+
+    def __contains__(self, query_str):
+        return query_str in self.query_ids
+
+    def __getstate__(self, key_list=None):
+        # for use by jsonpickle.  The process wide vocabulary is not written, only the url strings that
+        # this collection refers to.  The ids derived from the vocabulary are rebuilt by __setstate__
+        if key_list is None:
+            key_list = list()
+        key_list.extend((
+            '_rows_by_query',
+            'vocabulary',
+            'query_ids',
+            'query_vocabulary_ids',
+            'pair_rows',
+            'pair_url_ids',
+        ))
+        state = super(ArrayQueryCollection, self).__getstate__(key_list)
+        url_ids, state['pair_url_numbers'] = unique(self.pair_url_ids[:self.number_of_pairs], return_inverse=True)
+        state['url_strs'] = [self.vocabulary[url_id] for url_id in url_ids.tolist()]
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        url_strs = state.pop('url_strs')
+        pair_url_numbers = state.pop('pair_url_numbers')
+        super(ArrayQueryCollection, self).__setstate__(state)
+        self.vocabulary = vocabulary
+        self._rows_by_query = None
+        url_ids = array([self.vocabulary.find_id(url_str) for url_str in url_strs], dtype=int64)
+        self.pair_url_ids = zeros(len(self.pair_query_ids), dtype=int64)
+        self.pair_url_ids[:self.number_of_pairs] = url_ids[pair_url_numbers]
+        self.query_vocabulary_ids = [self.vocabulary.find_id(query_str) for query_str in self.query_strs]
+        self.query_strs = [self.vocabulary[vocabulary_id] for vocabulary_id in self.query_vocabulary_ids]
+        self.query_ids = {query_str: query_id for query_id, query_str in enumerate(self.query_strs)}
+        self.pair_rows = {pair_key: pair_row for pair_row, pair_key in enumerate(self.pair_keys().tolist())}
+
+
+class ArrayHeadList(ArrayQueryCollection):
+    """the columnar counterpart of blender.head_list.HeadList"""
+    frozen_attributes = ArrayQueryCollection.frozen_attributes + ('tau',)
+    # the m most probable queries are selected from the whole probability column, so HeadList's
+    # streaming_top_m doesn't apply
+    required_config = HeadList.required_config.safe_copy()
+    del required_config['streaming_top_m']
+
+    def __init__(self, config):
+        super(ArrayHeadList, self).__init__(config)
+        self.tau = 0.0
+        self.k = 0
+        self.kappa = 0
+
+    def create_headlist(self, optin_database_s):
+        # Figure 3, line 6-7 were moved to configuration of this object
+        # from Figure 3, CreateHeadList, line 7
+        assert self.config.tau >= 1.0
+        n = optin_database_s.number_of_pairs
+        noisy_counts = optin_database_s.counts[:n] + laplace(0.0, self.config.b, size=n)
+        for pair_row in nonzero(noisy_counts > self.config.tau)[0]:
+            self.add((
+                optin_database_s.query_strs[optin_database_s.pair_query_ids[pair_row]],
+                optin_database_s.vocabulary[optin_database_s.pair_url_ids[pair_row]],
+            ))
+        self.add(('*', '*'))
+
+    def calculate_probabilities_relative_to(self, other_query_url_mapping, head_list=None):
+        # Figure 4: lines 10 - 12
+        n = self.number_of_pairs
+        other_rows = self.rows_in(other_query_url_mapping)
+        other_counts = where(other_rows >= 0, other_query_url_mapping.counts[other_rows], 0)
+        y = laplace(0.0, self.config.b, size=n)
+        self.probabilities[:n] = (other_counts + y) / other_query_url_mapping.number_of_query_url_pairs
+        self.query_probabilities[:len(self.query_strs)] += bincount(
+            self.pair_query_ids[:n],
+            weights=self.probabilities[:n],
+            minlength=len(self.query_strs)
+        )
+
+    def subsume_entries_beyond_max_size(self):
+        # Figure 4: line 14
+        if '*' not in self:
+            self.add(('*', '*'))
+        star_query_id = self.query_ids['*']
+        star_row = self.find_pair_row('*', '*')
+        n = self.number_of_pairs
+
+        # the candidates are in order of query id so that a stable sort breaks ties by insertion order
+        candidates = nonzero(arange(len(self.query_strs)) != star_query_id)[0]
+        ranked = candidates[argsort(-self.query_probabilities[candidates], kind='stable')]
+        subsumed = isin(self.pair_query_ids[:n], ranked[self.config.m:])
+
+        subsumed_probability = self.probabilities[:n][subsumed].sum()
+        self.query_probabilities[star_query_id] += subsumed_probability
+        self.probabilities[star_row] += subsumed_probability
+        self.number_of_query_url_pairs -= int(self.counts[:n][subsumed].sum())
+        self.compact(~subsumed)
+
+    def calculate_variance_relative_to(self, other_query_url_mapping):
+        """This is part of the algorithm from the Blender paper, Figure 4"""
+        # Figure 4: line 15 & 13
+        n = self.number_of_pairs
+        number_of_pairs = other_query_url_mapping.number_of_query_url_pairs
+        probabilities = self.probabilities[:n]
+        self.variances[:n] = (
+            (probabilities * (1.0 - probabilities)) / (number_of_pairs - 1.0)
+            +
+            (2.0 * self.config.b * self.config.b) / (number_of_pairs * (number_of_pairs - 1.0))
+        )
+
+    def calculate_tau(self):
+        """from Figure 6 LocalAlg, lines 4-6"""
+        self.kappa = self.number_of_queries
+        self.tau = (
+            (exp(self.config.epsilon_prime_q) + (self.config.delta_prime_q / 2.0) * (self.number_of_query_url_pairs - 1))
+            /
+            (exp(self.config.epsilon_prime_q) + self.number_of_query_url_pairs - 1)
+        )
+        number_of_urls = self.query_counts[:len(self.query_strs)]
+        self.query_taus[:len(self.query_strs)] = (
+            (exp(self.config.epsilon_prime_u) + (self.config.delta_prime_u / 2.0) * (number_of_urls - 1.0))
+            /
+            (exp(self.config.epsilon_prime_u) + number_of_urls - 1.0)
+        )
+
+    def print(self, indent=0):
+        print('{}config.tau={}'.format(' ' * indent, self.config.tau))
+        print('{}tau={}'.format(' ' * indent, self.tau))
+        super(ArrayHeadList, self).print(indent)
+
+    # the snapshot and the artifact are written through the mapping interface shared with HeadList
+    save_snapshot = HeadList.save_snapshot
+    export_for_client_distribution = HeadList.export_for_client_distribution
+
+    def load_snapshot(self, file_name):
+        """restore a head_list written by save_snapshot into this empty head_list"""
+        (self.tau, self.k, self.kappa), self.number_of_query_url_pairs, columns = read_snapshot(file_name)
+        # the columns of the snapshot become the columns of this head_list, only the ids are translated
+        self.query_vocabulary_ids = [self.vocabulary.find_id(query_str) for query_str in columns['query_strs']]
+        self.query_strs = [self.vocabulary[vocabulary_id] for vocabulary_id in self.query_vocabulary_ids]
+        self.query_ids = {query_str: query_id for query_id, query_str in enumerate(self.query_strs)}
+        self.query_counts = columns['numbers_of_urls']
+        self.query_probabilities = columns['query_probabilities']
+        self.query_variances = columns['query_variances']
+        self.query_taus = columns['taus']
+        self.pair_query_ids = columns['url_query_numbers']
+        self.pair_url_ids = array(
+            [self.vocabulary.find_id(url_str) for url_str in columns['url_strs']],
+            dtype=int64
+        )
+        self.counts = columns['numbers_of_repetitions']
+        self.probabilities = columns['url_probabilities']
+        self.variances = columns['url_variances']
+        self.number_of_pairs = len(self.counts)
+        self.pair_rows = {pair_key: pair_row for pair_row, pair_key in enumerate(self.pair_keys().tolist())}
+        self._rows_by_query = None
+
+
+class ArrayClientQueryCollection(ArrayQueryCollection):
+    """the columnar counterpart of blender.client_structures.ClientQueryCollection"""
+
+    def calculate_probabilities(self, head_list):
+        """This is from the Blender paper, Figure 4"""
+
+        assert head_list.number_of_queries >= self.number_of_queries
+
+        # we want the client probabilities calcualated relative to itself.
+        self.calculate_probabilities_relative_to(self, head_list=head_list)
+
+    def calculate_probabilities_relative_to(self, other_query_url_mapping, head_list=None):
+        """This is from the Blender paper, Figure 5, lines 9 - 17"""
+        # from Figure 5, line 14 - every <q, u> of the head_list for the queries in this collection
+        # gets an estimate, even those that no client reported
+        for query_str in list(self.query_strs):
+            if query_str in head_list:
+                for url_str in head_list[query_str]:
+                    self.find_pair_row(query_str, url_str)
+
+        number_of_queries = len(self.query_strs)
+        number_of_pairs = other_query_url_mapping.number_of_query_url_pairs
+        other_query_rows = self.query_ids_in(other_query_url_mapping)
+        other_query_counts = where(other_query_rows >= 0, other_query_url_mapping.query_counts[other_query_rows], 0)
+
+        # from Figure 5, lines 11 - 13
+        self.query_probabilities[:number_of_queries], self.query_variances[:number_of_queries] = (
+            estimate_query_probabilities(other_query_counts / number_of_pairs, number_of_pairs, head_list)
+        )
+
+        n = self.number_of_pairs
+        head_list_rows = self.rows_in(head_list)
+        estimated = head_list_rows >= 0
+        head_list_rows = head_list_rows[estimated]
+        other_rows = self.rows_in(other_query_url_mapping)[estimated]
+        other_query_ids = other_query_rows[self.pair_query_ids[:n][estimated]]
+        head_list_query_ids = head_list.pair_query_ids[head_list_rows]
+
+        # from Figure 5, lines 15 - 17
+        self.probabilities[:n][estimated], self.variances[:n][estimated] = estimate_url_probabilities(
+            where(other_rows >= 0, other_query_url_mapping.counts[other_rows], 0) / number_of_pairs,
+            other_query_url_mapping.query_probabilities[other_query_ids],
+            other_query_url_mapping.query_variances[other_query_ids],
+            head_list.query_taus[head_list_query_ids],
+            head_list.query_probabilities[head_list_query_ids],
+            head_list.query_variances[head_list_query_ids],
+            bincount(
+                head_list.pair_query_ids[:head_list.number_of_pairs],
+                minlength=head_list.number_of_queries
+            )[head_list_query_ids],
+            number_of_pairs,
+            head_list
+        )
+
+
+class ArrayFinalQueryCollection(ArrayQueryCollection):
+    """the columnar counterpart of blender.final_structures.FinalQueryCollection"""
+    pair_columns = ArrayQueryCollection.pair_columns + (
+        ('omegas', float64),
+    )
+
+    def calculate_probability_relative_to(self, client_probabilities, optin_probabilities):
+        for query_str, url_str in optin_probabilities.iter_records():
+            self.find_pair_row(query_str, url_str)
+        n = self.number_of_pairs
+        client_rows = self.rows_in(client_probabilities)
+        client_found = client_rows >= 0
+        optin_rows = self.rows_in(optin_probabilities)
+        # from Figure 7, line 3
+        self.omegas[:n], self.probabilities[:n] = blend_url_probabilities(
+            optin_probabilities.probabilities[optin_rows],
+            optin_probabilities.variances[optin_rows],
+            where(client_found, client_probabilities.probabilities[client_rows], 0.0),
+            where(client_found, client_probabilities.variances[client_rows], 0.0),
+        )
+
+    def iter_records(self):
+        for query_id, query_str in enumerate(self.query_strs):
+            rows = self.rows_of_query(query_id)
+            # highest probability first, ties in the order that they were added
+            for pair_row in rows[argsort(-self.probabilities[rows], kind='stable')]:
+                yield query_str, self.vocabulary[self.pair_url_ids[pair_row]]
+
+    def write(self, filename):
+        with open(filename, encoding='utf-8', mode="w") as f:
+            for query, url in self.iter_records():
+                probability = self[query][url].probability
+                if url == '*' and probability == 0:
+                    continue
+                f.write('{} {} {}\n'.format(query, url, probability))
@@ -0,0 +1,208 @@
+# The opt-in and client databases are files of JSON [query, url] records, one per line.  Parsing them is
+# the dominant cost of loading a large database and the same files are parsed again on every run.  This
+# module compiles such a file once into a binary form: a table of the distinct query and url strings
+# followed by fixed width arrays holding, for each unique <q, u> pair, the string ids of its query and
+# url and its number of repetitions.  The compiled file is memory mapped when read, so the arrays are
+# used in place and only the string table is decoded.
+
+# layout, all integers little endian:
+#     header         magic, number of strings, number of unique pairs, size of the string data
+#     offsets        uint64 x (number of strings + 1), the start of each string in the string data
+#     counts         uint64 x number of unique pairs
+#     query_ids      uint32 x number of unique pairs
+#     url_ids        uint32 x number of unique pairs
+#     string data    the utf-8 encoded strings, end to end
+
+from collections import (
+    Counter
+)
+import struct
+
+from numpy import (
+    arange,
+    array,
+    dtype,
+    int64,
+    memmap,
+    repeat,
+    searchsorted,
+    uint8,
+)
+
+from blender.file_support import (
+    count_records,
+    find_line_ranges,
+    iter_json_records,
+    iter_record_chunks,
+)
+from blender.vocabulary import (
+    Vocabulary,
+)
+
+MAGIC = b'BLNDRBIN'
+HEADER = struct.Struct('<8sQQQ')
+
+OFFSET_TYPE = dtype('<u8')
+COUNT_TYPE = dtype('<u8')
+STRING_ID_TYPE = dtype('<u4')
+
+# the number of unique pairs handled at a time when expanding records or loading in chunks
+PAIR_CHUNK_SIZE = 10000
+
+
+def is_binary_records(file_name):
+    """True if the file begins with the signature of a compiled records file"""
+    with open(file_name, mode='rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def encode_strings(strs):
+    """the string table of a list of strings: an array of the offsets of each string in the utf-8
+    encoded string data, with a final offset at its end, and the string data itself"""
+    encoded_strs = [a_str.encode('utf-8') for a_str in strs]
+    offsets = array([0] + [len(encoded_str) for encoded_str in encoded_strs], dtype=OFFSET_TYPE).cumsum()
+    return offsets.astype(OFFSET_TYPE), b''.join(encoded_strs)
+
+
+def decode_strings(offsets, string_data):
+    """the list of strings of a string table made by encode_strings"""
+    offsets = offsets.tolist()
+    return [string_data[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+
+def compile_json_records(json_file_name, binary_file_name):
+    """convert a file of JSON [query, url] or weighted [query, url, count] records into the compiled
+    binary form"""
+    q_u_counter = Counter()
+    for records in iter_record_chunks(json_file_name):
+        count_records(q_u_counter, records)
+
+    # the strings are numbered in order of first appearance by a private Vocabulary
+    strings = Vocabulary()
+    query_ids = array([strings.find_id(q) for q, u in q_u_counter], dtype=STRING_ID_TYPE)
+    url_ids = array([strings.find_id(u) for q, u in q_u_counter], dtype=STRING_ID_TYPE)
+    counts = array(list(q_u_counter.values()), dtype=COUNT_TYPE)
+
+    offsets, string_data = encode_strings(strings.strs)
+    with open(binary_file_name, mode='wb') as f:
+        f.write(HEADER.pack(MAGIC, len(strings), len(counts), len(string_data)))
+        f.write(offsets.tobytes())
+        f.write(counts.tobytes())
+        f.write(query_ids.tobytes())
+        f.write(url_ids.tobytes())
+        f.write(string_data)
+
+
+class BinaryRecords(object):
+    """a read only, memory mapped view of a compiled records file"""
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.data = memmap(file_name, dtype=uint8, mode='r')
+        magic, number_of_strings, number_of_pairs, string_data_size = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('{} is not a compiled records file'.format(file_name))
+
+        position = HEADER.size
+        offsets = self._array(position, OFFSET_TYPE, number_of_strings + 1)
+        position += offsets.nbytes
+        self.counts = self._array(position, COUNT_TYPE, number_of_pairs)
+        position += self.counts.nbytes
+        self.query_ids = self._array(position, STRING_ID_TYPE, number_of_pairs)
+        position += self.query_ids.nbytes
+        self.url_ids = self._array(position, STRING_ID_TYPE, number_of_pairs)
+        position += self.url_ids.nbytes
+
+        self.strs = decode_strings(offsets, bytes(self.data[position:position + string_data_size]))
+
+    def _array(self, position, a_type, length):
+        return self.data[position:position + a_type.itemsize * length].view(a_type)
+
+    def close(self):
+        """unmap the file.  No arrays taken from this object may be in use."""
+        a_mmap = getattr(self.data, '_mmap', None)
+        self.data = self.counts = self.query_ids = self.url_ids = None
+        if a_mmap is not None:
+            a_mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        """the number of unique <q, u> pairs"""
+        return len(self.counts)
+
+    @property
+    def number_of_records(self):
+        return int(self.counts.sum())
+
+    def iter_counts(self, start=0, end=None):
+        """yield ((q, u), count) for the unique pairs with indexes in [start, end)"""
+        strs = self.strs
+        for query_id, url_id, count in zip(
+            self.query_ids[start:end].tolist(),
+            self.url_ids[start:end].tolist(),
+            self.counts[start:end].tolist()
+        ):
+            yield (strs[query_id], strs[url_id]), count
+
+    def q_u_counts(self):
+        """a mapping of (q, u) tuples to their number of repetitions suitable for 'add_counts'"""
+        return dict(self.iter_counts())
+
+    def iter_count_chunks(self, chunk_size=PAIR_CHUNK_SIZE):
+        """yield the mapping of 'q_u_counts' in pieces of at most 'chunk_size' unique pairs"""
+        for start in range(0, len(self), chunk_size):
+            yield dict(self.iter_counts(start, start + chunk_size))
+
+    def iter_records(self, start=0, end=None, chunk_size=PAIR_CHUNK_SIZE):
+        """yield [q, u] records as if read from the original JSON file, each unique pair repeated by
+        its count.  Only the records of the unique pairs with indexes in [start, end) are produced."""
+        strs = self.strs
+        end = len(self) if end is None else min(end, len(self))
+        for chunk_start in range(start, end, chunk_size):
+            chunk_end = min(chunk_start + chunk_size, end)
+            pair_indexes = repeat(
+                arange(chunk_start, chunk_end),
+                self.counts[chunk_start:chunk_end].astype(int64)
+            )
+            for query_id, url_id in zip(self.query_ids[pair_indexes].tolist(), self.url_ids[pair_indexes].tolist()):
+                yield [strs[query_id], strs[url_id]]
+
+    def find_ranges(self, number_of_ranges):
+        """divide the unique pairs into at most 'number_of_ranges' (start, end) index ranges holding
+        roughly equal numbers of records"""
+        cumulative_counts = self.counts.cumsum()
+        total = int(cumulative_counts[-1]) if len(cumulative_counts) else 0
+        boundaries = [0]
+        for i in range(1, number_of_ranges):
+            # a range ends after the pair whose records reach its share of the total
+            boundaries.append(int(searchsorted(cumulative_counts, total * i // number_of_ranges, side='right')))
+        boundaries.append(len(cumulative_counts))
+        return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+# the client database may be given either as JSON records or compiled.  These functions divide and read
+# either form, the ranges being byte ranges of a JSON file or ranges of the unique pairs of a compiled one
+
+def find_record_ranges(file_name, number_of_ranges):
+    if is_binary_records(file_name):
+        with BinaryRecords(file_name) as binary_records:
+            return binary_records.find_ranges(number_of_ranges)
+    return find_line_ranges(file_name, number_of_ranges)
+
+
+def iter_file_records(file_name, start=0, end=None):
+    if is_binary_records(file_name):
+        with BinaryRecords(file_name) as binary_records:
+            yield from binary_records.iter_records(start, end)
+    else:
+        yield from iter_json_records(file_name, start, end)
+
+
+if __name__ == "__main__":
+    import sys
+    compile_json_records(sys.argv[1], sys.argv[2])
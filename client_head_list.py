@@ -0,0 +1,133 @@
+# The head list is distributed to the clients so that each can run LocalAlg, Figure 6.  A client only
+# needs the <q, u> keys of the head list, the tau of each query and the number of <q, u> pairs from
+# which the tau of the whole head list is calculated.  The probabilities and variances stay behind.
+
+# The artifact written by HeadList.export_for_client_distribution is a numpy npz file holding:
+#     version                       the version of this layout
+#     number_of_query_url_pairs     of the head list
+#     tau                           of the head list
+#     query_string_offsets/_data    the string table of the queries, sorted
+#     taus                          the tau of each query, in the order of the queries
+#     url_offsets                   the start of the urls of each query, with a final entry at the end
+#     url_string_offsets/_data      the string table of the urls, sorted within each query
+
+from bisect import (
+    bisect_left
+)
+from collections import (
+    Mapping
+)
+
+from numpy import (
+    array,
+    float64,
+    frombuffer,
+    int64,
+    load,
+    savez_compressed,
+    uint8,
+)
+
+from blender.binary_records import (
+    decode_strings,
+    encode_strings,
+)
+from blender.in_memory_structures import (
+    ZERO_URL_STATS
+)
+
+CLIENT_HEAD_LIST_VERSION = 1
+
+
+def write_client_head_list(head_list, file_name):
+    """write the client artifact of a head list whose taus have been calculated"""
+    query_strs = sorted(head_list.keys())
+    url_strs = []
+    url_offsets = [0]
+    for query_str in query_strs:
+        url_strs.extend(sorted(head_list[query_str].keys()))
+        url_offsets.append(len(url_strs))
+    query_string_offsets, query_string_data = encode_strings(query_strs)
+    url_string_offsets, url_string_data = encode_strings(url_strs)
+    with open(file_name, mode='wb') as f:
+        savez_compressed(
+            f,
+            version=array(CLIENT_HEAD_LIST_VERSION, dtype=int64),
+            number_of_query_url_pairs=array(head_list.number_of_query_url_pairs, dtype=int64),
+            tau=array(head_list.tau, dtype=float64),
+            query_string_offsets=query_string_offsets,
+            query_string_data=frombuffer(query_string_data, dtype=uint8),
+            taus=array([head_list[query_str].tau for query_str in query_strs], dtype=float64),
+            url_offsets=array(url_offsets, dtype=int64),
+            url_string_offsets=url_string_offsets,
+            url_string_data=frombuffer(url_string_data, dtype=uint8),
+        )
+
+
+class ClientQuery(object):
+    """the urls of a query of a ClientHeadList, sorted, and the tau of the query.  The statistics of the
+    urls stay behind with the head list, so each url maps to ZERO_URL_STATS"""
+    __slots__ = ('url_strs', 'tau')
+
+    def __init__(self, url_strs, tau):
+        self.url_strs = url_strs
+        self.tau = tau
+
+    def keys(self):
+        return self.url_strs
+
+    def __iter__(self):
+        return iter(self.url_strs)
+
+    def __getitem__(self, url_str):
+        if url_str not in self:
+            raise KeyError(url_str)
+        return ZERO_URL_STATS
+
+    def __len__(self):
+        return len(self.url_strs)
+
+    def __contains__(self, url_str):
+        i = bisect_left(self.url_strs, url_str)
+        return i < len(self.url_strs) and self.url_strs[i] == url_str
+
+
+class ClientHeadList(Mapping):
+    """the head list as a client sees it, loaded from the artifact of
+    HeadList.export_for_client_distribution.  It offers what local_alg and the HeadListSampler use: the
+    queries, the urls and tau of each query, the tau of the head list and its number of <q, u> pairs."""
+    def __init__(self, file_name):
+        with load(file_name, allow_pickle=False) as artifact:
+            version = int(artifact['version'])
+            if version != CLIENT_HEAD_LIST_VERSION:
+                raise ValueError('{} is a version {} client head list, version {} was expected'.format(
+                    file_name,
+                    version,
+                    CLIENT_HEAD_LIST_VERSION
+                ))
+            self.number_of_query_url_pairs = int(artifact['number_of_query_url_pairs'])
+            self.tau = float(artifact['tau'])
+            query_strs = decode_strings(artifact['query_string_offsets'], artifact['query_string_data'].tobytes())
+            taus = artifact['taus'].tolist()
+            url_offsets = artifact['url_offsets'].tolist()
+            url_strs = decode_strings(artifact['url_string_offsets'], artifact['url_string_data'].tobytes())
+        self.queries = {
+            query_str: ClientQuery(tuple(url_strs[start:end]), tau)
+            for query_str, tau, start, end in zip(query_strs, taus, url_offsets, url_offsets[1:])
+        }
+
+    @property
+    def number_of_queries(self):
+        return len(self.queries)
+
+    def __getitem__(self, query_str):
+        return self.queries[query_str]
+
+    def __iter__(self):
+        return iter(self.queries)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def __contains__(self, query_str):
+        return query_str in self.queries
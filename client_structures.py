@@ -1,10 +1,92 @@
+from configman import (
+    Namespace
+)
+from numpy import (
+    array,
+    errstate,
+    float64,
+    where,
+)
+
 from blender.in_memory_structures import (
     URLStats,
+    SlottedURLStats,
     Query,
     QueryCollection,
 )
 
 
+# --------------------------------------------------------------------------------------------------------
+# Vectorized forms of Figure 5
+#     These evaluate the same expressions as ClientQuery and ClientURLStats, but for NumPy arrays holding
+#     the values for many queries or <q, u> pairs at once
+
+def estimate_query_probabilities(fraction_of_queries_in_other_mapping, number_of_query_url_pairs, head_list):
+    """from Figure 5, lines 11 - 13, returns arrays of the query probabilities and variances"""
+    ratio = (1.0 - head_list.tau) / (head_list.number_of_queries - 1.0)
+    # from Figure 5, line 12
+    probabilities = (
+        (fraction_of_queries_in_other_mapping - ratio)
+        /
+        (head_list.tau - ratio)
+    )
+    # from Figure 5, line 13
+    variances = (
+        (1.0 / pow(head_list.tau - ratio, 2))
+        *
+        (fraction_of_queries_in_other_mapping * (1 - fraction_of_queries_in_other_mapping))
+        /
+        (number_of_query_url_pairs - 1)
+    )
+    return probabilities, variances
+
+
+def estimate_url_probabilities(
+    r_c_q_u,
+    other_query_probability,
+    other_query_variance,
+    head_list_query_tau,
+    head_list_query_probability,
+    head_list_query_variance,
+    k,
+    number_of_query_url_pairs,
+    head_list
+):
+    """from Figure 5, lines 15 - 17, returns arrays of the <q, u> probabilities and variances.  The
+    arguments are arrays aligned by <q, u> pair.  'k' is the number of unique urls of the query in the
+    head_list."""
+    tau = head_list.tau
+    number_of_queries = head_list.number_of_queries
+    with errstate(divide='ignore', invalid='ignore'):
+        # from Figure 5, line 16
+        term_1 = r_c_q_u
+        term_2 = (1.0 - head_list_query_tau) * tau * other_query_probability / (k - 1)
+        term_3 = (1.0 - head_list_query_tau) * (1.0 - other_query_probability) / ((number_of_queries - 1) * k)
+        term_4 = tau * (head_list_query_tau - ((1 - head_list_query_tau) / (k - 1)))
+        probabilities = (term_1 - term_2 - term_3) / term_4
+
+        # from Figure 5, line 17
+        term_1 = r_c_q_u * (1.0 - r_c_q_u) / (number_of_query_url_pairs - 1.0)
+        term_2a = 2.0 * number_of_query_url_pairs / (number_of_query_url_pairs - 1.0)
+        term_2b = (1.0 - tau) / (number_of_queries - 1.0) / k
+        term_2c = (tau - tau * head_list_query_tau) / (k - 1.0)
+        term_2d = r_c_q_u * (number_of_queries - 2.0 + tau) / (number_of_queries * tau - 1.0)
+        term_2 = term_2a * (term_2b - term_2c) * term_2d
+        term_3a = (1.0 - tau) / (number_of_queries - 1.0) / k
+        term_3b = ((tau - tau * head_list_query_tau) / (k - 1.0)) ** 2
+        term_3 = (term_3a - term_3b) * other_query_variance
+        term_4 = 1.0 / tau ** 2 / (head_list_query_tau - ((1.0 - head_list_query_tau) / (k - 1.0))) ** 2
+        variances = (term_1 + term_2 + term_3) * term_4
+
+    # a head_list query with a single url, the <*, *> case, takes the query level values from the
+    # head_list to avoid a divide by zero.  See ClientURLStats.calculate_probability_relative_to
+    single_url = k == 1
+    return (
+        where(single_url, head_list_query_probability, probabilities),
+        where(single_url, head_list_query_variance, variances),
+    )
+
+
 # --------------------------------------------------------------------------------------------------------
 # 3rd Level Structures
 #     Contains a single url's stats
@@ -58,6 +140,14 @@ class ClientURLStats(URLStats):
         self.variance = (term_1 + term_2 + term_3) * term_4
 
 
+class SlottedClientURLStats(SlottedURLStats):
+    """ClientURLStats without a per instance __dict__ or configuration, see SlottedURLStats"""
+    __slots__ = ()
+
+    calculate_probability_relative_to = ClientURLStats.calculate_probability_relative_to
+    calculate_variance_relative_to = ClientURLStats.calculate_variance_relative_to
+
+
 # --------------------------------------------------------------------------------------------------------
 # 2nd Level Structures
 #     Contains a single query's stats and urls
@@ -117,6 +207,13 @@ class ClientQuery(Query):
 #        queries serve as the key
 #        2nd Level structures as the value
 class ClientQueryCollection(QueryCollection):
+    required_config = Namespace()
+    required_config.add_option(
+        "vectorized_estimation",
+        default=True,
+        doc="calculate the Figure 5 estimates with whole array expressions rather than with "
+            "method calls for each query and url"
+    )
 
     def calculate_probabilities(self, head_list):
         """This is from the Blender paper, Figure 4"""
@@ -124,7 +221,10 @@ class ClientQueryCollection(QueryCollection):
         assert head_list.number_of_queries >= self.number_of_queries
 
         # we want the client probabilities calcualated relative to itself.
-        self.calculate_probabilities_relative_to(self, head_list=head_list)
+        if self.config.vectorized_estimation:
+            self.calculate_probabilities_vectorized_relative_to(self, head_list=head_list)
+        else:
+            self.calculate_probabilities_relative_to(self, head_list=head_list)
 
     def calculate_probabilities_relative_to(self, other_query_url_mapping, head_list=None):
         """This is from the Blender paper, Figure 4"""
@@ -135,3 +235,64 @@ class ClientQueryCollection(QueryCollection):
                 query_str=query_str,
                 head_list=head_list
             )
+
+    def calculate_probabilities_vectorized_relative_to(self, other_query_url_mapping, head_list=None):
+        """the same as calculate_probabilities_relative_to, but the values needed by Figure 5 are gathered
+        into aligned arrays and all the estimates are calculated with whole array expressions"""
+        number_of_pairs = other_query_url_mapping.number_of_query_url_pairs
+        query_strs = list(self.keys())
+
+        # from Figure 5, lines 11 - 13 for all the queries at once
+        fraction_of_queries_in_other_mapping = array(
+            [other_query_url_mapping[query_str].number_of_urls for query_str in query_strs],
+            dtype=float64
+        ) / number_of_pairs
+        query_probabilities, query_variances = estimate_query_probabilities(
+            fraction_of_queries_in_other_mapping,
+            number_of_pairs,
+            head_list
+        )
+        for query_str, probability, variance in zip(query_strs, query_probabilities, query_variances):
+            self[query_str].probability = float(probability)
+            self[query_str].variance = float(variance)
+
+        # from Figure 5, line 14 - gather the values for every <q, u> of the head_list
+        q_u_pairs = []
+        repetitions = []
+        other_query_probability = []
+        other_query_variance = []
+        head_list_query_tau = []
+        head_list_query_probability = []
+        head_list_query_variance = []
+        k = []
+        for query_str in query_strs:
+            if query_str not in head_list:
+                continue
+            head_list_query = head_list[query_str]
+            other_query = other_query_url_mapping[query_str]
+            for url_str in head_list_query:
+                q_u_pairs.append((query_str, url_str))
+                repetitions.append(other_query[url_str].number_of_repetitions)
+                other_query_probability.append(other_query.probability)
+                other_query_variance.append(other_query.variance)
+                head_list_query_tau.append(head_list_query.tau)
+                head_list_query_probability.append(head_list_query.probability)
+                head_list_query_variance.append(head_list_query.variance)
+                k.append(head_list_query.number_of_unique_urls)
+
+        # from Figure 5, lines 15 - 17
+        probabilities, variances = estimate_url_probabilities(
+            array(repetitions, dtype=float64) / number_of_pairs,
+            array(other_query_probability, dtype=float64),
+            array(other_query_variance, dtype=float64),
+            array(head_list_query_tau, dtype=float64),
+            array(head_list_query_probability, dtype=float64),
+            array(head_list_query_variance, dtype=float64),
+            array(k, dtype=float64),
+            number_of_pairs,
+            head_list
+        )
+        for (query_str, url_str), probability, variance in zip(q_u_pairs, probabilities, variances):
+            url_stats = self[query_str][url_str]
+            url_stats.probability = float(probability)
+            url_stats.variance = float(variance)
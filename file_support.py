@@ -0,0 +1,153 @@
+# The input databases are files of JSON records, one per line.  These functions read those files in
+# chunks and divide them into byte ranges that start and end on line boundaries, so that separate
+# processes can each read a share of the same file.  The files may also be gzip, bz2 or xz compressed,
+# in which case they are decompressed as they are read.
+
+# A record is either a single [query, url] pair or, from sources that have already aggregated their
+# logs, a weighted [query, url, count] record standing for 'count' repetitions of the pair.
+
+from collections import (
+    Counter
+)
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+
+# the approximate number of characters read and parsed at a time by QueryCollection.bulk_load
+BULK_LOAD_CHUNK_SIZE = 1 << 24
+
+# the size of the buffered reads of the decompressed stream of a compressed file
+DECOMPRESSION_BUFFER_SIZE = 1 << 20
+
+# the leading bytes and the file extensions of the compressed forms, with the function to open each
+COMPRESSIONS = (
+    (b'\x1f\x8b', ('.gz', '.gzip'), gzip.open),
+    (b'BZh', ('.bz2',), bz2.open),
+    (b'\xfd7zXZ\x00', ('.xz', '.lzma'), lzma.open),
+)
+
+
+def find_decompressor(file_name):
+    """the function that opens a compressed file, recognized by its leading bytes or failing that by its
+    extension, or None for an uncompressed file"""
+    with open(file_name, mode='rb') as f:
+        leading_bytes = f.read(8)
+    for magic, extensions, open_function in COMPRESSIONS:
+        if leading_bytes[:len(magic)] == magic:
+            return open_function
+    for magic, extensions, open_function in COMPRESSIONS:
+        if file_name.endswith(extensions):
+            return open_function
+    return None
+
+
+def open_records(file_name, encoding=None):
+    """open a file of records for reading, as bytes or, given an encoding, as text.  A compressed file
+    is decompressed as it is read"""
+    decompressor = find_decompressor(file_name)
+    if decompressor is None:
+        if encoding is None:
+            return open(file_name, mode='rb')
+        return open(file_name, encoding=encoding)
+    a_file = io.BufferedReader(decompressor(file_name, mode='rb'), buffer_size=DECOMPRESSION_BUFFER_SIZE)
+    if encoding is None:
+        return a_file
+    return io.TextIOWrapper(a_file, encoding=encoding)
+
+
+def iter_record_chunks(file_name, chunk_size=BULK_LOAD_CHUNK_SIZE):
+    """yield lists of the JSON records of a file, reading roughly 'chunk_size' characters of lines at a
+    time and parsing each chunk with a single call to json.loads"""
+    with open_records(file_name, encoding='utf-8') as data_source:
+        while True:
+            record_strs = data_source.readlines(chunk_size)
+            if not record_strs:
+                break
+            yield json.loads(
+                '[{}]'.format(','.join(a_record_str for a_record_str in record_strs if a_record_str.strip()))
+            )
+
+
+def count_records(q_u_counter, records):
+    """add [q, u] and weighted [q, u, count] records to a Counter keyed by (q, u) tuples.  Returns the
+    number of <q, u> pairs added, counting each weighted record by its weight"""
+    q_u_pairs = [tuple(record) for record in records if len(record) == 2]
+    q_u_counter.update(q_u_pairs)
+    number_of_pairs = len(q_u_pairs)
+    for query_str, url_str, count in (record for record in records if len(record) == 3):
+        q_u_counter[(query_str, url_str)] += count
+        number_of_pairs += count
+    return number_of_pairs
+
+
+def count_record_range(file_name, start=0, end=None, chunk_size=BULK_LOAD_CHUNK_SIZE, progress=None):
+    """a Counter of the <q, u> pairs of the records on the lines of a file that begin within the byte
+    range [start, end).  Lines are read and parsed roughly 'chunk_size' bytes at a time, and the number
+    of pairs of each chunk is added to 'progress', if given.  This is the partial count table returned
+    by each worker of QueryCollection.parallel_load."""
+    q_u_counter = Counter()
+    with open_records(file_name) as data_source:
+        if start:
+            data_source.seek(start)
+        position = start
+        while end is None or position < end:
+            record_lines = data_source.readlines(chunk_size)
+            if not record_lines:
+                break
+            chunk_end = position + sum(len(record_line) for record_line in record_lines)
+            if end is not None and chunk_end > end:
+                # drop the lines that begin at or beyond the end of the range
+                number_of_lines = 0
+                while position < end:
+                    position += len(record_lines[number_of_lines])
+                    number_of_lines += 1
+                del record_lines[number_of_lines:]
+            position = chunk_end
+            number_of_pairs = count_records(
+                q_u_counter,
+                json.loads(b'[' + b','.join(record_line for record_line in record_lines if record_line.strip()) + b']')
+            )
+            if progress is not None:
+                progress.add(number_of_pairs)
+    return q_u_counter
+
+
+def find_line_ranges(file_name, number_of_ranges):
+    """divide a file into at most 'number_of_ranges' (start, end) byte ranges of roughly equal size.
+    Every range begins at the start of a line and ends just after a newline or at the end of the file.
+    A compressed file cannot be divided without decompressing it, so it is a single range (0, None)"""
+    if find_decompressor(file_name) is not None:
+        return [(0, None)]
+    file_size = os.path.getsize(file_name)
+    boundaries = [0]
+    with open(file_name, mode='rb') as f:
+        for i in range(1, number_of_ranges):
+            f.seek(max(file_size * i // number_of_ranges - 1, boundaries[-1]))
+            # finish the line that the seek landed in, the next range starts after it
+            f.readline()
+            boundaries.append(min(f.tell(), file_size))
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def iter_json_records(file_name, start=0, end=None):
+    """yield the JSON records from the lines of a file that begin within the byte range [start, end).
+    A weighted [q, u, count] record is yielded as 'count' [q, u] records"""
+    with open_records(file_name) as f:
+        if start:
+            f.seek(start)
+        position = start
+        for record_bytes in f:
+            if end is not None and position >= end:
+                break
+            position += len(record_bytes)
+            if record_bytes.strip():
+                record = json.loads(record_bytes.decode('utf-8'))
+                if len(record) == 3:
+                    for i in range(record[2]):
+                        yield record[:2]
+                else:
+                    yield record
@@ -1,5 +1,16 @@
+from configman import (
+    Namespace
+)
+from numpy import (
+    all as all_of,
+    array,
+    errstate,
+    float64,
+)
+
 from blender.in_memory_structures import (
     URLStats,
+    SlottedURLStats,
     Query,
     QueryCollection
 )
@@ -8,6 +19,23 @@ from blender.sorted_dict_of_lists import (
 )
 
 
+# --------------------------------------------------------------------------------------------------------
+# Vectorized form of Figure 7
+#     This evaluates the same expression as FinalURLStats, but for NumPy arrays holding the values for
+#     many <q, u> pairs at once
+
+def blend_url_probabilities(head_list_probability, head_list_variance, client_probability, client_variance):
+    """from Figure 7, line 3, returns arrays of omega and the blended probabilities"""
+    total_variance = head_list_variance + client_variance
+    # like the scalar FinalURLStats, refuse to blend a pair whose variances are both 0 rather than
+    # giving it a probability of NaN
+    if not all_of(total_variance):
+        raise ZeroDivisionError('the head list and client variances of a <q, u> pair are both 0')
+    with errstate(divide='raise', invalid='raise'):
+        omega = client_variance / total_variance
+    return omega, omega * head_list_probability + (1 - omega) * client_probability
+
+
 # --------------------------------------------------------------------------------------------------------
 # 3rd Level Structures
 #     Contains a single url's stats
@@ -26,6 +54,17 @@ class FinalURLStats(URLStats):
         self.probability = self.omega * head_list_url.probability + (1 - self.omega) * client_url.probability
 
 
+class SlottedFinalURLStats(SlottedURLStats):
+    """FinalURLStats without a per instance __dict__ or configuration, see SlottedURLStats"""
+    __slots__ = ('omega',)
+
+    def __init__(self, config=None, count=0):
+        super(SlottedFinalURLStats, self).__init__(config, count)
+        self.omega = 0.0
+
+    calculate_probability_relative_to = FinalURLStats.calculate_probability_relative_to
+
+
 # --------------------------------------------------------------------------------------------------------
 # 2nd Level Structures
 #     Contains a single query's stats and urls
@@ -54,12 +93,53 @@ class FinalQuery(Query):
 #        queries serve as the key
 #        2nd Level structures as the value
 class FinalQueryCollection(QueryCollection):
+    required_config = Namespace()
+    required_config.add_option(
+        "vectorized_blending",
+        default=True,
+        doc="calculate the Figure 7 blend with whole array expressions rather than with method "
+            "calls for each url"
+    )
 
     def calculate_probability_relative_to(self, client_probabilities, optin_probabilities):
+        if self.config.vectorized_blending:
+            self.calculate_probability_vectorized_relative_to(client_probabilities, optin_probabilities)
+            return
         for query_str in optin_probabilities.keys():
             a_query = self[query_str]
             a_query.calculate_probability_relative_to(client_probabilities, optin_probabilities, query_str)
 
+    def calculate_probability_vectorized_relative_to(self, client_probabilities, optin_probabilities):
+        """the same as calculate_probability_relative_to, but the head_list and client values are
+        gathered into aligned arrays and blended in one pass.  Pairs that the clients never reported
+        blend with a probability and variance of zero."""
+        q_u_pairs = list(optin_probabilities.iter_records())
+        head_list_values = []
+        client_values = []
+        for query_str, url_str in q_u_pairs:
+            head_list_url = optin_probabilities[query_str][url_str]
+            head_list_values.append((head_list_url.probability, head_list_url.variance))
+            if query_str in client_probabilities and url_str in client_probabilities[query_str]:
+                client_url = client_probabilities[query_str][url_str]
+                client_values.append((client_url.probability, client_url.variance))
+            else:
+                client_values.append((0.0, 0.0))
+        head_list_values = array(head_list_values, dtype=float64).reshape(-1, 2)
+        client_values = array(client_values, dtype=float64).reshape(-1, 2)
+
+        omegas, probabilities = blend_url_probabilities(
+            head_list_values[:, 0],
+            head_list_values[:, 1],
+            client_values[:, 0],
+            client_values[:, 1],
+        )
+        for (query_str, url_str), omega, probability in zip(q_u_pairs, omegas, probabilities):
+            a_query = self[query_str]
+            a_url = a_query[url_str]
+            a_url.omega = float(omega)
+            a_url.probability = float(probability)
+            a_query.probability_sorted_index[a_url.probability].append(url_str)
+
     def iter_records(self):
         for query_str in self.keys():
             a_query = self[query_str]
@@ -3,10 +3,31 @@ from blender.sorted_dict_of_lists import (
     SortedDictOfLists
 )
 
+from heapq import (
+    heappush,
+    heapreplace,
+    nlargest
+)
 from math import (
     log as ln,
     exp
 )
+from sys import (
+    intern
+)
+from numpy import (
+    arange,
+    array,
+    float64,
+    frombuffer,
+    fromiter,
+    int64,
+    load,
+    nonzero,
+    repeat,
+    savez,
+    uint8,
+)
 from numpy.random import (
     laplace
 )
@@ -15,10 +36,20 @@ from configman import (
     Namespace
 )
 
+from blender.binary_records import (
+    decode_strings,
+    encode_strings,
+)
+from blender.client_head_list import (
+    write_client_head_list
+)
 from blender.in_memory_structures import (
     Query,
     QueryCollection
 )
+from blender.vocabulary import (
+    Vocabulary
+)
 
 
 # --------------------------------------------------------------------------------------------------------
@@ -36,6 +67,8 @@ from blender.in_memory_structures import (
 #         3rd Level structures as the value
 
 class HeadListQuery(Query):
+    frozen_attributes = Query.frozen_attributes + ('tau', 'kappa_q')
+
     def __init__(self, config):
         super(HeadListQuery, self).__init__(config)
         self.tau = 0.0
@@ -65,6 +98,7 @@ class HeadListQuery(Query):
                 other_query_url_mapping,
                 query_str=query_str,
                 url_str=url,
+                config=self.config,
             )
             self.update_probability(self[url])
             # the original algorthim in Figure 4 calculated o_2 (sigma/variance) at this point.
@@ -82,14 +116,59 @@ class HeadListQuery(Query):
 #        queries serve as the key
 #        2nd Level structures as the value
 
+SNAPSHOT_VERSION = 1
+
+# the arrays of a snapshot that read_snapshot returns as they are, a row per query then a row per <q, u>
+SNAPSHOT_QUERY_COLUMNS = (
+    'numbers_of_urls', 'query_probabilities', 'query_variances', 'taus', 'kappa_qs', 'numbers_of_unique_urls',
+)
+SNAPSHOT_URL_COLUMNS = (
+    'numbers_of_repetitions', 'url_probabilities', 'url_variances',
+)
+
+
+def read_snapshot(file_name):
+    """the contents of a snapshot written by HeadList.save_snapshot: the (tau, k, kappa) of the head_list,
+    its number of <q, u> pairs and a dict of its columns.  The arrays named in SNAPSHOT_QUERY_COLUMNS and
+    the list 'query_strs' have a row per query.  The arrays named in SNAPSHOT_URL_COLUMNS, the list
+    'url_strs' and the array 'url_query_numbers', the row of the query of each url, have a row per
+    <q, u> pair, grouped by query."""
+    with load(file_name, allow_pickle=False) as snapshot:
+        version = int(snapshot['version']) if 'version' in snapshot.files else 0
+        if version != SNAPSHOT_VERSION:
+            raise ValueError('{} is a version {} head list snapshot, version {} was expected'.format(
+                file_name,
+                version,
+                SNAPSHOT_VERSION
+            ))
+        strs = decode_strings(snapshot['string_offsets'], snapshot['string_data'].tobytes())
+        tau, k, kappa = snapshot['head_list_values'].tolist()
+        number_of_query_url_pairs = int(snapshot['number_of_query_url_pairs'])
+        columns = {name: snapshot[name] for name in SNAPSHOT_QUERY_COLUMNS + SNAPSHOT_URL_COLUMNS}
+        columns['query_strs'] = [strs[query_id] for query_id in snapshot['query_ids'].tolist()]
+        columns['url_strs'] = [strs[url_id] for url_id in snapshot['url_ids'].tolist()]
+    columns['url_query_numbers'] = repeat(arange(len(columns['query_strs'])), columns['numbers_of_unique_urls'])
+    return (tau, int(k), int(kappa)), number_of_query_url_pairs, columns
+
+
 class HeadList(QueryCollection):
     """This class add the Blender algorithmic parts to the highest level of Mapping of Mappings"""
+    frozen_attributes = QueryCollection.frozen_attributes + ('tau',)
+
     required_config = Namespace()
     required_config.add_option(
         "m",
         default=1000,
         doc="maximum size of the final headlist",
     )
+    required_config.add_option(
+        "streaming_top_m",
+        default=False,
+        doc="keep only the m most probable queries in a bounded heap while calculating the probabilities "
+            "rather than indexing every query by probability.  The probability_sorted_index is then empty "
+            "until subsume_entries_beyond_max_size fills it with the retained queries, so it is off unless "
+            "asked for",
+    )
     required_config.add_aggregation(
         # from Figure #3, line 6 renamed as simply b since the originals from the paper
         # bs and bt have the same definition
@@ -115,54 +194,87 @@ class HeadList(QueryCollection):
         # will be those with the highest value of some statistic. Rather than sort at the end, this keeps
         # an index based on the statistic.
         self.probability_sorted_index = SortedDictOfLists()
+        # when streaming_top_m is set, the alternative to the index: a min-heap of the m most probable
+        # queries as (probability, -order of addition, query) tuples
+        self.top_m_heap = None
         self.tau = 0.0
         self.k = 0
+        self.kappa = 0
 
     def create_headlist(self, optin_database_s):
         # Figure 3, line 6-7 were moved to configuration of this object
         # from Figure 3, CreateHeadList, line 7
         assert self.config.tau >= 1.0
-        for query_str, url_str in optin_database_s.iter_records():
-            y = laplace(0.0, self.config.b)
-            if optin_database_s[query_str][url_str].number_of_repetitions + y > self.config.tau:
-                self.add((query_str, url_str))
+        # rather than drawing the noise one <q, u> pair at a time, the repetition counts are gathered
+        # into an array so that all the noise can be drawn in one call and thresholded as a whole.  The
+        # keys and the counts are collected in one walk over the queries and their url stats.
+        q_u_pairs = []
+
+        def iter_repetitions():
+            for query_str, a_query in optin_database_s.items():
+                for url_str, url_stats in a_query.items():
+                    q_u_pairs.append((query_str, url_str))
+                    yield url_stats.number_of_repetitions
+
+        repetitions = fromiter(iter_repetitions(), dtype=float64)
+        y = laplace(0.0, self.config.b, size=len(q_u_pairs))
+        for i in nonzero(repetitions + y > self.config.tau)[0]:
+            self.add(q_u_pairs[i])
         self.add(('*', '*'))
 
     def calculate_probabilities_relative_to(self, other_query_url_mapping, head_list=None):
         # Figure 4: lines 10 - 12
-        for query_str in self.keys():
+        top_m_heap = [] if self.config.streaming_top_m else None
+        for order, query_str in enumerate(self.keys()):
             self[query_str].calculate_probability_relative_to(
                 other_query_url_mapping,
                 query_str=query_str,
                 head_list=head_list
             )
-            if query_str != '*':
+            if query_str == '*':
                 # we don't need to index the <*, *> case
+                continue
+            if top_m_heap is None:
                 self.probability_sorted_index[self[query_str].probability].append(query_str)
+                continue
+            # the heap root is the least probable query retained so far.  Among equal probabilities,
+            # the query added last is the least, so ties go to the query added first like the index
+            entry = (self[query_str].probability, -order, query_str)
+            if len(top_m_heap) < self.config.m:
+                heappush(top_m_heap, entry)
+            elif top_m_heap and entry > top_m_heap[0]:
+                heapreplace(top_m_heap, entry)
+        self.top_m_heap = top_m_heap
 
     def subsume_entries_beyond_max_size(self):
         # Figure 4: line 14
-        to_be_deleted_list = []
         if '*' not in self:
             self.add(('*', '*'))
-        for i, (probability, query_str) in enumerate(self.probability_sorted_index.iter_records()):
-            if i < self.config.m:
+        # select the m queries with the highest probability with a bounded heap rather than walking the
+        # whole probability index.  Like the index, ties go to the query that was added first.
+        candidates = [query_str for query_str in self.keys() if query_str != '*']
+        if self.top_m_heap is None:
+            retained = nlargest(self.config.m, candidates, key=lambda query_str: self[query_str].probability)
+        else:
+            # the selection was already made while the probabilities were calculated
+            retained = [query_str for probability, order, query_str in sorted(self.top_m_heap, reverse=True)]
+            self.top_m_heap = None
+        retained_set = set(retained)
+
+        star_query = self['*']
+        for query_str in candidates:
+            if query_str in retained_set:
                 continue
             the_query = self[query_str]
             for url_str in the_query.keys():
-                self.probability_sorted_index[the_query.probability].remove(query_str)
-                self['*'].subsume(the_query, url_str)
-                self.probability_sorted_index[the_query.probability].append(query_str)
-                # we need to remove the <q, u> pair but cannot do so while the collection is
-                # in iteration.  We keep a list of <q, u> pairs to remove and delete them after
-                # iteration is complete
-                to_be_deleted_list.append((query_str, url_str))
-
-        for query_str, url_str in to_be_deleted_list:
-            self.number_of_query_url_pairs -= self[query_str][url_str].number_of_repetitions
-            del self[query_str][url_str]
-            if not len(self[query_str]):
-                del self[query_str]
+                star_query.subsume(the_query, url_str)
+                self.number_of_query_url_pairs -= the_query[url_str].number_of_repetitions
+            # all of the urls of the query are gone, so the whole query is removed at once
+            del self[query_str]
+
+        self.probability_sorted_index = SortedDictOfLists()
+        for query_str in retained:
+            self.probability_sorted_index[self[query_str].probability].append(query_str)
 
     def calculate_variance_relative_to(self, other_query_url_mapping):
         """This is part of the algorithm from the Blender paper, Figure 4"""
@@ -172,6 +284,7 @@ class HeadList(QueryCollection):
                 other_query_url_mapping,
                 query_str=query_str,
                 url_str=url_str,
+                config=self.config,
             )
 
     def calculate_tau(self):
@@ -190,14 +303,90 @@ class HeadList(QueryCollection):
         print('{}tau={}'.format(' ' * indent, self.tau))
         super(HeadList, self).print(indent)
 
-    def export_for_client_distribution(self):
-        # this ought to produce a json file without the probabilites and variance data
+    def save_snapshot(self, file_name):
+        """write the head_list in a binary form that load_snapshot restores far faster than jsonpickle.
+        The file holds a table of the query and url strings and, in numpy's uncompressed npz format, a
+        version number and one array per statistic of the queries and of the <q, u> pairs.  The head_list is read through the mapping
+        interface, so ArrayHeadList and SQLiteHeadList share this method."""
+        strings = Vocabulary()
+        query_ids, numbers_of_urls, query_probabilities, query_variances, taus, kappa_qs = [], [], [], [], [], []
+        numbers_of_unique_urls = []
+        url_ids, numbers_of_repetitions, url_probabilities, url_variances = [], [], [], []
         for query_str in self.keys():
-            pass
+            a_query = self[query_str]
+            query_ids.append(strings.find_id(query_str))
+            numbers_of_urls.append(a_query.number_of_urls)
+            query_probabilities.append(a_query.probability)
+            query_variances.append(a_query.variance)
+            taus.append(a_query.tau)
+            kappa_qs.append(a_query.kappa_q)
+            url_strs = list(a_query.keys())
+            numbers_of_unique_urls.append(len(url_strs))
+            for url_str in url_strs:
+                url_stats = a_query[url_str]
+                url_ids.append(strings.find_id(url_str))
+                numbers_of_repetitions.append(url_stats.number_of_repetitions)
+                url_probabilities.append(url_stats.probability)
+                url_variances.append(url_stats.variance)
+        string_offsets, string_data = encode_strings(strings.strs)
+        with open(file_name, mode='wb') as f:
+            savez(
+                f,
+                version=array(SNAPSHOT_VERSION, dtype=int64),
+                string_offsets=string_offsets,
+                string_data=frombuffer(string_data, dtype=uint8),
+                head_list_values=array([self.tau, self.k, self.kappa], dtype=float64),
+                number_of_query_url_pairs=array(self.number_of_query_url_pairs, dtype=int64),
+                query_ids=array(query_ids, dtype=int64),
+                numbers_of_urls=array(numbers_of_urls, dtype=int64),
+                query_probabilities=array(query_probabilities, dtype=float64),
+                query_variances=array(query_variances, dtype=float64),
+                taus=array(taus, dtype=float64),
+                kappa_qs=array(kappa_qs, dtype=int64),
+                numbers_of_unique_urls=array(numbers_of_unique_urls, dtype=int64),
+                url_ids=array(url_ids, dtype=int64),
+                numbers_of_repetitions=array(numbers_of_repetitions, dtype=int64),
+                url_probabilities=array(url_probabilities, dtype=float64),
+                url_variances=array(url_variances, dtype=float64),
+            )
+
+    def load_snapshot(self, file_name):
+        """restore a head_list written by save_snapshot into this empty head_list"""
+        (self.tau, self.k, self.kappa), self.number_of_query_url_pairs, columns = read_snapshot(file_name)
+        url_stats_class = self.config.url_stats_class
+        queries = [self.queries[intern(query_str)] for query_str in columns['query_strs']]
+        for a_query, number_of_urls, probability, variance, tau, kappa_q in zip(
+            queries,
+            *(columns[name].tolist() for name in SNAPSHOT_QUERY_COLUMNS[:-1])
+        ):
+            a_query.number_of_urls = number_of_urls
+            a_query.probability = probability
+            a_query.variance = variance
+            a_query.tau = tau
+            a_query.kappa_q = kappa_q
+        for query_number, url_str, number_of_repetitions, url_probability, url_variance in zip(
+            columns['url_query_numbers'].tolist(),
+            columns['url_strs'],
+            *(columns[name].tolist() for name in SNAPSHOT_URL_COLUMNS)
+        ):
+            url_stats = url_stats_class(self.config, number_of_repetitions)
+            url_stats.probability = url_probability
+            url_stats.variance = url_variance
+            queries[query_number].urls[intern(url_str)] = url_stats
+        self.probability_sorted_index = SortedDictOfLists()
+        for query_str, a_query in self.queries.items():
+            if query_str != '*':
+                self.probability_sorted_index[a_query.probability].append(query_str)
+
+    def export_for_client_distribution(self, file_name):
+        """write the compact artifact that clients load as a blender.client_head_list.ClientHeadList:
+        the keys and taus of this head list without the probabilities and variances"""
+        write_client_head_list(self, file_name)
 
     def __getstate__(self, key_list=None):
         # for use by jsonpickle
         if key_list is None:
             key_list = list()
         key_list.append('probability_sorted_index')
+        key_list.append('top_m_heap')
         return super(HeadList, self).__getstate__(key_list)
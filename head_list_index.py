@@ -0,0 +1,143 @@
+# The clients look up every one of their <q, u> pairs in the head list.  Rather than the nested
+# dictionaries of a HeadList, with a string object, a hash table entry and a url stats object for each
+# key, the HeadListIndex keeps the keys in two string tables: the queries, and the urls of each query in
+# turn.  A string table is one bytes object of utf-8 encoded strings and a compact array of their
+# offsets.  Lookups are binary searches of sorted permutations of the tables.  Since the order of utf-8
+# encoded bytes is the order of the code points, comparing bytes compares the strings.
+
+# The ids of the queries and of the <q, u> pairs follow the order of the head list, so the pairs of a
+# query are consecutive and begin at its 'pair_offsets' entry.
+
+# The tables may also be memoryviews, for example of shared memory, so slices of the string data are
+# taken as bytes before they are compared or decoded.
+
+from array import (
+    array
+)
+
+
+def _string_table(encoded_strs):
+    offsets = array('q', [0])
+    for encoded_str in encoded_strs:
+        offsets.append(offsets[-1] + len(encoded_str))
+    return offsets, b''.join(encoded_strs)
+
+
+class HeadListIndex(object):
+    """a read only, compact index of the <q, u> keys of a head list"""
+    # the tables that hold the whole of an index
+    TABLES = ('query_offsets', 'query_data', 'query_order', 'pair_offsets', 'url_offsets', 'url_data', 'url_order')
+
+    def __init__(self, head_list):
+        encoded_query_strs = []
+        encoded_url_strs = []
+        self.pair_offsets = array('q', [0])
+        self.url_order = array('q')
+        for query_str in head_list.keys():
+            encoded_query_strs.append(query_str.encode('utf-8'))
+            first_pair_id = len(encoded_url_strs)
+            encoded_url_strs.extend(url_str.encode('utf-8') for url_str in head_list[query_str].keys())
+            self.pair_offsets.append(len(encoded_url_strs))
+            # the pairs of the query sorted by url
+            self.url_order.extend(
+                sorted(range(first_pair_id, len(encoded_url_strs)), key=encoded_url_strs.__getitem__)
+            )
+        self.query_offsets, self.query_data = _string_table(encoded_query_strs)
+        self.url_offsets, self.url_data = _string_table(encoded_url_strs)
+        self.query_order = array('q', sorted(range(len(encoded_query_strs)), key=encoded_query_strs.__getitem__))
+        # where clients report the queries that are not in the head list
+        self.star_query_id = self.find_query_id('*')
+
+    @classmethod
+    def from_tables(cls, **tables):
+        """an index over the TABLES of another, such as memoryviews of a block of shared memory"""
+        index = cls.__new__(cls)
+        for name in cls.TABLES:
+            setattr(index, name, tables[name])
+        index.star_query_id = index.find_query_id('*')
+        return index
+
+    @property
+    def number_of_queries(self):
+        return len(self.query_order)
+
+    @property
+    def number_of_pairs(self):
+        return len(self.url_order)
+
+    @staticmethod
+    def _search(data, offsets, order, lo, hi, encoded_str):
+        """the id in order[lo:hi] of the string equal to encoded_str, or -1"""
+        end = hi
+        while lo < hi:
+            middle = (lo + hi) // 2
+            an_id = order[middle]
+            if bytes(data[offsets[an_id]:offsets[an_id + 1]]) < encoded_str:
+                lo = middle + 1
+            else:
+                hi = middle
+        if lo < end:
+            an_id = order[lo]
+            if bytes(data[offsets[an_id]:offsets[an_id + 1]]) == encoded_str:
+                return an_id
+        return -1
+
+    def find_query_id(self, query_str):
+        """the id of a query, or -1 if it is not in the head list"""
+        return self._search(
+            self.query_data,
+            self.query_offsets,
+            self.query_order,
+            0,
+            len(self.query_order),
+            query_str.encode('utf-8')
+        )
+
+    def find_url_pair_id(self, query_id, url_str):
+        """the id of the pair of a url with the query of 'query_id', or -1 if it is not in the head list"""
+        return self._search(
+            self.url_data,
+            self.url_offsets,
+            self.url_order,
+            self.pair_offsets[query_id],
+            self.pair_offsets[query_id + 1],
+            url_str.encode('utf-8')
+        )
+
+    def find_report_ids(self, query_str, url_str):
+        """the query id and pair id of the head list <q, u> pair that a client reports for a <q, u> pair.
+        Queries and urls not in the head list are reported as '*'"""
+        query_id = self.find_query_id(query_str)
+        if query_id < 0:
+            query_id = self.star_query_id
+        pair_id = self.find_url_pair_id(query_id, url_str)
+        if pair_id < 0:
+            pair_id = self.find_url_pair_id(query_id, '*')
+        if query_id < 0 or pair_id < 0:
+            raise KeyError((query_str, url_str))
+        return query_id, pair_id
+
+    def find_pair_id(self, query_str, url_str):
+        """the id of the head list <q, u> pair that a client reports for a <q, u> pair"""
+        return self.find_report_ids(query_str, url_str)[1]
+
+    def query_str(self, query_id):
+        return bytes(self.query_data[self.query_offsets[query_id]:self.query_offsets[query_id + 1]]).decode('utf-8')
+
+    def url_str(self, pair_id):
+        return bytes(self.url_data[self.url_offsets[pair_id]:self.url_offsets[pair_id + 1]]).decode('utf-8')
+
+    def pair_query_id(self, pair_id):
+        """the id of the query of a pair"""
+        # the last query whose pairs begin at or before the pair
+        lo, hi = 0, len(self.query_order)
+        while lo < hi:
+            middle = (lo + hi) // 2
+            if self.pair_offsets[middle + 1] <= pair_id:
+                lo = middle + 1
+            else:
+                hi = middle
+        return lo
+
+    def q_u_pair(self, pair_id):
+        return self.query_str(self.pair_query_id(pair_id)), self.url_str(pair_id)
@@ -15,29 +15,60 @@
 
 from collections import (
     defaultdict,
+    Counter,
+    Mapping,
     MutableMapping
 )
 from functools import partial
+from multiprocessing import (
+    Pool
+)
 from configman import (
     Namespace,
     RequiredConfig,
     class_converter,
 )
 
+from numpy import (
+    ndarray
+)
 from numpy.random import (
     laplace
 )
 
 import json
+from sys import (
+    intern
+)
+
+from blender.file_support import (
+    BULK_LOAD_CHUNK_SIZE,
+    count_record_range,
+    count_records,
+    find_line_ranges,
+    iter_record_chunks,
+    open_records,
+)
+from blender.binary_records import (
+    BinaryRecords
+)
 
 
 class JsonPickleBase(object):
+    # no slots of its own, so that subclasses may do without a per instance __dict__
+    __slots__ = ()
+
     # for use by jsonpickle
     def __getstate__(self, key_list=None):
         if key_list is None:
             key_list = list()
         key_list.append('config')
-        state = self.__dict__.copy()
+        state = {}
+        for a_class in type(self).__mro__:
+            for key in a_class.__dict__.get('__slots__', ()):
+                if hasattr(self, key):
+                    state[key] = getattr(self, key)
+        state.update(getattr(self, '__dict__', {}))
         for key in key_list:
             try:
                 del state[key]
@@ -45,6 +76,10 @@ class JsonPickleBase(object):
                 pass
         return state
 
+    def __setstate__(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+
 
 # --------------------------------------------------------------------------------------------------------
 # 3rd Level Structures
@@ -75,22 +110,45 @@ class URLStats(JsonPickleBase, RequiredConfig):
         print("{}prob={}".format(' ' * indent, self.probability))
         print("{}vari={}".format(' ' * indent, self.variance))
 
-    def calculate_probability_relative_to(self, other_query_url_mapping, query_str="*", url_str="*", head_list=None):
-        y = laplace(0.0, self.config.b)
+    def calculate_probability_relative_to(self, other_query_url_mapping, query_str="*", url_str="*", head_list=None, config=None):
+        # the owner of this object may pass in its configuration - see SlottedURLStats
+        if config is None:
+            config = self.config
+        y = laplace(0.0, config.b)
         self.probability = (
             (other_query_url_mapping[query_str][url_str].number_of_repetitions + y) /
             other_query_url_mapping.number_of_query_url_pairs
         )
 
-    def calculate_variance_relative_to(self, other_query_url_mapping, query_str='*', url_str='*', head_list=None):
+    def calculate_variance_relative_to(self, other_query_url_mapping, query_str='*', url_str='*', head_list=None, config=None):
+        if config is None:
+            config = self.config
         self.variance = (
             (self.probability * (1.0 - self.probability)) / (other_query_url_mapping.number_of_query_url_pairs - 1.0)
             +
-            (2.0 * self.config.b * self.config.b) /
+            (2.0 * config.b * config.b) /
             (other_query_url_mapping.number_of_query_url_pairs * (other_query_url_mapping.number_of_query_url_pairs - 1.0))
         )
 
 
+class SlottedURLStats(JsonPickleBase):
+    """A compact alternative to URLStats for use as the url_stats_class.  Instances have slots rather
+    than a __dict__ and keep no reference to the configuration.  Methods that need constants, like b,
+    are given the configuration by the Query or QueryCollection that owns the instance."""
+    __slots__ = ('number_of_repetitions', 'probability', 'variance')
+
+    def __init__(self, config=None, count=0):
+        self.number_of_repetitions = count  # number of repeats of this URL
+        self.probability = 0.0  # the computed probability of this URL
+        self.variance = 0.0  # the variance of this URL
+
+    increment_count = URLStats.increment_count
+    subsume = URLStats.subsume
+    print = URLStats.print
+    calculate_probability_relative_to = URLStats.calculate_probability_relative_to
+    calculate_variance_relative_to = URLStats.calculate_variance_relative_to
+
+
 # --------------------------------------------------------------------------------------------------------
 # 2nd Level Structures
 #     Contains a single query's stats and urls
@@ -102,6 +160,9 @@ class Query(MutableMapping, JsonPickleBase, RequiredConfig):
     """A mapping of URLs to URL stats classes.  The keys are URLs as strings and the values
     are instances of the class representing the URL data and stats.
     """
+    # the attributes that a read only view of a query delegates to it
+    frozen_attributes = ('number_of_urls', 'number_of_unique_urls', 'probability', 'variance')
+
     required_config = Namespace()
     required_config.add_option(
         name="url_stats_class",
@@ -137,9 +198,9 @@ class Query(MutableMapping, JsonPickleBase, RequiredConfig):
         # used by HeadList object
         self.probability += url_stats.probability
 
-    def add(self, url):
-        self.urls[url].increment_count()
-        self.number_of_urls += 1
+    def add(self, url, amount=1):
+        self.urls[url].increment_count(amount)
+        self.number_of_urls += amount
 
     def print(self, indent):
         print('{}count={}'.format(' ' * indent, self.number_of_urls))
@@ -180,9 +241,25 @@ class Query(MutableMapping, JsonPickleBase, RequiredConfig):
 #        queries serve as the key
 #        2nd Level structures as the value
 
+# the progress counter of the worker processes of QueryCollection.parallel_load
+_load_worker_progress = None
+
+
+def _initialize_load_worker(progress):
+    global _load_worker_progress
+    _load_worker_progress = progress
+
+
+def _count_load_range(file_name, start, end, chunk_size):
+    return count_record_range(file_name, start, end, chunk_size, _load_worker_progress)
+
+
 class QueryCollection(MutableMapping, JsonPickleBase, RequiredConfig):
     """This is the top of the mappings of mappings. The keys are queries and the values are
     instances of a mapping of URLs to URL statistics"""
+    # the attributes that a read only view of a collection delegates to it
+    frozen_attributes = ('number_of_query_url_pairs', 'number_of_queries', 'iter_records')
+
     required_config = Namespace()
     required_config.add_option(
         name="query_class",
@@ -210,31 +287,80 @@ class QueryCollection(MutableMapping, JsonPickleBase, RequiredConfig):
         for query_str in self.queries:
             self[query_str].touch('*')
 
-    def add(self, q_u_tuple):
+    def add(self, q_u_tuple, amount=1):
         """add a new <q, u> tuple to this collecton"""
         q, u = q_u_tuple
-        self.queries[q].add(u)
-        self.number_of_query_url_pairs += 1
+        # key on interned strings so that databases share them
+        self.queries[intern(q)].add(intern(u), amount)
+        self.number_of_query_url_pairs += amount
+
+    def add_counts(self, q_u_counter):
+        """add pre-aggregated <q, u> pairs from a mapping of (q, u) tuples to their number of
+        repetitions.  Each unique pair touches the nested structures only once."""
+        for q_u_tuple, count in q_u_counter.items():
+            self.add(q_u_tuple, count)
+
+    def add_many(self, weighted_records):
+        """add pre-aggregated (q, u, count) records.  Repeated pairs are summed first, so the cost
+        depends on the number of unique pairs rather than the number of events they represent."""
+        q_u_counter = Counter()
+        for query_str, url_str, count in weighted_records:
+            q_u_counter[(query_str, url_str)] += count
+        self.add_counts(q_u_counter)
+
+    def merge(self, other_query_collection):
+        """add the <q, u> counts of another collection to this one, as if the records loaded into the
+        other had been loaded into this one"""
+        self.add_counts({
+            (a_query, a_url): url_stats.number_of_repetitions
+            for a_query, url_mapping in other_query_collection.items()
+            for a_url, url_stats in url_mapping.items()
+        })
 
     def subsume_those_not_present_in(self, other_query_collection):
         """take all <q, u> records in this collection that are not in the other_query_url_mapping and
         merge their statistics into this collection's <*, *> entry"""
-        to_be_deleted_list = []
-        if '*' not in self.queries:
-            self['*'].touch('*')
-        for query_str, url_str in self.iter_records():
+        # rather than deleting the pairs one by one, the urls retained by each query are found with a
+        # single set intersection, the statistics of the others are summed and the mappings are
+        # rebuilt from the survivors
+        star_query = self['*']
+        star_query.touch('*')
+        subsumed_count = 0
+        subsumed_probability = 0.0
+        surviving_queries = []
+        for query_str, a_query in self.queries.items():
             if query_str == '*':
+                surviving_queries.append((query_str, a_query))
+                continue
+            if query_str in other_query_collection:
+                retained_urls = a_query.urls.keys() & other_query_collection[query_str].keys()
+            else:
+                retained_urls = set()
+            if len(retained_urls) == len(a_query.urls):
+                surviving_queries.append((query_str, a_query))
                 continue
-            if query_str not in other_query_collection or url_str not in other_query_collection[query_str]:
-                self['*'].subsume(self[query_str], url_str)
-                # we need to remove the <q, u> pair but cannot do so while the collection is
-                # in iteration.  We keep a list of <q, u> pairs to remove and delete them after
-                # iteration is complete
-                to_be_deleted_list.append((query_str, url_str))
-        for query_str, url_str in to_be_deleted_list:
-            del self[query_str][url_str]
-            if not len(self[query_str]):
-                del self[query_str]
+            surviving_urls = []
+            count = 0
+            probability = 0.0
+            for url_str, url_stats in a_query.urls.items():
+                if url_str in retained_urls:
+                    surviving_urls.append((url_str, url_stats))
+                else:
+                    count += url_stats.number_of_repetitions
+                    probability += url_stats.probability
+            a_query.number_of_urls -= count
+            a_query.probability -= probability
+            subsumed_count += count
+            subsumed_probability += probability
+            if surviving_urls:
+                a_query.urls = defaultdict(a_query.urls.default_factory, surviving_urls)
+                surviving_queries.append((query_str, a_query))
+
+        star_query.number_of_urls += subsumed_count
+        star_query.probability += subsumed_probability
+        star_query['*'].number_of_repetitions += subsumed_count
+        star_query['*'].probability += subsumed_probability
+        self.queries = defaultdict(self.queries.default_factory, surviving_queries)
 
     def iter_records(self):
         """an alternative iterator that returns unique <q, u> pairs"""
@@ -243,10 +369,63 @@ class QueryCollection(MutableMapping, JsonPickleBase, RequiredConfig):
                 yield a_query, a_url
 
     def load(self, file_name):
-        with open(file_name, encoding='utf-8') as optin_data_source:
+        """load a file of [q, u] or weighted [q, u, count] JSON records, one per line"""
+        with open_records(file_name, encoding='utf-8') as optin_data_source:
             for record_str in optin_data_source:
                 record = json.loads(record_str)
-                self.add(record)
+                if len(record) == 3:
+                    self.add(record[:2], record[2])
+                else:
+                    self.add(record)
+
+    def bulk_load(self, file_name, chunk_size=BULK_LOAD_CHUNK_SIZE, progress=None):
+        """an alternative to 'load' for large files.  Rather than parsing and adding one line at a time,
+        lines are read in chunks of roughly 'chunk_size' characters and each chunk is parsed with a
+        single call to json.loads.  The <q, u> pairs are counted in a flat Counter and only then added
+        to the nested structures, once per unique pair.  Weighted [q, u, count] records are counted
+        by their weight.  The number of pairs of each chunk is added to 'progress', if given, an
+        instrumentation.ProgressCounter or any object with an 'add' method."""
+        q_u_counter = Counter()
+        for records in iter_record_chunks(file_name, chunk_size):
+            number_of_pairs = count_records(q_u_counter, records)
+            if progress is not None:
+                progress.add(number_of_pairs)
+        self.add_counts(q_u_counter)
+
+    def parallel_load(self, file_name, number_of_workers, chunk_size=BULK_LOAD_CHUNK_SIZE, progress=None):
+        """bulk_load spread over a pool of processes.  The file is split into one byte range per worker
+        on line boundaries, each worker parses its range into a Counter of <q, u> pairs and the partial
+        Counters are added in file order, so the result is the same as that of bulk_load.  The workers
+        add the pairs of each chunk to 'progress', which must be shareable between processes, such as
+        an instrumentation.ProgressCounter."""
+        line_ranges = find_line_ranges(file_name, number_of_workers)
+        if len(line_ranges) < 2:
+            return self.bulk_load(file_name, chunk_size, progress)
+        with Pool(
+            processes=len(line_ranges),
+            initializer=_initialize_load_worker,
+            initargs=(progress,)
+        ) as pool:
+            partial_counters = pool.starmap(
+                _count_load_range,
+                [(file_name, start, end, chunk_size) for start, end in line_ranges]
+            )
+        for q_u_counter in partial_counters:
+            self.add_counts(q_u_counter)
+
+    def load_binary(self, file_name, progress=None):
+        """load a file compiled by blender.binary_records.compile_json_records.  The file is memory
+        mapped and its unique <q, u> pairs and counts are added a chunk at a time without parsing any
+        JSON."""
+        with BinaryRecords(file_name) as binary_records:
+            for q_u_counts in binary_records.iter_count_chunks():
+                self.add_counts(q_u_counts)
+                if progress is not None:
+                    progress.add(sum(q_u_counts.values()))
+
+    def frozen(self):
+        """a read only view of this collection for stages that only look up values in it"""
+        return FrozenQueryCollection(self)
 
     def print(self, indent=0):
         print('{}count={}'.format(' ' * indent, self.number_of_query_url_pairs))
@@ -274,3 +453,133 @@ class QueryCollection(MutableMapping, JsonPickleBase, RequiredConfig):
 
     def __contains__(self, key):
         return key in self.queries
+
+
+# --------------------------------------------------------------------------------------------------------
+# Read Only Views
+#     Looking up a missing key in the structures above adds it.  During the estimation and blending
+#     stages, the other collections are only read, so they are given as these views instead.  Missing
+#     queries and urls resolve to shared sentinels with statistics of zero and nothing is added.
+
+class ZeroURLStats(object):
+    """the statistics of a url that is not present"""
+    __slots__ = ()
+    number_of_repetitions = 0
+    probability = 0.0
+    variance = 0.0
+    omega = 0.0
+
+
+ZERO_URL_STATS = ZeroURLStats()
+
+
+class FrozenURLStats(object):
+    """a read only view of the statistics of a url, with the attributes of ZeroURLStats"""
+    __slots__ = ('url_stats',)
+
+    def __init__(self, url_stats):
+        self.url_stats = url_stats
+
+    @property
+    def number_of_repetitions(self):
+        return self.url_stats.number_of_repetitions
+
+    @property
+    def probability(self):
+        return self.url_stats.probability
+
+    @property
+    def variance(self):
+        return self.url_stats.variance
+
+    @property
+    def omega(self):
+        return self.url_stats.omega
+
+
+def _frozen(value):
+    if isinstance(value, ndarray):
+        value = value.view()
+        value.flags.writeable = False
+    elif isinstance(value, list):
+        value = tuple(value)
+    return value
+
+
+class FrozenQuery(Mapping):
+    """a read only view of a Query.  Only the attributes named in the 'frozen_attributes' of the
+    Query's class are available, so its urls and methods that change it are not."""
+    def __init__(self, a_query):
+        self.query = a_query
+
+    def __getattr__(self, name):
+        if name not in self.query.frozen_attributes:
+            raise AttributeError('{} has no readable attribute {}'.format(type(self).__name__, name))
+        return _frozen(getattr(self.query, name))
+
+    def __getitem__(self, url):
+        if url in self.query:
+            return FrozenURLStats(self.query[url])
+        return ZERO_URL_STATS
+
+    def __iter__(self):
+        return iter(self.query)
+
+    def __len__(self):
+        return len(self.query)
+
+    def __contains__(self, url):
+        return url in self.query
+
+
+class ZeroQuery(Mapping):
+    """a query that is not present: it has no urls and its statistics are zero"""
+    number_of_urls = 0
+    number_of_unique_urls = 0
+    probability = 0.0
+    variance = 0.0
+
+    def __getitem__(self, url):
+        return ZERO_URL_STATS
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __contains__(self, url):
+        return False
+
+
+ZERO_QUERY = ZeroQuery()
+
+
+class FrozenQueryCollection(Mapping):
+    """a read only view of a QueryCollection.  Only the attributes named in the 'frozen_attributes' of
+    the collection's class are available, arrays as read only views and lists as tuples.  The views of
+    its queries and urls are made on demand and not kept."""
+    def __init__(self, query_collection):
+        self.query_collection = query_collection
+
+    def __getattr__(self, name):
+        if name not in self.query_collection.frozen_attributes:
+            raise AttributeError('{} has no readable attribute {}'.format(type(self).__name__, name))
+        return _frozen(getattr(self.query_collection, name))
+
+    def frozen(self):
+        return self
+
+    def __getitem__(self, query_str):
+        if query_str in self.query_collection:
+            return FrozenQuery(self.query_collection[query_str])
+        return ZERO_QUERY
+
+    def __iter__(self):
+        return iter(self.query_collection)
+
+    def __len__(self):
+        return len(self.query_collection)
+
+    def __contains__(self, query_str):
+        return query_str in self.query_collection
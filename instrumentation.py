@@ -0,0 +1,174 @@
+# The stages of a run of the Blender algorithm, loading the databases, creating the head list,
+# simulating the clients and blending, have very different costs depending on the data structures
+# chosen by dependency injection and the sizes of the input files.  An Instrumentation measures each
+# stage: the wall clock and CPU time it took, its throughput in records per second and the peak memory
+# reached by its end, and gathers the measurements into a report that can be written as JSON.
+
+# CPU time is that of this process plus that of any worker processes that finished during the stage,
+# such as those of parallel_load or of the sharded client simulation.  The peak resident set size is a
+# high water mark of the whole process, so it never falls from one stage to the next.  When memory is
+# traced, 'peak_traced_bytes' is the peak of the Python allocations made during the stage alone.
+
+# A long stage may also be given a live progress line, rewritten in place every 'progress_interval'
+# seconds from a background thread.  Loaders that only add their records to a database at the end, such
+# as bulk_load or the batched client simulation, report as they go by adding the records of each chunk
+# to the ProgressCounter of the stage, which is shared with their worker processes.
+
+from contextlib import (
+    contextmanager
+)
+import json
+from multiprocessing import (
+    Value
+)
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+# ru_maxrss is reported in kilobytes except on macOS, where it is in bytes
+MAXRSS_UNITS = 1 if sys.platform == 'darwin' else 1024
+
+
+def peak_rss():
+    """the peak resident set size in bytes of this process and, separately, of its largest finished
+    child process"""
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNITS,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * MAXRSS_UNITS,
+    )
+
+
+def cpu_times():
+    """the CPU time in seconds of this process and of its finished child processes"""
+    times = os.times()
+    return times.user + times.system, times.children_user + times.children_system
+
+
+class ProgressCounter(object):
+    """a count of the records processed so far by a stage, shared with the worker processes that are
+    given it when they are started"""
+    def __init__(self):
+        self.shared_count = Value('q', 0)
+
+    def add(self, number_of_records):
+        with self.shared_count.get_lock():
+            self.shared_count.value += number_of_records
+
+    @property
+    def value(self):
+        return self.shared_count.value
+
+
+class Instrumentation(object):
+    """records the timing, throughput and memory of the named stages of a run"""
+    def __init__(self, progress_interval=0.0, trace_memory=False, progress_stream=sys.stderr):
+        self.progress_interval = progress_interval
+        self.trace_memory = trace_memory
+        self.progress_stream = progress_stream
+        self.stages = []
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.start_time = time.perf_counter()
+        self.start_cpu_times = cpu_times()
+
+    @contextmanager
+    def stage(self, name, count_records=None):
+        """measure the body of a 'with' statement as a stage.  The statement is given a ProgressCounter
+        for the loaders of the stage to add their records to as they go.  'count_records' is an optional
+        function returning the number of records the stage has processed.  It is called once at the end
+        of the stage for the throughput, which otherwise comes from the ProgressCounter."""
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        start_cpu_time, start_child_cpu_time = cpu_times()
+        progress = ProgressCounter()
+        progress_line = None
+        if self.progress_interval > 0:
+            progress_line = ProgressLine(name, progress, count_records, self.progress_interval, self.progress_stream)
+            progress_line.start()
+        try:
+            yield progress
+        finally:
+            if progress_line is not None:
+                progress_line.stop()
+            wall_time = time.perf_counter() - start_time
+            cpu_time, child_cpu_time = cpu_times()
+            a_stage = {
+                'name': name,
+                'wall_time': wall_time,
+                'cpu_time': cpu_time - start_cpu_time,
+                'child_cpu_time': child_cpu_time - start_child_cpu_time,
+            }
+            if count_records is not None or progress.value:
+                number_of_records = count_records() if count_records is not None else progress.value
+                a_stage['records'] = number_of_records
+                a_stage['records_per_second'] = number_of_records / wall_time if wall_time > 0 else None
+            a_stage['peak_rss_bytes'], a_stage['peak_child_rss_bytes'] = peak_rss()
+            if self.trace_memory:
+                a_stage['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+            self.stages.append(a_stage)
+
+    def report(self):
+        """the measurements of the stages so far and of the run as a whole"""
+        cpu_time, child_cpu_time = cpu_times()
+        total = {
+            'wall_time': time.perf_counter() - self.start_time,
+            'cpu_time': cpu_time - self.start_cpu_times[0],
+            'child_cpu_time': child_cpu_time - self.start_cpu_times[1],
+        }
+        total['peak_rss_bytes'], total['peak_child_rss_bytes'] = peak_rss()
+        return {
+            'stages': list(self.stages),
+            'total': total,
+        }
+
+    def write_report(self, file_name):
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=4)
+            f.write('\n')
+
+
+class ProgressLine(object):
+    """a status line of a running stage, rewritten in place by a daemon thread.  The records are those
+    added to the ProgressCounter of the stage or, for stages that add none, those counted by
+    'count_records'"""
+    def __init__(self, name, progress, count_records, interval, stream):
+        self.name = name
+        self.progress = progress
+        self.count_records = count_records
+        self.interval = interval
+        self.stream = stream
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        self.stream.write('\n')
+        self.stream.flush()
+
+    def line(self):
+        wall_time = time.perf_counter() - self.start_time
+        fields = ['{}: {:.1f}s'.format(self.name, wall_time)]
+        number_of_records = self.progress.value
+        if not number_of_records and self.count_records is not None:
+            number_of_records = self.count_records()
+        if number_of_records or self.count_records is not None:
+            fields.append('{} records'.format(number_of_records))
+            if wall_time > 0:
+                fields.append('{:.0f} records/s'.format(number_of_records / wall_time))
+        fields.append('peak rss {:.1f} MiB'.format(peak_rss()[0] / (1 << 20)))
+        return ', '.join(fields)
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.stream.write('\r{}'.format(self.line()))
+            self.stream.flush()
+        self.stream.write('\r{}'.format(self.line()))
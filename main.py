@@ -6,6 +6,7 @@ from configman import (
     ConfigFileFutureProxy as configuration_file,
     environment,
     Namespace,
+    RequiredConfig,
     class_converter,
 )
 
@@ -45,19 +46,22 @@ required_config.add_option(
 required_config.add_option(
     "optin_database_s_filename",
     default='optin_s.data.json',
-    doc="the pathname of the optin_database_s formated as [query, url] pairs"
+    doc="the pathname of the optin_database_s formated as [query, url] pairs, as JSON or compiled by "
+        "blender.binary_records"
 )
 
 required_config.add_option(
     "optin_database_t_filename",
     default='optin_t.data.json',
-    doc="the pathname of the optin_database_t json formated as [query, url] pairs"
+    doc="the pathname of the optin_database_t formated as [query, url] pairs, as JSON or compiled by "
+        "blender.binary_records"
 )
 
 required_config.add_option(
     "client_database_filename",
     default='client.data.json',
-    doc="the pathname of the client_database json formated as [query, url] pairs"
+    doc="the pathname of the client_database formated as [query, url] pairs, as JSON or compiled by "
+        "blender.binary_records"
 )
 
 required_config.add_option(
@@ -66,6 +70,74 @@ required_config.add_option(
     doc="the pathname of the final probabilities output"
 )
 
+required_config.add_option(
+    "head_list_snapshot_output_filename",
+    default='',
+    doc="if given, the pathname of a snapshot of the head_list for distribution to be written for "
+        "reuse by later runs"
+)
+
+required_config.add_option(
+    "head_list_snapshot_input_filename",
+    default='',
+    doc="if given, the pathname of a head_list snapshot to use in place of loading the opt-in databases "
+        "and estimating the opt-in probabilities"
+)
+
+required_config.add_option(
+    "client_head_list_filename",
+    default='',
+    doc="if given, the pathname to which the head_list for distribution is exported for the clients.  "
+        "The simulated clients then use the exported head_list"
+)
+
+required_config.add_option(
+    "load_workers",
+    default=1,
+    doc="the number of processes sharing the parsing of each JSON opt-in database"
+)
+
+required_config.add_option(
+    "local_alg_block_size",
+    default=100000,
+    doc="the number of client records randomized together when simulating the clients with the "
+        "batched local_alg, 0 selects the original record at a time local_alg"
+)
+
+required_config.add_option(
+    "client_simulation_workers",
+    default=1,
+    doc="the number of processes sharing the batched local_alg simulation of the clients"
+)
+
+required_config.add_option(
+    "instrumentation_report_filename",
+    default='',
+    doc="if given, the pathname of a JSON report of the wall time, CPU time, records per second and "
+        "peak memory of each stage of the run"
+)
+
+required_config.add_option(
+    "progress_interval",
+    default=0.0,
+    doc="if greater than 0, the number of seconds between updates of a live progress line on stderr "
+        "for each stage of the run"
+)
+
+required_config.add_option(
+    "trace_memory",
+    default=False,
+    doc="trace the Python allocations of each stage with tracemalloc, at some cost in speed"
+)
+
+required_config.add_option(
+    "client_simulation_seed",
+    default=None,
+    from_string_converter=int,
+    doc="the seed of the random streams of a multiprocess client simulation, given the same seed "
+        "and number of workers, the simulation is reproducible"
+)
+
 
 # the following are constants calculated in Figure 6 LocalAlg and then
 # referenced in EstimateClientProbabilities Figure 5. While they are
@@ -100,38 +172,8 @@ required_config.add_aggregation(
     lambda config, local_config, arg: (config.delta / config.m_c) - (config.f_c * config.delta / config.m_c)
 )
 
-# declare the types of the default data structures for use in dependency injection
-required_config.namespace('optin_db')
-required_config.optin_db.add_option(
-    name="optin_db_class",
-    default="blender.in_memory_structures.QueryCollection",
-    from_string_converter=class_converter,
-    doc="dependency injection of a class to serve as non-headlist <q, u> databases"
-)
-
-required_config.namespace('head_list_db')
-required_config.head_list_db.add_option(
-    name="head_list_class",
-    default="blender.head_list.HeadList",
-    from_string_converter=class_converter,
-    doc="dependency injection of a class to serve as the HeadList"
-)
-
-required_config.namespace('client_db')
-required_config.client_db.add_option(
-    name="client_db_class",
-    default="blender.in_memory_structures.QueryCollection",
-    from_string_converter=class_converter,
-    doc="dependency injection of a class to serve as the Optin Database"
-)
-
-required_config.namespace('final_probabilities')
-required_config.final_probabilities.add_option(
-    name="final_probabilites_db_class",
-    default="blender.head_list.HeadList",
-    from_string_converter=class_converter,
-    doc="dependency injection of a class to serve final probability vector"
-)
+# the types of the data structures for use in dependency injection are declared by the
+# 'data_structures' option that follows their definitions below
 
 # The Blender paper refers to several data structures as databases and vectors.
 # However, digging deeper there is really only one data structure: a mapping of
@@ -200,6 +242,159 @@ default_data_structures = {  # keyed by the use case
 }
 
 
+# overrides of the level 3 classes of default_data_structures with the __slots__ based URLStats
+# family.  These have no per instance __dict__ or reference to the configuration, which saves memory
+# when there are millions of unique <q, u> pairs.  Use after default_data_structures in a
+# values_source_list.
+slotted_url_stats = {
+    "head_list_db.url_stats_class": "blender.in_memory_structures.SlottedURLStats",
+    "optin_db.url_stats_class": "blender.in_memory_structures.SlottedURLStats",
+    "client_db.url_stats_class": "blender.client_structures.SlottedClientURLStats",
+    "final_probabilities.url_stats_class": "blender.final_structures.SlottedFinalURLStats",
+}
+
+# an alternative to default_data_structures using the columnar implementations from
+# blender.array_structures.  Each unique <q, u> pair is a row in a set of NumPy arrays rather
+# than an object of its own.  The level 2 and 3 classes are views on those arrays, so all
+# four use cases have to be switched together.
+array_data_structures = {  # keyed by the use case
+    "head_list_db": {
+        # level 1
+        "head_list_class": "blender.array_structures.ArrayHeadList",
+        # level 2
+        "query_class": "blender.array_structures.ArrayQuery",
+        # level 3
+        "url_stats_class": "blender.array_structures.ArrayURLStats"
+    },
+    "optin_db": {
+        # level 1
+        "optin_db_class": "blender.array_structures.ArrayQueryCollection",
+        # level 2
+        "query_class": "blender.array_structures.ArrayQuery",
+        # level 3
+        "url_stats_class": "blender.array_structures.ArrayURLStats"
+    },
+    "client_db": {
+        # level 1
+        "client_db_class": "blender.array_structures.ArrayClientQueryCollection",
+        # level 2
+        "query_class": "blender.array_structures.ArrayQuery",
+        # level 3
+        "url_stats_class": "blender.array_structures.ArrayURLStats"
+    },
+    "final_probabilities": {
+        # level 1
+        "final_probabilites_db_class": "blender.array_structures.ArrayFinalQueryCollection",
+        # level 2
+        "query_class": "blender.array_structures.ArrayQuery",
+        # level 3
+        "url_stats_class": "blender.array_structures.ArrayFinalURLStats"
+    },
+}
+
+
+# an alternative to default_data_structures using the SQLite implementations from
+# blender.sqlite_structures for datasets that don't fit in memory.  The collections are tables in a
+# SQLite database and the level 2 and 3 classes are views on those tables, so all four use cases have
+# to be switched together.  The database file is set with 'database_file_name' in each use case.
+sqlite_data_structures = {  # keyed by the use case
+    "head_list_db": {
+        # level 1
+        "head_list_class": "blender.sqlite_structures.SQLiteHeadList",
+        # level 2
+        "query_class": "blender.sqlite_structures.SQLiteQuery",
+        # level 3
+        "url_stats_class": "blender.sqlite_structures.SQLiteURLStats"
+    },
+    "optin_db": {
+        # level 1
+        "optin_db_class": "blender.sqlite_structures.SQLiteQueryCollection",
+        # level 2
+        "query_class": "blender.sqlite_structures.SQLiteQuery",
+        # level 3
+        "url_stats_class": "blender.sqlite_structures.SQLiteURLStats"
+    },
+    "client_db": {
+        # level 1
+        "client_db_class": "blender.sqlite_structures.SQLiteClientQueryCollection",
+        # level 2
+        "query_class": "blender.sqlite_structures.SQLiteQuery",
+        # level 3
+        "url_stats_class": "blender.sqlite_structures.SQLiteURLStats"
+    },
+    "final_probabilities": {
+        # level 1
+        "final_probabilites_db_class": "blender.sqlite_structures.SQLiteFinalQueryCollection",
+        # level 2
+        "query_class": "blender.sqlite_structures.SQLiteQuery",
+        # level 3
+        "url_stats_class": "blender.sqlite_structures.SQLiteFinalURLStats"
+    },
+}
+
+
+# the default data structures with the level 3 classes replaced by those of slotted_url_stats
+slotted_data_structures = {
+    use_case: dict(class_options, url_stats_class=slotted_url_stats[use_case + '.url_stats_class'])
+    for use_case, class_options in default_data_structures.items()
+}
+
+# the families of data structures selected by the 'data_structures' option
+DATA_STRUCTURES = {
+    'default': default_data_structures,
+    'slotted': slotted_data_structures,
+    'array': array_data_structures,
+    'sqlite': sqlite_data_structures,
+}
+
+CLASS_OPTION_DOCS = {
+    "optin_db_class": "dependency injection of a class to serve as non-headlist <q, u> databases",
+    "head_list_class": "dependency injection of a class to serve as the HeadList",
+    "client_db_class": "dependency injection of a class to serve as the client database",
+    "final_probabilites_db_class": "dependency injection of a class to serve final probability vector",
+    "query_class": "dependency injection of a class to represent a mapping of URLs to URL stats objects",
+    "url_stats_class": "dependency injection of a class to represent statistics for URLs",
+}
+
+
+def data_structures_converter(data_structures):
+    """take the name of a family of data structures and return a proxy class whose required_config
+    declares the class options of the four use cases with the classes of that family as defaults.
+    Like the class options themselves, configman expands them into the configuration, where any
+    value source may still override them one by one."""
+    if data_structures not in DATA_STRUCTURES:
+        raise ValueError('unknown data_structures {}, use one of: {}'.format(
+            data_structures,
+            ', '.join(DATA_STRUCTURES)
+        ))
+
+    class DataStructures(RequiredConfig):
+        required_config = Namespace()
+
+        @classmethod
+        def to_str(cls):
+            return data_structures
+
+    for use_case, class_options in DATA_STRUCTURES[data_structures].items():
+        DataStructures.required_config.namespace(use_case)
+        for option_name, class_name in class_options.items():
+            DataStructures.required_config[use_case].add_option(
+                name=option_name,
+                default=class_name,
+                from_string_converter=class_converter,
+                doc=CLASS_OPTION_DOCS[option_name]
+            )
+    return DataStructures
+
+
+required_config.add_option(
+    "data_structures",
+    default='default',
+    from_string_converter=data_structures_converter,
+    doc="the family of data structures of the four use cases: {}".format(', '.join(DATA_STRUCTURES))
+)
+
+
 # direct implementations of the Blender algorithms
 
 # CreateHeadList from Figure 3
@@ -230,6 +425,8 @@ def estimate_optin_probabilities(preliminary_head_list, optin_database_t):
     """
     print('estimate_optin_probabilities')
     optin_database_t.subsume_those_not_present_in(preliminary_head_list)
+    # from here on, optin_database_t is only read
+    optin_database_t = optin_database_t.frozen()
     preliminary_head_list.calculate_probabilities_relative_to(optin_database_t)
     preliminary_head_list.subsume_entries_beyond_max_size()
     preliminary_head_list.calculate_variance_relative_to(optin_database_t)
@@ -282,7 +479,7 @@ def estimate_client_probabilities(config, head_list, client_database):
 
     print('estimate_client_probabilities')
 
-    client_database.calculate_probabilities(head_list)
+    client_database.calculate_probabilities(head_list.frozen())
 
     return client_database
 
@@ -302,14 +499,10 @@ def blend_probabilities(config, optin_probabilities, client_probabilities):
     final_probabilities = config.final_probabilities.final_probabilites_db_class(
         config.final_probabilities
     )
-    final_probabilities.calculate_probability_relative_to(client_probabilities, optin_probabilities)
-    for query, url in optin_probabilities.iter_records():
-        final_probabilities[query][url].calculate_probability_relative_to(
-            client_probabilities,
-            query_str=query,
-            url_str=url,
-            head_list=optin_probabilities,
-        )
+    final_probabilities.calculate_probability_relative_to(
+        client_probabilities.frozen(),
+        optin_probabilities.frozen()
+    )
 
     return final_probabilities
 
@@ -318,19 +511,41 @@ if __name__ == "__main__":
 
     from functools import partial
     from collections import Mapping
-    import json
+    import os
 
     from configman.converters import (
         to_str
     )
 
-    from blender.tests.client_support import local_alg
+    from blender.tests.client_support import (
+        local_alg,
+        batch_local_alg,
+        sharded_local_alg,
+        LOCAL_ALG_BLOCK_SIZE,
+    )
+
+    from blender.binary_records import (
+        is_binary_records,
+        iter_file_records,
+    )
+    from blender.client_head_list import (
+        ClientHeadList
+    )
+    from blender.instrumentation import (
+        Instrumentation
+    )
 
     def client_load_iter(file_name):
-        with open(file_name, encoding='utf-8') as optin_data_source:
-            for record_str in optin_data_source:
-                record = json.loads(record_str)
-                yield record
+        return iter_file_records(file_name)
+
+    def load_database(a_database, file_name, progress):
+        # files compiled by blender.binary_records are memory mapped rather than parsed
+        if is_binary_records(file_name):
+            a_database.load_binary(file_name, progress=progress)
+        elif config.load_workers > 1:
+            a_database.parallel_load(file_name, config.load_workers, progress=progress)
+        else:
+            a_database.bulk_load(file_name, progress=progress)
 
     def print_config(config, indent=0):
         keys = sorted(config.keys())
@@ -369,12 +584,14 @@ if __name__ == "__main__":
     #    export client_db.client_db_class=some.module.class  # fails
     #    export client_db__client_db_class=some.module.class  # works
 
+    # The family of data structures is chosen with a single option, for example
+    # "--data_structures=sqlite".  It sets the defaults of all the class options at once.
+
     config = configuration(
         definition_source=required_config,
         values_source_list=[
             # create the overriding hierarchy for the sources of configuration.
             # each source will override values from sources higher in the list
-            default_data_structures,
             environment,
             configuration_file,
             command_line,
@@ -384,52 +601,123 @@ if __name__ == "__main__":
     print_config(config, 4)
     print('---------------------')
 
-    # create & read optin_database_s
-    optin_database_s = config.optin_db.optin_db_class(
-        config.optin_db
-    )
-    optin_database_s.load(config.optin_database_s_filename)
-
-    print('optin_db_s:\n\tnumber_of_records:{}\n\tnumber_of_queries:{}'.format(optin_database_s.number_of_query_url_pairs, optin_database_s.number_of_queries))
-
-    # create preliminary head list
-    preliminary_head_list = create_preliminary_headlist(
-        config,
-        optin_database_s
-    )
-    print('preliminary_head_list:\n\tnumber_of_records:{}\n\tnumber_of_queries:{}'.format(preliminary_head_list.number_of_query_url_pairs, preliminary_head_list.number_of_queries))
-
-    # create & read optin_database_t
-    optin_database_t = config.optin_db.optin_db_class(
-        config.optin_db
-    )
-    optin_database_t.load(config.optin_database_t_filename)
-    print('optin_db_t:\n\tnumber_of_records:{}\n\tnumber_of_queries:{}'.format(optin_database_t.number_of_query_url_pairs, optin_database_t.number_of_queries))
-
-    head_list_for_distribution = estimate_optin_probabilities(
-        preliminary_head_list,
-        optin_database_t
-    )
-    print('head_list_for_distribution:\n\tnumber_of_records:{}\n\tnumber_of_queries:{}'.format(head_list_for_distribution.number_of_query_url_pairs, head_list_for_distribution.number_of_queries))
+    instrumentation = Instrumentation(config.progress_interval, config.trace_memory)
+
+    if config.head_list_snapshot_input_filename:
+        head_list_for_distribution = config.head_list_db.head_list_class(config.head_list_db)
+        with instrumentation.stage(
+            'load_head_list_snapshot',
+            lambda: head_list_for_distribution.number_of_query_url_pairs
+        ):
+            head_list_for_distribution.load_snapshot(config.head_list_snapshot_input_filename)
+        print('head_list_for_distribution:\n\tnumber_of_records:{}\n\tnumber_of_queries:{}'.format(head_list_for_distribution.number_of_query_url_pairs, head_list_for_distribution.number_of_queries))
+    else:
+        # create & read optin_database_s
+        optin_database_s = config.optin_db.optin_db_class(
+            config.optin_db
+        )
+        with instrumentation.stage(
+            'load_optin_database_s',
+            lambda: optin_database_s.number_of_query_url_pairs
+        ) as progress:
+            load_database(optin_database_s, config.optin_database_s_filename, progress)
+
+        print('optin_db_s:\n\tnumber_of_records:{}\n\tnumber_of_queries:{}'.format(optin_database_s.number_of_query_url_pairs, optin_database_s.number_of_queries))
+
+        # create preliminary head list
+        with instrumentation.stage('create_preliminary_headlist', lambda: optin_database_s.number_of_query_url_pairs):
+            preliminary_head_list = create_preliminary_headlist(
+                config,
+                optin_database_s
+            )
+        print('preliminary_head_list:\n\tnumber_of_records:{}\n\tnumber_of_queries:{}'.format(preliminary_head_list.number_of_query_url_pairs, preliminary_head_list.number_of_queries))
+
+        # create & read optin_database_t
+        optin_database_t = config.optin_db.optin_db_class(
+            config.optin_db
+        )
+        with instrumentation.stage(
+            'load_optin_database_t',
+            lambda: optin_database_t.number_of_query_url_pairs
+        ) as progress:
+            load_database(optin_database_t, config.optin_database_t_filename, progress)
+        print('optin_db_t:\n\tnumber_of_records:{}\n\tnumber_of_queries:{}'.format(optin_database_t.number_of_query_url_pairs, optin_database_t.number_of_queries))
+
+        # estimate_optin_probabilities subsumes records of optin_database_t, so its size is taken first
+        number_of_optin_t_records = optin_database_t.number_of_query_url_pairs
+        with instrumentation.stage('estimate_optin_probabilities', lambda: number_of_optin_t_records):
+            head_list_for_distribution = estimate_optin_probabilities(
+                preliminary_head_list,
+                optin_database_t
+            )
+        print('head_list_for_distribution:\n\tnumber_of_records:{}\n\tnumber_of_queries:{}'.format(head_list_for_distribution.number_of_query_url_pairs, head_list_for_distribution.number_of_queries))
+        if config.head_list_snapshot_output_filename:
+            with instrumentation.stage('save_head_list_snapshot'):
+                head_list_for_distribution.save_snapshot(config.head_list_snapshot_output_filename)
+
+    # the head_list as distributed to the clients
+    client_head_list = head_list_for_distribution
+    if config.client_head_list_filename:
+        with instrumentation.stage('export_client_head_list'):
+            head_list_for_distribution.export_for_client_distribution(config.client_head_list_filename)
+        with instrumentation.stage('load_client_head_list'):
+            client_head_list = ClientHeadList(config.client_head_list_filename)
+        print('client_head_list:\n\tsize:{}\n\tload_time:{:.6f}'.format(
+            os.path.getsize(config.client_head_list_filename),
+            instrumentation.stages[-1]['wall_time']
+        ))
 
     # create and load client database
     client_database = config.client_db.client_db_class(
         config.client_db
     )
-    for record in local_alg(config, head_list_for_distribution, partial(client_load_iter, config.client_database_filename)):
-        client_database.add(record)
+    with instrumentation.stage(
+        'load_client_database',
+        lambda: client_database.number_of_query_url_pairs
+    ) as progress:
+        if config.client_simulation_workers > 1:
+            client_database.add_counts(
+                sharded_local_alg(
+                    config,
+                    client_head_list,
+                    config.client_database_filename,
+                    config.client_simulation_workers,
+                    config.client_simulation_seed,
+                    config.local_alg_block_size or LOCAL_ALG_BLOCK_SIZE,
+                    progress
+                )
+            )
+        elif config.local_alg_block_size:
+            client_database.add_counts(
+                batch_local_alg(
+                    config,
+                    client_head_list,
+                    partial(client_load_iter, config.client_database_filename),
+                    config.local_alg_block_size,
+                    progress
+                )
+            )
+        else:
+            for record in local_alg(config, client_head_list, partial(client_load_iter, config.client_database_filename)):
+                client_database.add(record)
     print('client_database:\n\tnumber_of_records:{}\n\tnumber_of_queries:{}'.format(client_database.number_of_query_url_pairs, client_database.number_of_queries))
 
-    client_stats = estimate_client_probabilities(
-        config,
-        head_list_for_distribution,
-        client_database
-    )
+    with instrumentation.stage('estimate_client_probabilities', lambda: client_database.number_of_query_url_pairs):
+        client_stats = estimate_client_probabilities(
+            config,
+            head_list_for_distribution,
+            client_database
+        )
 
-    final_stats = blend_probabilities(
-        config,
-        head_list_for_distribution,
-        client_stats
-    )
+    with instrumentation.stage('blend_probabilities', lambda: head_list_for_distribution.number_of_query_url_pairs):
+        final_stats = blend_probabilities(
+            config,
+            head_list_for_distribution,
+            client_stats
+        )
+
+    with instrumentation.stage('write_final_probabilities'):
+        final_stats.write(config.output_filename)
 
-    final_stats.write(config.output_filename)
+    if config.instrumentation_report_filename:
+        instrumentation.write_report(config.instrumentation_report_filename)
@@ -0,0 +1,215 @@
+# Worker processes that read the head list, such as those of the sharded client simulation, would each
+# receive a pickled copy of the nested HeadListQuery and URLStats objects.  Instead, the head list is
+# published once into a block of shared memory: the string tables of a HeadListIndex followed by arrays
+# of the statistics of the queries and of the <q, u> pairs, in the order of their ids.  Each worker
+# attaches a SharedHeadList, a read only view that reads the keys and values in place.
+
+# The process that publishes the block owns it and unlinks it when the workers are done.  A view holds
+# memoryviews of the block, so everything taken from a view must be released before the view is closed.
+
+from array import (
+    array
+)
+from collections import (
+    Mapping
+)
+from multiprocessing.shared_memory import (
+    SharedMemory
+)
+
+from blender.head_list_index import (
+    HeadListIndex
+)
+from blender.in_memory_structures import (
+    ZERO_QUERY,
+    ZERO_URL_STATS,
+)
+
+# (table name, array typecode, attribute) of the statistics of each query and of each <q, u> pair
+QUERY_STATISTICS = (
+    ('numbers_of_urls', 'q', 'number_of_urls'),
+    ('query_probabilities', 'd', 'probability'),
+    ('query_variances', 'd', 'variance'),
+    ('taus', 'd', 'tau'),
+)
+PAIR_STATISTICS = (
+    ('numbers_of_repetitions', 'q', 'number_of_repetitions'),
+    ('pair_probabilities', 'd', 'probability'),
+    ('pair_variances', 'd', 'variance'),
+)
+
+# the tables are placed on boundaries of this many bytes
+ALIGNMENT = 8
+
+
+def _statistic(an_object, attribute, typecode):
+    # a ClientHeadList carries only the keys and the taus, its other statistics are published as zero
+    value = getattr(an_object, attribute, 0)
+    return int(value) if typecode == 'q' else float(value)
+
+
+class SharedHeadListBlock(object):
+    """a head list published into a block of shared memory.  The 'handle' is all that a worker process
+    needs to attach a SharedHeadList.  An 'index' of the head_list that has already been built may be
+    given to save building another."""
+    def __init__(self, head_list, index=None):
+        if index is None:
+            index = HeadListIndex(head_list)
+        tables = [(name, 'B', getattr(index, name)) for name in ('query_data', 'url_data')]
+        tables.extend(
+            (name, 'q', getattr(index, name)) for name in HeadListIndex.TABLES if name not in ('query_data', 'url_data')
+        )
+        query_tables = [(name, typecode, attribute, array(typecode)) for name, typecode, attribute in QUERY_STATISTICS]
+        pair_tables = [(name, typecode, attribute, array(typecode)) for name, typecode, attribute in PAIR_STATISTICS]
+        for query_str in head_list.keys():
+            a_query = head_list[query_str]
+            for name, typecode, attribute, values in query_tables:
+                values.append(_statistic(a_query, attribute, typecode))
+            for url_str in a_query.keys():
+                url_stats = a_query[url_str]
+                for name, typecode, attribute, values in pair_tables:
+                    values.append(_statistic(url_stats, attribute, typecode))
+        tables.extend((name, typecode, values) for name, typecode, attribute, values in query_tables + pair_tables)
+
+        layout = []
+        position = 0
+        for name, typecode, values in tables:
+            length = len(values)
+            layout.append((name, typecode, position, length))
+            position += -(-length * array(typecode).itemsize // ALIGNMENT) * ALIGNMENT
+        self.shared_memory = SharedMemory(create=True, size=max(position, ALIGNMENT))
+        for (name, typecode, values), layout_entry in zip(tables, layout):
+            table_bytes = values if typecode == 'B' else values.tobytes()
+            offset = layout_entry[2]
+            self.shared_memory.buf[offset:offset + len(table_bytes)] = table_bytes
+
+        self.handle = (
+            self.shared_memory.name,
+            tuple(layout),
+            head_list.number_of_query_url_pairs,
+            head_list.tau,
+        )
+
+    def close(self):
+        """release and remove the block.  Views attached in this process must be closed first."""
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# --------------------------------------------------------------------------------------------------------
+# 3rd Level Structures
+
+class SharedURLStats(object):
+    """the statistics of a <q, u> pair of a SharedHeadList"""
+    __slots__ = ('tables', 'pair_id')
+
+    def __init__(self, tables, pair_id):
+        self.tables = tables
+        self.pair_id = pair_id
+
+    @property
+    def number_of_repetitions(self):
+        return self.tables['numbers_of_repetitions'][self.pair_id]
+
+    @property
+    def probability(self):
+        return self.tables['pair_probabilities'][self.pair_id]
+
+    @property
+    def variance(self):
+        return self.tables['pair_variances'][self.pair_id]
+
+
+# --------------------------------------------------------------------------------------------------------
+# 2nd Level Structures
+
+class SharedQuery(Mapping):
+    """a query of a SharedHeadList"""
+    __slots__ = ('head_list', 'query_id')
+
+    def __init__(self, head_list, query_id):
+        self.head_list = head_list
+        self.query_id = query_id
+
+    def _statistic(self, name):
+        return self.head_list.tables[name][self.query_id]
+
+    number_of_urls = property(lambda self: self._statistic('numbers_of_urls'))
+    probability = property(lambda self: self._statistic('query_probabilities'))
+    variance = property(lambda self: self._statistic('query_variances'))
+    tau = property(lambda self: self._statistic('taus'))
+
+    @property
+    def number_of_unique_urls(self):
+        return len(self)
+
+    kappa_q = number_of_unique_urls
+
+    def _pair_ids(self):
+        pair_offsets = self.head_list.index.pair_offsets
+        return range(pair_offsets[self.query_id], pair_offsets[self.query_id + 1])
+
+    def __getitem__(self, url):
+        pair_id = self.head_list.index.find_url_pair_id(self.query_id, url)
+        if pair_id < 0:
+            return ZERO_URL_STATS
+        return SharedURLStats(self.head_list.tables, pair_id)
+
+    def __iter__(self):
+        url_str = self.head_list.index.url_str
+        return (url_str(pair_id) for pair_id in self._pair_ids())
+
+    def __len__(self):
+        return len(self._pair_ids())
+
+    def __contains__(self, url):
+        return self.head_list.index.find_url_pair_id(self.query_id, url) >= 0
+
+
+# --------------------------------------------------------------------------------------------------------
+# Top Level Structures
+
+class SharedHeadList(Mapping):
+    """a read only head list attached to a SharedHeadListBlock through its handle.  Like the views of
+    QueryCollection.frozen, missing queries and urls resolve to ZERO_QUERY and ZERO_URL_STATS."""
+    def __init__(self, handle):
+        name, layout, self.number_of_query_url_pairs, self.tau = handle
+        self.shared_memory = SharedMemory(name=name)
+        self.tables = {}
+        for table_name, typecode, offset, length in layout:
+            table = self.shared_memory.buf[offset:offset + length * array(typecode).itemsize]
+            self.tables[table_name] = table if typecode == 'B' else table.cast(typecode)
+        self.index = HeadListIndex.from_tables(**{name: self.tables[name] for name in HeadListIndex.TABLES})
+
+    @property
+    def number_of_queries(self):
+        return len(self)
+
+    def close(self):
+        self.index = None
+        for table in self.tables.values():
+            table.release()
+        self.tables = None
+        self.shared_memory.close()
+
+    def __getitem__(self, query_str):
+        query_id = self.index.find_query_id(query_str)
+        if query_id < 0:
+            return ZERO_QUERY
+        return SharedQuery(self, query_id)
+
+    def __iter__(self):
+        query_str = self.index.query_str
+        return (query_str(query_id) for query_id in range(self.index.number_of_queries))
+
+    def __len__(self):
+        return self.index.number_of_queries
+
+    def __contains__(self, query_str):
+        return self.index.find_query_id(query_str) >= 0
@@ -1,3 +1,7 @@
+from collections.abc import (
+    Mapping
+)
+
 from sortedcontainers import (
     SortedDict,
 )
@@ -17,3 +21,28 @@ class SortedDictOfLists(SortedDict):
             for value in self[key]:
                 yield key, value
 
+    def frozen(self):
+        return FrozenSortedDictOfLists(self)
+
+
+class FrozenSortedDictOfLists(Mapping):
+    """a read only view of a SortedDictOfLists.  Looking up a missing key returns an empty tuple rather
+    than adding an empty list to the underlying SortedDictOfLists"""
+    def __init__(self, sorted_dict_of_lists):
+        self.sorted_dict_of_lists = sorted_dict_of_lists
+
+    def iter_records(self):
+        return self.sorted_dict_of_lists.iter_records()
+
+    def __getitem__(self, key):
+        return self.sorted_dict_of_lists.get(key, ())
+
+    def __iter__(self):
+        return iter(self.sorted_dict_of_lists)
+
+    def __len__(self):
+        return len(self.sorted_dict_of_lists)
+
+    def __contains__(self, key):
+        return key in self.sorted_dict_of_lists
+
@@ -0,0 +1,731 @@
+# The header of in_memory_structures suggests that the mappings of mappings could be re-implemented
+# in a relational database.  This module is that implementation for SQLite, so that the Blender
+# algorithms can run on datasets that do not fit in memory.
+
+# Each collection is a pair of tables in a SQLite database file: one row per query holding the query
+# statistics and one row per unique <q, u> pair holding the url statistics.  All the collections of a
+# process share a single connection, so SQL statements can join the tables of one collection to those
+# of another.  Records are ingested with executemany and the steps of the algorithms are set based SQL
+# statements.  Where a step needs NumPy, for the Laplace noise or the shared formulas of Figure 5 and
+# Figure 7, rows are streamed through it in chunks and the results are applied with a single UPDATE.
+
+# The mapping interface is retained through lightweight view classes, SQLiteQuery and SQLiteURLStats,
+# that hold only a reference to the collection and their keys.  Each of their attribute accesses is a
+# SQL statement, so they are meant for inspection rather than for the algorithms.
+
+# The top level classes are intended to be injected together, replacing all four of the classes in
+# main.default_data_structures.  See main.sqlite_data_structures.  The set based algorithms expect the
+# other collections they are given to be SQLite backed too.
+
+from collections import (
+    Counter,
+    MutableMapping
+)
+from itertools import (
+    count
+)
+from math import (
+    exp
+)
+import sqlite3
+
+from configman import (
+    Namespace,
+    RequiredConfig,
+    class_converter,
+)
+from numpy import (
+    array,
+    float64,
+    nonzero,
+)
+from numpy.random import (
+    laplace
+)
+
+from blender.binary_records import (
+    BinaryRecords
+)
+from blender.file_support import (
+    BULK_LOAD_CHUNK_SIZE,
+    count_records,
+    iter_record_chunks,
+)
+from blender.in_memory_structures import (
+    QueryCollection
+)
+from blender.head_list import (
+    HeadList,
+    HeadListQuery,
+    SNAPSHOT_URL_COLUMNS,
+    read_snapshot,
+)
+from blender.client_structures import (
+    estimate_query_probabilities,
+    estimate_url_probabilities,
+)
+from blender.final_structures import (
+    blend_url_probabilities
+)
+
+
+# the number of rows read at a time when values are calculated with NumPy rather than in SQL
+SQL_CHUNK_SIZE = 100000
+
+# keyed by database file name, the connection shared by the collections of this process
+_connections = {}
+# used to give the tables of each collection unique names
+_table_numbers = count()
+
+
+def connect(database_file_name):
+    """the connection to a database file shared by all the collections of this process.  The database
+    is scratch space for a run, so it is neither journaled nor synced."""
+    try:
+        return _connections[database_file_name]
+    except KeyError:
+        connection = sqlite3.connect(database_file_name)
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        _connections[database_file_name] = connection
+        return connection
+
+
+def _pair_column(name):
+    """a property of a view reading and writing a column of the row of its <q, u> pair"""
+    def get_value(self):
+        return self.collection.execute(
+            'SELECT {} FROM {{pairs}} WHERE query = ? AND url = ?'.format(name),
+            (self.query_str, self.url_str)
+        ).fetchone()[0]
+
+    def set_value(self, value):
+        self.collection.execute(
+            'UPDATE {{pairs}} SET {} = ? WHERE query = ? AND url = ?'.format(name),
+            (value, self.query_str, self.url_str)
+        )
+    return property(get_value, set_value)
+
+
+def _query_column(name):
+    """a property of a view reading and writing a column of the row of its query"""
+    def get_value(self):
+        return self.collection.execute(
+            'SELECT {} FROM {{queries}} WHERE query = ?'.format(name),
+            (self.query_str,)
+        ).fetchone()[0]
+
+    def set_value(self, value):
+        self.collection.execute(
+            'UPDATE {{queries}} SET {} = ? WHERE query = ?'.format(name),
+            (value, self.query_str)
+        )
+    return property(get_value, set_value)
+
+
+# --------------------------------------------------------------------------------------------------------
+# 3rd Level Structures
+#     A view of a single url's stats - a row in the pair table of a SQLiteQueryCollection
+
+class SQLiteURLStats(object):
+    """A view of one <q, u> pair of a SQLiteQueryCollection presenting the same attributes as the
+    URLStats class of in_memory_structures."""
+    def __init__(self, collection, query_str, url_str):
+        self.collection = collection
+        self.query_str = query_str
+        self.url_str = url_str
+
+    number_of_repetitions = _pair_column('count')
+    probability = _pair_column('probability')
+    variance = _pair_column('variance')
+
+    def increment_count(self, amount=1):
+        self.number_of_repetitions += amount
+
+    def print(self, indent=0):
+        print('{}count={}'.format(' ' * indent, self.number_of_repetitions))
+        print("{}prob={}".format(' ' * indent, self.probability))
+        print("{}vari={}".format(' ' * indent, self.variance))
+
+
+class SQLiteFinalURLStats(SQLiteURLStats):
+    """the view used by SQLiteFinalQueryCollection, it adds the omega of Figure 7"""
+    omega = _pair_column('omega')
+
+
+# --------------------------------------------------------------------------------------------------------
+# 2nd Level Structures
+#     A view of a single query's stats and urls
+#     Mapping
+#         urls are the key
+#         3rd Level structure views as the value
+
+class SQLiteQuery(MutableMapping, RequiredConfig):
+    """A view of one query of a SQLiteQueryCollection presenting the same interface as the Query
+    classes of in_memory_structures and head_list."""
+    frozen_attributes = HeadListQuery.frozen_attributes
+
+    required_config = Namespace()
+    required_config.add_option(
+        name="url_stats_class",
+        default="blender.sqlite_structures.SQLiteURLStats",
+        from_string_converter=class_converter,
+        doc="dependency injection of a class to view the statistics of URLs"
+    )
+
+    def __init__(self, collection, query_str):
+        self.collection = collection
+        self.query_str = query_str
+
+    probability = _query_column('probability')
+    variance = _query_column('variance')
+    tau = _query_column('tau')
+
+    @property
+    def number_of_urls(self):
+        return self.collection.execute(
+            'SELECT COALESCE(SUM(count), 0) FROM {pairs} WHERE query = ?',
+            (self.query_str,)
+        ).fetchone()[0]
+
+    @property
+    def number_of_unique_urls(self):
+        return len(self)
+
+    @property
+    def kappa_q(self):
+        return self.number_of_unique_urls
+
+    def touch(self, url):
+        """add a url without incrementing the count - this is used to add the star url *"""
+        self.collection.touch_pair(self.query_str, url)
+
+    def add(self, url, amount=1):
+        self.collection.add((self.query_str, url), amount)
+
+    def print(self, indent):
+        print('{}tau={}'.format(' ' * indent, self.tau))
+        print('{}count={}'.format(' ' * indent, self.number_of_urls))
+        print('{}prob={}'.format(' ' * indent, self.probability))
+        print('{}vari={}'.format(' ' * indent, self.variance))
+        for url in self:
+            print('{}{}'.format(' ' * indent, url))
+            self[url].print(indent + 4)
+
+    def __getitem__(self, url):
+        self.collection.touch_pair(self.query_str, url)
+        return self.collection.config.url_stats_class(self.collection, self.query_str, url)
+
+    def __setitem__(self, url, item):
+        url_stats = self[url]
+        url_stats.number_of_repetitions = item.number_of_repetitions
+        url_stats.probability = item.probability
+        url_stats.variance = item.variance
+
+    def __delitem__(self, url):
+        if url not in self:
+            raise KeyError(url)
+        self.collection.execute('DELETE FROM {pairs} WHERE query = ? AND url = ?', (self.query_str, url))
+        self.collection.commit()
+
+    def __iter__(self):
+        url_rows = self.collection.execute(
+            'SELECT url FROM {pairs} WHERE query = ? ORDER BY rowid',
+            (self.query_str,)
+        ).fetchall()
+        for url_row in url_rows:
+            yield url_row[0]
+
+    def __len__(self):
+        return self.collection.execute(
+            'SELECT COUNT(*) FROM {pairs} WHERE query = ?',
+            (self.query_str,)
+        ).fetchone()[0]
+
+    def __contains__(self, url):
+        return self.collection.execute(
+            'SELECT 1 FROM {pairs} WHERE query = ? AND url = ?',
+            (self.query_str, url)
+        ).fetchone() is not None
+
+
+# --------------------------------------------------------------------------------------------------------
+# Top Level Structures -
+#    Mapping
+#        queries serve as the key
+#        2nd Level structure views as the value
+
+class SQLiteQueryCollection(QueryCollection):
+    """A SQLite implementation of QueryCollection.  Each unique <q, u> pair is a row in the pair table,
+    each query is a row in the query table.  Both tables iterate in the order rows were added."""
+    # other collections join against the tables directly
+    frozen_attributes = QueryCollection.frozen_attributes + ('pair_table', 'query_table')
+
+    required_config = Namespace()
+    required_config.add_option(
+        name="query_class",
+        default="blender.sqlite_structures.SQLiteQuery",
+        from_string_converter=class_converter,
+        doc="dependency injection of a class to view a mapping of URLs to URL stats"
+    )
+    required_config.add_option(
+        name="database_file_name",
+        default="",
+        doc="the SQLite database file for the tables of the collections.  The default, an empty string, "
+            "is a temporary file that is deleted when the process ends"
+    )
+
+    def __init__(self, config):
+        self.config = config
+        self.connection = connect(config.database_file_name)
+        table_number = next(_table_numbers)
+        self.query_table = 'queries_{}'.format(table_number)
+        self.pair_table = 'pairs_{}'.format(table_number)
+        for table in (self.query_table, self.pair_table):
+            self.connection.execute('DROP TABLE IF EXISTS {}'.format(table))
+        self.execute(
+            'CREATE TABLE {queries} ('
+            'query TEXT PRIMARY KEY, probability REAL DEFAULT 0.0, variance REAL DEFAULT 0.0, tau REAL DEFAULT 0.0'
+            ')'
+        )
+        self.execute(
+            'CREATE TABLE {pairs} ('
+            'query TEXT NOT NULL, url TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0, '
+            'probability REAL DEFAULT 0.0, variance REAL DEFAULT 0.0, omega REAL DEFAULT 0.0, '
+            'UNIQUE (query, url)'
+            ')'
+        )
+        self.number_of_query_url_pairs = 0
+
+    # the following methods run SQL against the tables of this collection.  In statements, {queries}
+    # and {pairs} stand for those tables.  The tables of other collections are passed as keywords.
+
+    def execute(self, statement, parameters=(), **other_tables):
+        return self.connection.execute(
+            statement.format(queries=self.query_table, pairs=self.pair_table, **other_tables),
+            parameters
+        )
+
+    def executemany(self, statement, parameter_iter, **other_tables):
+        return self.connection.executemany(
+            statement.format(queries=self.query_table, pairs=self.pair_table, **other_tables),
+            parameter_iter
+        )
+
+    def commit(self):
+        """commit the changes to the tables of the shared connection.  The methods that change the tables
+        as a whole commit when they finish.  Changes made a record at a time, such as 'add', are
+        committed by the next of them."""
+        self.connection.commit()
+
+    def fetch_value(self, statement, parameters=(), **other_tables):
+        return self.execute(statement, parameters, **other_tables).fetchone()[0]
+
+    def update_in_chunks(self, table, columns, statement, calculate, **other_tables):
+        """select rows of a rowid of 'table' followed by numeric values, calculate new values for the
+        'columns' of 'table' from the values with NumPy a chunk at a time and apply them with a single
+        UPDATE.  The new values are staged in a temporary table, so that 'table' is not changed while
+        it is being read."""
+        self.execute('DROP TABLE IF EXISTS temp.staged_values')
+        self.execute('CREATE TEMP TABLE staged_values (row INTEGER PRIMARY KEY, {})'.format(
+            ', '.join('{} REAL'.format(column) for column in columns)
+        ))
+        cursor = self.execute(statement, **other_tables)
+        while True:
+            rows = cursor.fetchmany(SQL_CHUNK_SIZE)
+            if not rows:
+                break
+            values = array([row[1:] for row in rows], dtype=float64)
+            self.executemany(
+                'INSERT INTO temp.staged_values VALUES (?{})'.format(', ?' * len(columns)),
+                zip(
+                    (row[0] for row in rows),
+                    *(new_values.tolist() for new_values in calculate(*values.T))
+                )
+            )
+        self.execute(
+            'UPDATE {table} SET {assignments} FROM temp.staged_values AS staged WHERE {table}.rowid = staged.row'.format(
+                table=table,
+                assignments=', '.join('{0} = staged.{0}'.format(column) for column in columns)
+            )
+        )
+        self.execute('DROP TABLE temp.staged_values')
+
+    def touch_pair(self, query_str, url_str):
+        """make sure that the <q, u> pair has a row without changing its count"""
+        self.execute('INSERT OR IGNORE INTO {queries} (query) VALUES (?)', (query_str,))
+        self.execute('INSERT OR IGNORE INTO {pairs} (query, url) VALUES (?, ?)', (query_str, url_str))
+
+    def append_star_values(self):
+        # from 1-3 of EstimateClientProbabilities Figure 5.
+        self.execute("INSERT OR IGNORE INTO {pairs} (query, url) SELECT query, '*' FROM {queries} ORDER BY rowid")
+        self.commit()
+
+    def add(self, q_u_tuple, amount=1):
+        """add a new <q, u> tuple to this collecton"""
+        self.add_counts({tuple(q_u_tuple): amount})
+
+    def add_counts(self, q_u_counter):
+        """add pre-aggregated <q, u> pairs from a mapping of (q, u) tuples to their number of
+        repetitions with one executemany for the queries and one for the pairs"""
+        self.executemany(
+            'INSERT OR IGNORE INTO {queries} (query) VALUES (?)',
+            ((query_str,) for query_str, url_str in q_u_counter)
+        )
+        self.executemany(
+            'INSERT INTO {pairs} (query, url, count) VALUES (?, ?, ?) '
+            'ON CONFLICT (query, url) DO UPDATE SET count = count + excluded.count',
+            ((query_str, url_str, amount) for (query_str, url_str), amount in q_u_counter.items())
+        )
+        self.number_of_query_url_pairs += sum(q_u_counter.values())
+
+    def load(self, file_name):
+        self.bulk_load(file_name)
+
+    def bulk_load(self, file_name, chunk_size=BULK_LOAD_CHUNK_SIZE, progress=None):
+        """like QueryCollection.bulk_load, but each chunk is added as it is parsed so that only one
+        chunk is ever in memory"""
+        for records in iter_record_chunks(file_name, chunk_size):
+            q_u_counter = Counter()
+            number_of_pairs = count_records(q_u_counter, records)
+            self.add_counts(q_u_counter)
+            if progress is not None:
+                progress.add(number_of_pairs)
+        self.commit()
+
+    def load_binary(self, file_name, progress=None):
+        """like QueryCollection.load_binary, but the unique pairs are added a chunk at a time"""
+        with BinaryRecords(file_name) as binary_records:
+            for q_u_counts in binary_records.iter_count_chunks():
+                self.add_counts(q_u_counts)
+                if progress is not None:
+                    progress.add(sum(q_u_counts.values()))
+        self.commit()
+
+    def subsume_those_not_present_in(self, other_query_collection):
+        """take all <q, u> records in this collection that are not in the other_query_url_mapping and
+        merge their statistics into this collection's <*, *> entry"""
+        self.touch_pair('*', '*')
+        self.execute('DROP TABLE IF EXISTS temp.subsumed_pairs')
+        self.execute(
+            "CREATE TEMP TABLE subsumed_pairs AS SELECT rowid AS row, query, count, probability FROM {pairs} "
+            "WHERE query != '*' AND NOT EXISTS ("
+            "SELECT 1 FROM {other_pairs} AS other WHERE other.query = {pairs}.query AND other.url = {pairs}.url"
+            ")",
+            other_pairs=other_query_collection.pair_table
+        )
+        subsumed_count, subsumed_probability = self.execute(
+            'SELECT COALESCE(SUM(count), 0), COALESCE(SUM(probability), 0.0) FROM temp.subsumed_pairs'
+        ).fetchone()
+        self.execute(
+            'UPDATE {queries} SET probability = {queries}.probability - subsumed.probability FROM ('
+            'SELECT query, SUM(probability) AS probability FROM temp.subsumed_pairs GROUP BY query'
+            ') AS subsumed WHERE {queries}.query = subsumed.query'
+        )
+        self.execute('DELETE FROM {pairs} WHERE rowid IN (SELECT row FROM temp.subsumed_pairs)')
+        # queries that lost all of their urls are removed
+        self.execute(
+            'DELETE FROM {queries} WHERE query IN (SELECT query FROM temp.subsumed_pairs) '
+            'AND NOT EXISTS (SELECT 1 FROM {pairs} WHERE {pairs}.query = {queries}.query)'
+        )
+        self.execute('DROP TABLE temp.subsumed_pairs')
+        self.execute(
+            "UPDATE {pairs} SET count = count + ?, probability = probability + ? WHERE query = '*' AND url = '*'",
+            (subsumed_count, subsumed_probability)
+        )
+        self.execute("UPDATE {queries} SET probability = probability + ? WHERE query = '*'", (subsumed_probability,))
+        self.commit()
+
+    def iter_records(self):
+        """an alternative iterator that returns unique <q, u> pairs"""
+        return iter(self.execute(
+            'SELECT {pairs}.query, {pairs}.url FROM {pairs} JOIN {queries} ON {queries}.query = {pairs}.query '
+            'ORDER BY {queries}.rowid, {pairs}.rowid'
+        ))
+
+    # this class implements the MuteableMapping Abstract Base Class.  These are the implementation of
+    # the required methods for that ABC.
+    def __getitem__(self, query_str):
+        self.execute('INSERT OR IGNORE INTO {queries} (query) VALUES (?)', (query_str,))
+        return self.config.query_class(self, query_str)
+
+    def __setitem__(self, query_str, a_query):
+        for url_str in a_query:
+            self[query_str][url_str] = a_query[url_str]
+
+    def __delitem__(self, query_str):
+        if query_str not in self:
+            raise KeyError(query_str)
+        self.execute('DELETE FROM {pairs} WHERE query = ?', (query_str,))
+        self.execute('DELETE FROM {queries} WHERE query = ?', (query_str,))
+        self.commit()
+
+    def __iter__(self):
+        for query_row in self.execute('SELECT query FROM {queries} ORDER BY rowid').fetchall():
+            yield query_row[0]
+
+    def __len__(self):
+        return self.fetch_value('SELECT COUNT(*) FROM {queries}')
+
+    def __contains__(self, query_str):
+        return self.execute('SELECT 1 FROM {queries} WHERE query = ?', (query_str,)).fetchone() is not None
+
+    def __getstate__(self, key_list=None):
+        # for use by jsonpickle
+        if key_list is None:
+            key_list = list()
+        key_list.append('connection')
+        return super(SQLiteQueryCollection, self).__getstate__(key_list)
+
+
+class SQLiteHeadList(SQLiteQueryCollection):
+    """the SQLite counterpart of blender.head_list.HeadList"""
+    frozen_attributes = SQLiteQueryCollection.frozen_attributes + ('tau',)
+    # the m most probable queries are selected by a query of the whole table, so HeadList's
+    # streaming_top_m doesn't apply
+    required_config = HeadList.required_config.safe_copy()
+    del required_config['streaming_top_m']
+
+    def __init__(self, config):
+        super(SQLiteHeadList, self).__init__(config)
+        self.tau = 0.0
+        self.k = 0
+        self.kappa = 0
+
+    def create_headlist(self, optin_database_s):
+        # Figure 3, line 6-7 were moved to configuration of this object
+        # from Figure 3, CreateHeadList, line 7
+        assert self.config.tau >= 1.0
+        cursor = optin_database_s.execute(
+            'SELECT {pairs}.query, {pairs}.url, {pairs}.count FROM {pairs} '
+            'JOIN {queries} ON {queries}.query = {pairs}.query ORDER BY {queries}.rowid, {pairs}.rowid'
+        )
+        while True:
+            rows = cursor.fetchmany(SQL_CHUNK_SIZE)
+            if not rows:
+                break
+            noisy_counts = array([row[2] for row in rows], dtype=float64) + laplace(0.0, self.config.b, size=len(rows))
+            self.add_counts({rows[i][:2]: 1 for i in nonzero(noisy_counts > self.config.tau)[0]})
+        self.add(('*', '*'))
+        self.commit()
+
+    def calculate_probabilities_relative_to(self, other_query_url_mapping, head_list=None):
+        # Figure 4: lines 10 - 12
+        number_of_pairs = other_query_url_mapping.number_of_query_url_pairs
+
+        def calculate_probabilities(other_counts):
+            y = laplace(0.0, self.config.b, size=len(other_counts))
+            return ((other_counts + y) / number_of_pairs,)
+
+        self.update_in_chunks(
+            self.pair_table,
+            ('probability',),
+            'SELECT {pairs}.rowid, COALESCE(other.count, 0) FROM {pairs} LEFT JOIN {other_pairs} AS other '
+            'ON other.query = {pairs}.query AND other.url = {pairs}.url',
+            calculate_probabilities,
+            other_pairs=other_query_url_mapping.pair_table
+        )
+        self.execute(
+            'UPDATE {queries} SET probability = {queries}.probability + totals.probability FROM ('
+            'SELECT query, SUM(probability) AS probability FROM {pairs} GROUP BY query'
+            ') AS totals WHERE {queries}.query = totals.query'
+        )
+        self.commit()
+
+    def subsume_entries_beyond_max_size(self):
+        # Figure 4: line 14
+        if '*' not in self:
+            self.add(('*', '*'))
+        # like HeadList, ties go to the query that was added first
+        self.execute('DROP TABLE IF EXISTS temp.subsumed_queries')
+        self.execute(
+            "CREATE TEMP TABLE subsumed_queries AS SELECT query FROM {queries} WHERE query != '*' "
+            "ORDER BY probability DESC, rowid LIMIT -1 OFFSET ?",
+            (self.config.m,)
+        )
+        subsumed_count, subsumed_probability = self.execute(
+            'SELECT COALESCE(SUM(count), 0), COALESCE(SUM(probability), 0.0) FROM {pairs} '
+            'WHERE query IN (SELECT query FROM temp.subsumed_queries)'
+        ).fetchone()
+        self.execute('DELETE FROM {pairs} WHERE query IN (SELECT query FROM temp.subsumed_queries)')
+        self.execute('DELETE FROM {queries} WHERE query IN (SELECT query FROM temp.subsumed_queries)')
+        self.execute('DROP TABLE temp.subsumed_queries')
+        # like HeadListQuery.subsume, only the probabilities move to <*, *>
+        self.execute(
+            "UPDATE {pairs} SET probability = probability + ? WHERE query = '*' AND url = '*'",
+            (subsumed_probability,)
+        )
+        self.execute("UPDATE {queries} SET probability = probability + ? WHERE query = '*'", (subsumed_probability,))
+        self.number_of_query_url_pairs -= subsumed_count
+        self.commit()
+
+    def calculate_variance_relative_to(self, other_query_url_mapping):
+        """This is part of the algorithm from the Blender paper, Figure 4"""
+        # Figure 4: line 15 & 13
+        number_of_pairs = other_query_url_mapping.number_of_query_url_pairs
+        self.execute(
+            'UPDATE {pairs} SET variance = (probability * (1.0 - probability)) / (:n - 1.0) '
+            '+ (2.0 * :b * :b) / (:n * (:n - 1.0))',
+            {'n': number_of_pairs, 'b': self.config.b}
+        )
+        self.commit()
+
+    def calculate_tau(self):
+        """from Figure 6 LocalAlg, lines 4-6"""
+        self.kappa = self.number_of_queries
+        self.tau = (
+            (exp(self.config.epsilon_prime_q) + (self.config.delta_prime_q / 2.0) * (self.number_of_query_url_pairs - 1))
+            /
+            (exp(self.config.epsilon_prime_q) + self.number_of_query_url_pairs - 1)
+        )
+        self.execute(
+            'UPDATE {queries} SET tau = (:e + (:delta / 2.0) * (totals.count - 1.0)) / (:e + totals.count - 1.0) '
+            'FROM (SELECT query, SUM(count) AS count FROM {pairs} GROUP BY query) AS totals '
+            'WHERE {queries}.query = totals.query',
+            {'e': exp(self.config.epsilon_prime_u), 'delta': self.config.delta_prime_u}
+        )
+        self.commit()
+
+    def print(self, indent=0):
+        print('{}config.tau={}'.format(' ' * indent, self.config.tau))
+        print('{}tau={}'.format(' ' * indent, self.tau))
+        super(SQLiteHeadList, self).print(indent)
+
+    # the snapshot and the artifact are written through the mapping interface shared with HeadList
+    save_snapshot = HeadList.save_snapshot
+    export_for_client_distribution = HeadList.export_for_client_distribution
+
+    def load_snapshot(self, file_name):
+        """restore a head_list written by save_snapshot into this empty head_list.  The number of urls of
+        each query is the sum of the counts of its pairs, as everywhere in this class."""
+        (self.tau, self.k, self.kappa), self.number_of_query_url_pairs, columns = read_snapshot(file_name)
+        query_strs = columns['query_strs']
+        self.executemany(
+            'INSERT INTO {queries} (query, probability, variance, tau) VALUES (?, ?, ?, ?)',
+            zip(
+                query_strs,
+                *(columns[name].tolist() for name in ('query_probabilities', 'query_variances', 'taus'))
+            )
+        )
+        self.executemany(
+            'INSERT INTO {pairs} (query, url, count, probability, variance) VALUES (?, ?, ?, ?, ?)',
+            zip(
+                (query_strs[query_number] for query_number in columns['url_query_numbers'].tolist()),
+                columns['url_strs'],
+                *(columns[name].tolist() for name in SNAPSHOT_URL_COLUMNS)
+            )
+        )
+        self.commit()
+
+
+class SQLiteClientQueryCollection(SQLiteQueryCollection):
+    """the SQLite counterpart of blender.client_structures.ClientQueryCollection"""
+
+    def calculate_probabilities(self, head_list):
+        """This is from the Blender paper, Figure 4"""
+
+        assert head_list.number_of_queries >= self.number_of_queries
+
+        # we want the client probabilities calcualated relative to itself.
+        self.calculate_probabilities_relative_to(self, head_list=head_list)
+
+    def calculate_probabilities_relative_to(self, other_query_url_mapping, head_list=None):
+        """This is from the Blender paper, Figure 5, lines 9 - 17"""
+        # from Figure 5, line 14 - every <q, u> of the head_list for the queries in this collection
+        # gets an estimate, even those that no client reported
+        self.execute(
+            'INSERT OR IGNORE INTO {pairs} (query, url) SELECT head.query, head.url FROM {head_pairs} AS head '
+            'JOIN {queries} ON {queries}.query = head.query ORDER BY {queries}.rowid, head.rowid',
+            head_pairs=head_list.pair_table
+        )
+        number_of_pairs = other_query_url_mapping.number_of_query_url_pairs
+
+        # from Figure 5, lines 11 - 13
+        self.update_in_chunks(
+            self.query_table,
+            ('probability', 'variance'),
+            'SELECT {queries}.rowid, COALESCE(('
+            'SELECT SUM(count) FROM {other_pairs} AS other WHERE other.query = {queries}.query'
+            '), 0) FROM {queries}',
+            lambda other_counts: estimate_query_probabilities(
+                other_counts / number_of_pairs,
+                number_of_pairs,
+                head_list
+            ),
+            other_pairs=other_query_url_mapping.pair_table
+        )
+
+        # from Figure 5, lines 15 - 17
+        self.update_in_chunks(
+            self.pair_table,
+            ('probability', 'variance'),
+            'SELECT {pairs}.rowid, COALESCE(other.count, 0), '
+            'COALESCE(other_query.probability, 0.0), COALESCE(other_query.variance, 0.0), '
+            'head_query.tau, head_query.probability, head_query.variance, head_urls.k '
+            'FROM {pairs} '
+            'JOIN {head_pairs} AS head ON head.query = {pairs}.query AND head.url = {pairs}.url '
+            'JOIN {head_queries} AS head_query ON head_query.query = {pairs}.query '
+            'JOIN (SELECT query, COUNT(*) AS k FROM {head_pairs} GROUP BY query) AS head_urls '
+            'ON head_urls.query = {pairs}.query '
+            'LEFT JOIN {other_pairs} AS other ON other.query = {pairs}.query AND other.url = {pairs}.url '
+            'LEFT JOIN {other_queries} AS other_query ON other_query.query = {pairs}.query',
+            lambda other_counts, *values: estimate_url_probabilities(
+                other_counts / number_of_pairs,
+                *values,
+                number_of_pairs,
+                head_list
+            ),
+            head_pairs=head_list.pair_table,
+            head_queries=head_list.query_table,
+            other_pairs=other_query_url_mapping.pair_table,
+            other_queries=other_query_url_mapping.query_table
+        )
+        self.commit()
+
+
+class SQLiteFinalQueryCollection(SQLiteQueryCollection):
+    """the SQLite counterpart of blender.final_structures.FinalQueryCollection"""
+
+    def calculate_probability_relative_to(self, client_probabilities, optin_probabilities):
+        self.execute(
+            'INSERT OR IGNORE INTO {queries} (query) SELECT query FROM {optin_queries} ORDER BY rowid',
+            optin_queries=optin_probabilities.query_table
+        )
+        self.execute(
+            'INSERT OR IGNORE INTO {pairs} (query, url) SELECT optin.query, optin.url FROM {optin_pairs} AS optin '
+            'JOIN {optin_queries} AS optin_query ON optin_query.query = optin.query '
+            'ORDER BY optin_query.rowid, optin.rowid',
+            optin_pairs=optin_probabilities.pair_table,
+            optin_queries=optin_probabilities.query_table
+        )
+        # from Figure 7, line 3
+        self.update_in_chunks(
+            self.pair_table,
+            ('omega', 'probability'),
+            'SELECT {pairs}.rowid, optin.probability, optin.variance, '
+            'COALESCE(client.probability, 0.0), COALESCE(client.variance, 0.0) FROM {pairs} '
+            'JOIN {optin_pairs} AS optin ON optin.query = {pairs}.query AND optin.url = {pairs}.url '
+            'LEFT JOIN {client_pairs} AS client ON client.query = {pairs}.query AND client.url = {pairs}.url',
+            blend_url_probabilities,
+            optin_pairs=optin_probabilities.pair_table,
+            client_pairs=client_probabilities.pair_table
+        )
+        self.commit()
+
+    def iter_records(self):
+        # highest probability first within each query, ties in the order that they were added
+        return iter(self.execute(
+            'SELECT {pairs}.query, {pairs}.url FROM {pairs} JOIN {queries} ON {queries}.query = {pairs}.query '
+            'ORDER BY {queries}.rowid, {pairs}.probability DESC, {pairs}.rowid'
+        ))
+
+    def write(self, filename):
+        with open(filename, encoding='utf-8', mode="w") as f:
+            for query, url, probability in self.execute(
+                'SELECT {pairs}.query, {pairs}.url, {pairs}.probability FROM {pairs} '
+                'JOIN {queries} ON {queries}.query = {pairs}.query '
+                'ORDER BY {queries}.rowid, {pairs}.probability DESC, {pairs}.rowid'
+            ):
+                if url == '*' and probability == 0:
+                    continue
+                f.write('{} {} {}\n'.format(query, url, probability))
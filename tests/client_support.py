@@ -1,39 +1,327 @@
+from functools import (
+    partial
+)
+from itertools import (
+    islice
+)
 from math import (
     exp
 )
+from multiprocessing import (
+    Pool
+)
+from multiprocessing.util import (
+    Finalize
+)
 
+from numpy import (
+    arange,
+    array,
+    argsort,
+    bincount,
+    diff,
+    float64,
+    frombuffer,
+    full,
+    int64,
+    nonzero,
+    repeat,
+    searchsorted,
+    str_,
+    unique,
+    where,
+    zeros,
+)
 from numpy.random import (
     random,
-    choice,
+    default_rng,
+    SeedSequence,
 )
 
+from blender.head_list_index import (
+    HeadListIndex
+)
+from blender.shared_head_list import (
+    SharedHeadList,
+    SharedHeadListBlock,
+)
+from blender.binary_records import (
+    find_record_ranges,
+    iter_file_records,
+)
 
-def local_alg(config, head_list, local_query_url_iter):
-    """to be used in testing as in production, it will be executed by the client.  It should, therefore,
-    be written in Javascript or, even better, Rust"""
-    tau = (
+
+# the number of client records randomized together by batch_local_alg
+LOCAL_ALG_BLOCK_SIZE = 100000
+
+
+class HeadListSampler(object):
+    """Tables built once from a head_list so that the random replacements of local_alg cost
+    constant time per report rather than rebuilding lists of the head_list keys each time.  The keys
+    are held in a compact HeadListIndex and the values in arrays, so that the sampler stays small when
+    it is copied to the worker processes of sharded_local_alg."""
+    def __init__(self, head_list):
+        if isinstance(head_list, SharedHeadList):
+            # the index and the taus are read in place from the shared memory
+            self.index = head_list.index
+            self.tau_array = frombuffer(head_list.tables['taus'], dtype=float64)
+        else:
+            self.index = HeadListIndex(head_list)
+            # the tau calculated for each query in Figure 6, LocalAlg, line 6
+            self.tau_array = array([head_list[query_str].tau for query_str in head_list.keys()])
+
+        # the <q, u> pairs of the head_list have consecutive ids query by query.  The pairs of a query
+        # start at its 'pair_offsets' entry.
+        offsets = array(self.index.pair_offsets, dtype=int64)
+        self.pair_offsets = offsets[:-1]
+        self.numbers_of_urls = diff(offsets)
+        self.pair_query_ids = repeat(arange(len(self.numbers_of_urls), dtype=int64), self.numbers_of_urls)
+
+        # the keys as sorted numpy arrays, so that a whole block of client records is looked up with
+        # numpy.searchsorted, see find_pair_ids.  The urls are numbered in the sorted table of the
+        # distinct urls and a pair key combines the query id and that url number in one integer.
+        self.sorted_query_ids = array(self.index.query_order, dtype=int64)
+        self.sorted_query_strs = array(
+            [self.index.query_str(query_id) for query_id in self.sorted_query_ids.tolist()],
+            dtype=str_
+        )
+        pair_url_strs = array([self.index.url_str(pair_id) for pair_id in range(self.index.number_of_pairs)], dtype=str_)
+        self.sorted_url_strs = unique(pair_url_strs)
+        pair_keys = self.pair_query_ids * len(self.sorted_url_strs) + searchsorted(self.sorted_url_strs, pair_url_strs)
+        self.sorted_pair_ids = argsort(pair_keys)
+        self.sorted_pair_keys = pair_keys[self.sorted_pair_ids]
+        # the pair that reports a url of each query that is not in the head_list
+        self.star_pair_ids = array(
+            [self.index.find_url_pair_id(query_id, '*') for query_id in range(self.index.number_of_queries)],
+            dtype=int64
+        )
+
+    @staticmethod
+    def _search(sorted_keys, keys):
+        """the positions of the keys in the sorted keys, or -1 for the keys that are not there"""
+        if not len(sorted_keys):
+            return full(len(keys), -1, dtype=int64)
+        positions = searchsorted(sorted_keys, keys).clip(0, len(sorted_keys) - 1)
+        return where(sorted_keys[positions] == keys, positions, -1)
+
+    # the tables of keys and values in the form of lists and dictionaries
+    @property
+    def query_strs(self):
+        return [self.index.query_str(query_id) for query_id in range(self.index.number_of_queries)]
+
+    @property
+    def url_strs(self):
+        pair_offsets = self.index.pair_offsets
+        return {
+            query_str: [self.index.url_str(pair_id) for pair_id in range(pair_offsets[query_id], pair_offsets[query_id + 1])]
+            for query_id, query_str in enumerate(self.query_strs)
+        }
+
+    @property
+    def taus(self):
+        return dict(zip(self.query_strs, self.tau_array.tolist()))
+
+    @property
+    def q_u_pairs(self):
+        return [(query_str, url_str) for query_str, url_strs in self.url_strs.items() for url_str in url_strs]
+
+    def choose_query(self):
+        return self.index.query_str(int(random() * self.index.number_of_queries))
+
+    def choose_url(self, query_str):
+        return self.choose_pair_url(self.index.find_query_id(query_str))
+
+    def choose_pair_url(self, query_id):
+        pair_offsets = self.index.pair_offsets
+        first_pair_id = pair_offsets[query_id]
+        return self.index.url_str(first_pair_id + int(random() * (pair_offsets[query_id + 1] - first_pair_id)))
+
+    def find_pair_id(self, query_str, url_str):
+        """the id of the head_list <q, u> pair that a client reports for a <q, u> pair.  Queries and urls
+        not in the head_list are reported as '*'"""
+        return self.index.find_pair_id(query_str, url_str)
+
+    def find_pair_ids(self, query_strs, url_strs):
+        """the vectorized find_pair_id of the <q, u> pairs of a block of client records given as a
+        sequence of queries and a sequence of urls"""
+        if not len(query_strs):
+            return zeros(0, dtype=int64)
+        positions = self._search(self.sorted_query_strs, array(query_strs, dtype=str_))
+        missing = nonzero(positions < 0)[0]
+        if len(missing) and self.index.star_query_id < 0:
+            # there is no '*' query to report the queries that are not in the head_list
+            raise KeyError((query_strs[missing[0]], url_strs[missing[0]]))
+        query_ids = where(positions < 0, self.index.star_query_id, self.sorted_query_ids[positions])
+        url_numbers = self._search(self.sorted_url_strs, array(url_strs, dtype=str_))
+        # a url that is in no pair of the head_list is in no pair of the query either
+        positions = self._search(self.sorted_pair_keys, query_ids * len(self.sorted_url_strs) + url_numbers)
+        positions[url_numbers < 0] = -1
+        pair_ids = where(positions < 0, self.star_pair_ids[query_ids], self.sorted_pair_ids[positions])
+        missing = nonzero(pair_ids < 0)[0]
+        if len(missing):
+            raise KeyError((query_strs[missing[0]], url_strs[missing[0]]))
+        return pair_ids
+
+    def randomize(self, pair_ids, tau, rng=None):
+        """the vectorized form of the randomization in local_alg applied to an array of pair ids.  The
+        random numbers come from the numpy.random.Generator 'rng' if one is given"""
+        draw = random if rng is None else rng.random
+        n = len(pair_ids)
+        query_ids = self.pair_query_ids[pair_ids]
+        # report a random <q, u> pair from anywhere in the head_list
+        replace_query = draw(n) <= (1 - tau)
+        # report the same query with a random url
+        replace_url = ~replace_query & (draw(n) <= (1 - self.tau_array[query_ids]))
+        query_ids = where(replace_query, (draw(n) * self.index.number_of_queries).astype(int64), query_ids)
+        random_pair_ids = self.pair_offsets[query_ids] + (draw(n) * self.numbers_of_urls[query_ids]).astype(int64)
+        return where(replace_query | replace_url, random_pair_ids, pair_ids)
+
+
+def calculate_tau(config, head_list):
+    return (
         (exp(config.epsilon_prime_q) + (config.delta_prime_q / 2.0) * (head_list.number_of_query_url_pairs - 1))
         /
         (exp(config.epsilon_prime_q) + head_list.number_of_query_url_pairs - 1)
     )
+
+
+def local_alg(config, head_list, local_query_url_iter):
+    """to be used in testing as in production, it will be executed by the client.  It should, therefore,
+    be written in Javascript or, even better, Rust"""
+    tau = calculate_tau(config, head_list)
+    sampler = HeadListSampler(head_list)
+    index = sampler.index
     for a_query, a_url in local_query_url_iter():
-        if a_query not in head_list:
-            a_query = '*'
-        if a_url not in head_list[a_query]:
-            a_url = '*'
+        # queries and urls not in the head_list become '*'
+        query_id, pair_id = index.find_report_ids(a_query, a_url)
 
         if random() <= (1 - tau):
             # there is confusion on the significance of a database structure has only unqiue <q, u> pairs
             # or duplicates.  Some code clearly allows duplicates.  the definiton of |D| is for unique or
             # with duplicates?
-            alt_query = choice(list(head_list.keys()))
-            alt_url = choice(list(head_list[alt_query].keys()))
+            alt_query = sampler.choose_query()
+            alt_url = sampler.choose_url(alt_query)
             yield alt_query, alt_url
             continue
 
-        if random() <= (1 - head_list[a_query].tau):
-            alt_url = choice(list(head_list[a_query].keys()))
-            yield a_query, alt_url
+        if random() <= (1 - sampler.tau_array[query_id]):
+            alt_url = sampler.choose_pair_url(query_id)
+            yield index.query_str(query_id), alt_url
             continue
 
-        yield a_query, a_url
+        yield index.query_str(query_id), index.url_str(pair_id)
+
+
+def count_reports(sampler, tau, local_query_url_records, block_size=LOCAL_ALG_BLOCK_SIZE, rng=None, progress=None):
+    """map client records to the pair ids of the sampler and randomize them in blocks, then count the
+    resulting reports in an array indexed by pair id.  The number of records of each block is added to
+    'progress', if given"""
+    pair_counts = zeros(sampler.index.number_of_pairs, dtype=int64)
+    while True:
+        records = list(islice(local_query_url_records, block_size))
+        if not records:
+            break
+        query_strs, url_strs = zip(*records)
+        pair_ids = sampler.find_pair_ids(query_strs, url_strs)
+        pair_counts += bincount(sampler.randomize(pair_ids, tau, rng), minlength=len(pair_counts))
+        if progress is not None:
+            progress.add(len(pair_ids))
+    return pair_counts
+
+
+def _as_q_u_counts(index, pair_counts):
+    """the counts of an array indexed by the pair ids of a HeadListIndex as a mapping of <q, u> pairs
+    to counts.  Only the keys of the pairs that were reported are decoded"""
+    pair_ids = nonzero(pair_counts)[0]
+    # the query of a pair is the last one whose pairs begin at or before it
+    query_ids = searchsorted(array(index.pair_offsets, dtype=int64), pair_ids, side='right') - 1
+    query_strs = {}
+    q_u_counts = {}
+    for query_id, pair_id in zip(query_ids.tolist(), pair_ids.tolist()):
+        if query_id not in query_strs:
+            query_strs[query_id] = index.query_str(query_id)
+        q_u_counts[(query_strs[query_id], index.url_str(pair_id))] = int(pair_counts[pair_id])
+    return q_u_counts
+
+
+def batch_local_alg(config, head_list, local_query_url_iter, block_size=LOCAL_ALG_BLOCK_SIZE, progress=None):
+    """a vectorized local_alg for simulating a whole client population.  The client records are mapped
+    to head_list pair ids and randomized in blocks of 'block_size'.  Rather than yielding each report,
+    the reports are counted and returned as a mapping of <q, u> pairs to counts suitable for the
+    'add_counts' method of a ClientQueryCollection.  The head_list must already have its star values."""
+    sampler = HeadListSampler(head_list)
+    pair_counts = count_reports(
+        sampler,
+        calculate_tau(config, head_list),
+        local_query_url_iter(),
+        block_size,
+        progress=progress
+    )
+    return _as_q_u_counts(sampler.index, pair_counts)
+
+
+# the sampler, tau, block size and progress counter shared by the worker processes of sharded_local_alg
+_shard_worker_context = None
+
+
+def _initialize_shard_worker(head_list_handle, tau, block_size, progress):
+    global _shard_worker_context
+    shared_head_list = SharedHeadList(head_list_handle)
+    _shard_worker_context = (HeadListSampler(shared_head_list), tau, block_size, progress)
+    # the sampler holds views of the shared memory, which must be released before the worker detaches
+    Finalize(None, _finalize_shard_worker, args=(shared_head_list,), exitpriority=10)
+
+
+def _finalize_shard_worker(shared_head_list):
+    global _shard_worker_context
+    _shard_worker_context = None
+    shared_head_list.close()
+
+
+def _count_shard_reports(file_name, start, end, seed_sequence):
+    sampler, tau, block_size, progress = _shard_worker_context
+    return count_reports(
+        sampler,
+        tau,
+        iter_file_records(file_name, start, end),
+        block_size,
+        default_rng(seed_sequence),
+        progress
+    )
+
+
+def sharded_local_alg(
+    config,
+    head_list,
+    file_name,
+    number_of_workers,
+    seed=None,
+    block_size=LOCAL_ALG_BLOCK_SIZE,
+    progress=None
+):
+    """batch_local_alg spread over a pool of processes.  The client file, JSON or compiled, is split
+    into one range per worker and each range is randomized with its own numpy.random.Generator spawned
+    from 'seed'.  The head_list is published once into shared memory, from which each worker builds its
+    sampler.  Only the sorted key arrays of find_pair_ids are built in each worker, so the records of
+    every block are looked up and randomized by numpy.  The workers return partial counts that are
+    summed.  For a given
+    seed and number of workers, the result is reproducible.  The workers add the records of each block
+    to 'progress', which must be shareable between processes, such as an
+    instrumentation.ProgressCounter."""
+    index = HeadListIndex(head_list)
+    tau = calculate_tau(config, head_list)
+    record_ranges = find_record_ranges(file_name, number_of_workers)
+    seed_sequences = SeedSequence(seed).spawn(len(record_ranges))
+    with SharedHeadListBlock(head_list, index) as head_list_block, Pool(
+        processes=number_of_workers,
+        initializer=_initialize_shard_worker,
+        initargs=(head_list_block.handle, tau, block_size, progress)
+    ) as pool:
+        partial_counts = pool.starmap(
+            partial(_count_shard_reports, file_name),
+            [(start, end, seed_sequence) for (start, end), seed_sequence in zip(record_ranges, seed_sequences)]
+        )
+        # let the workers exit normally and release their views of the block before it is unlinked
+        pool.close()
+        pool.join()
+    return _as_q_u_counts(index, sum(partial_counts, zeros(index.number_of_pairs, dtype=int64)))
@@ -2,9 +2,7 @@ from functools import partial
 
 
 def load_synthetic_data_set(data_set, db):
-    for q, u, c in data_set:
-        for i in range(c):
-            db.add((q, u))
+    db.add_many(data_set)
     return db
 
 
@@ -0,0 +1,333 @@
+from unittest import TestCase
+from mock import (
+    patch
+)
+import os
+import pickle
+import tempfile
+
+from configman import (
+    configuration,
+)
+from configman.config_exceptions import (
+    CannotConvertError
+)
+from configman.dotdict import (
+    DotDict
+)
+
+from blender.array_structures import (
+    ArrayURLStats,
+    ArrayFinalURLStats,
+    ArrayQuery,
+    ArrayQueryCollection,
+    ArrayHeadList,
+    ArrayClientQueryCollection,
+    ArrayFinalQueryCollection,
+)
+from blender.in_memory_structures import (
+    URLStats,
+    SlottedURLStats,
+)
+from blender.main import (
+    required_config,
+    default_data_structures,
+    array_data_structures,
+    create_preliminary_headlist,
+    estimate_optin_probabilities,
+    estimate_client_probabilities,
+    blend_probabilities,
+)
+
+from blender.tests.synthetic_data import (
+    standard_constants,
+    load_small_data
+)
+
+
+def run_pipeline(data_structures):
+    config = configuration(
+        definition_source=required_config,
+        values_source_list=[
+            data_structures,
+            standard_constants,
+            {"head_list_db.m": 2},
+        ]
+    )
+    optin_database_s = load_small_data(config.optin_db.optin_db_class(config.optin_db))
+    optin_database_t = load_small_data(config.optin_db.optin_db_class(config.optin_db))
+    head_list = create_preliminary_headlist(config, optin_database_s)
+    head_list = estimate_optin_probabilities(head_list, optin_database_t)
+    client_database = config.client_db.client_db_class(config.client_db)
+    for query_str, url_str in head_list.iter_records():
+        client_database.add((query_str, url_str), 10)
+    client_database.add(('q4', 'q4u1'), 90)
+    client_stats = estimate_client_probabilities(config, head_list, client_database)
+    final_stats = blend_probabilities(config, head_list, client_stats)
+    return head_list, client_stats, final_stats
+
+
+def snapshot_round_trip(head_list):
+    """a new head_list of the same class restored from a snapshot of 'head_list'"""
+    handle, file_name = tempfile.mkstemp(suffix='.npz')
+    os.close(handle)
+    try:
+        head_list.save_snapshot(file_name)
+        restored = type(head_list)(head_list.config)
+        restored.load_snapshot(file_name)
+    finally:
+        os.unlink(file_name)
+    return restored
+
+
+def assert_same_head_list(test_case, expected, actual):
+    test_case.assertEqual(actual.number_of_query_url_pairs, expected.number_of_query_url_pairs)
+    test_case.assertEqual((actual.tau, actual.k, actual.kappa), (expected.tau, expected.k, expected.kappa))
+    test_case.assertEqual(list(actual.keys()), list(expected.keys()))
+    for query_str in expected:
+        for name in ('number_of_urls', 'probability', 'variance', 'tau', 'kappa_q'):
+            test_case.assertEqual(getattr(actual[query_str], name), getattr(expected[query_str], name))
+        test_case.assertEqual(list(actual[query_str].keys()), list(expected[query_str].keys()))
+        for url_str in expected[query_str]:
+            for name in ('number_of_repetitions', 'probability', 'variance'):
+                test_case.assertEqual(
+                    getattr(actual[query_str][url_str], name),
+                    getattr(expected[query_str][url_str], name)
+                )
+
+
+class TestArrayQueryCollection(TestCase):
+
+    def _create_collection(self):
+        config = DotDict()
+        config.url_stats_class = ArrayURLStats
+        config.query_class = ArrayQuery
+        return ArrayQueryCollection(config)
+
+    def test_add(self):
+        a_query_collection = self._create_collection()
+        a_query_collection.add(('a_query', 'a_url'))
+        a_query_collection.add(('a_query', 'a_url'))
+        a_query_collection.add(('a_query', 'another_url'), 3)
+
+        self.assertTrue('a_query' in a_query_collection)
+        self.assertTrue('a_url' in a_query_collection['a_query'])
+        self.assertTrue('no_url' not in a_query_collection['a_query'])
+        self.assertEqual(a_query_collection.number_of_query_url_pairs, 5)
+        self.assertEqual(a_query_collection['a_query'].number_of_urls, 5)
+        self.assertEqual(a_query_collection['a_query'].number_of_unique_urls, 2)
+        self.assertEqual(a_query_collection['a_query']['a_url'].number_of_repetitions, 2)
+        self.assertEqual(a_query_collection['a_query']['another_url'].number_of_repetitions, 3)
+        self.assertEqual(
+            list(a_query_collection.iter_records()),
+            [('a_query', 'a_url'), ('a_query', 'another_url')]
+        )
+
+    def test_growth(self):
+        a_query_collection = self._create_collection()
+        for i in range(1000):
+            a_query_collection.add(('q{}'.format(i % 7), 'u{}'.format(i)))
+
+        self.assertEqual(a_query_collection.number_of_queries, 7)
+        self.assertEqual(a_query_collection.number_of_pairs, 1000)
+        self.assertEqual(a_query_collection['q3'].number_of_urls, 143)
+        self.assertEqual(list(a_query_collection['q0'])[:3], ['u0', 'u7', 'u14'])
+
+    def test_delitem(self):
+        a_query_collection = self._create_collection()
+        a_query_collection.add(('q1', 'u1'))
+        a_query_collection.add(('q1', 'u2'))
+        a_query_collection.add(('q2', 'u1'))
+
+        del a_query_collection['q1']['u1']
+        self.assertEqual(list(a_query_collection['q1']), ['u2'])
+        del a_query_collection['q1']
+        self.assertTrue('q1' not in a_query_collection)
+        self.assertEqual(list(a_query_collection.iter_records()), [('q2', 'u1')])
+        self.assertEqual(a_query_collection['q2']['u1'].number_of_repetitions, 1)
+
+    def test_remove_pairs(self):
+        a_query_collection = self._create_collection()
+        for i in range(10):
+            a_query_collection.add(('q{}'.format(i % 3), 'u{}'.format(i)))
+
+        with patch.object(a_query_collection, 'compact', wraps=a_query_collection.compact) as compact:
+            a_query_collection.remove_pairs([('q0', 'u0'), ('q1', 'u1'), ('q0', 'u3'), ('q9', 'u0')])
+            self.assertEqual(compact.call_count, 1)
+            a_query_collection['q2'].clear()
+            self.assertEqual(compact.call_count, 2)
+        self.assertEqual(list(a_query_collection['q0']), ['u6', 'u9'])
+        self.assertEqual(list(a_query_collection['q1']), ['u4', 'u7'])
+        self.assertTrue('q2' not in a_query_collection)
+        self.assertEqual(a_query_collection.number_of_pairs, 4)
+
+        a_query_collection.clear()
+        self.assertEqual(len(a_query_collection), 0)
+        self.assertEqual(a_query_collection.number_of_pairs, 0)
+        a_query_collection.add(('q1', 'u1'))
+        self.assertEqual(list(a_query_collection.iter_records()), [('q1', 'u1')])
+
+    def test_getstate(self):
+        a_query_collection = self._create_collection()
+        another_query_collection = self._create_collection()
+        another_query_collection.add(('q9', 'not_in_the_state'))
+        a_query_collection.add(('q1', 'u2'))
+        a_query_collection.add(('q1', 'u1'))
+        a_query_collection.add(('q2', 'u2'), 3)
+
+        state = a_query_collection.__getstate__()
+        self.assertTrue('vocabulary' not in state)
+        self.assertEqual(sorted(state['url_strs']), ['u1', 'u2'])
+
+        restored = pickle.loads(pickle.dumps(a_query_collection))
+        restored.config = a_query_collection.config
+        self.assertEqual(list(restored.iter_records()), list(a_query_collection.iter_records()))
+        self.assertEqual(restored['q2']['u2'].number_of_repetitions, 3)
+        self.assertEqual(restored.find_pair_row('q1', 'u1', create=False), 1)
+        self.assertEqual(list(restored.rows_in(a_query_collection)), [0, 1, 2])
+
+    def test_shared_vocabulary(self):
+        a_query_collection = self._create_collection()
+        another_query_collection = self._create_collection()
+        a_query_collection.add(('q1', 'u1'))
+        a_query_collection.add(('q2', 'u2'))
+        another_query_collection.add(('q2', 'u2'))
+        another_query_collection.add(('q3', 'u1'))
+
+        # url ids come from the process wide vocabulary, query ids are local to each collection
+        self.assertTrue(a_query_collection.vocabulary is another_query_collection.vocabulary)
+        self.assertEqual(a_query_collection.find_url_id('u1'), another_query_collection.find_url_id('u1'))
+        self.assertEqual(a_query_collection.find_query_id('q2'), 1)
+        self.assertEqual(another_query_collection.find_query_id('q2'), 0)
+        self.assertEqual(list(a_query_collection.query_ids_in(another_query_collection)), [-1, 0])
+        self.assertEqual(list(a_query_collection.rows_in(another_query_collection)), [-1, 0])
+        self.assertEqual(list(another_query_collection.query_ids_in(a_query_collection)), [1, -1])
+        self.assertEqual(list(a_query_collection.query_ids_in(self._create_collection())), [-1, -1])
+
+    def test_frozen_columns(self):
+        a_query_collection = self._create_collection()
+        a_query_collection.add(('q1', 'u1'))
+        frozen = a_query_collection.frozen()
+
+        self.assertEqual(frozen.counts[0], 1)
+        with self.assertRaises(ValueError):
+            frozen.counts[0] = 5
+        self.assertEqual(frozen.query_vocabulary_ids, tuple(a_query_collection.query_vocabulary_ids))
+        self.assertRaises(AttributeError, getattr, frozen, 'find_pair_row')
+        self.assertEqual(a_query_collection.counts[0], 1)
+
+    def test_subsume_those_not_present(self):
+        reference_query_collection = self._create_collection()
+        test_query_collection = self._create_collection()
+        reference_list_of_query_url_pairs = [
+            ('q1', 'u1'),
+            ('q1', 'u1'),
+            ('q2', 'u1'),
+            ('q2', 'u2'),
+            ('q4', 'u4'),
+        ]
+        for query_url_pair in reference_list_of_query_url_pairs:
+            reference_query_collection.add(query_url_pair)
+            test_query_collection.add(query_url_pair)
+        for query_url_pair in [('q5', 'u1'), ('q6', 'u1'), ('q4', 'u9'), ('q4', 'u9')]:
+            test_query_collection.add(query_url_pair)
+
+        test_query_collection.subsume_those_not_present_in(reference_query_collection)
+
+        self.assertEqual(test_query_collection['*']['*'].number_of_repetitions, 4)
+        self.assertEqual(test_query_collection['*'].number_of_urls, 4)
+        self.assertEqual(test_query_collection['q4'].number_of_urls, 1)
+        self.assertTrue('u9' not in test_query_collection['q4'])
+        self.assertTrue('q5' not in test_query_collection)
+        self.assertEqual(test_query_collection['q1']['u1'].number_of_repetitions, 2)
+        self.assertEqual(test_query_collection.number_of_query_url_pairs, 9)
+
+
+class TestArrayPipeline(TestCase):
+
+    def test_configuration(self):
+        config = configuration(
+            definition_source=required_config,
+            values_source_list=[
+                array_data_structures,
+                standard_constants,
+            ]
+        )
+        self.assertEqual(config.optin_db.optin_db_class, ArrayQueryCollection)
+        self.assertEqual(config.head_list_db.head_list_class, ArrayHeadList)
+        self.assertEqual(config.client_db.client_db_class, ArrayClientQueryCollection)
+        self.assertEqual(config.final_probabilities.final_probabilites_db_class, ArrayFinalQueryCollection)
+        self.assertEqual(config.head_list_db.b, 5.0)
+        self.assertFalse('streaming_top_m' in config.head_list_db)
+
+    def test_data_structures_option(self):
+        config = configuration(
+            definition_source=required_config,
+            values_source_list=[
+                standard_constants,
+                {"data_structures": "array", "head_list_db.m": 3},
+            ]
+        )
+        self.assertEqual(config.data_structures.to_str(), 'array')
+        self.assertEqual(config.optin_db.optin_db_class, ArrayQueryCollection)
+        self.assertEqual(config.head_list_db.head_list_class, ArrayHeadList)
+        self.assertEqual(config.final_probabilities.url_stats_class, ArrayFinalURLStats)
+        self.assertEqual(config.head_list_db.m, 3)
+        # a single class may still be overridden within the family
+        config = configuration(
+            definition_source=required_config,
+            values_source_list=[
+                {"data_structures": "slotted", "optin_db.url_stats_class": "blender.in_memory_structures.URLStats"},
+                standard_constants,
+            ]
+        )
+        self.assertEqual(config.head_list_db.url_stats_class, SlottedURLStats)
+        self.assertEqual(config.optin_db.url_stats_class, URLStats)
+        with self.assertRaises(CannotConvertError):
+            configuration(
+                definition_source=required_config,
+                values_source_list=[{"data_structures": "hdf5"}, standard_constants]
+            )
+
+    @patch('blender.array_structures.laplace')
+    @patch('blender.head_list.laplace')
+    @patch('blender.in_memory_structures.laplace')
+    def test_snapshot(self, *laplace_mocks):
+        for laplace_mock in laplace_mocks:
+            laplace_mock.return_value = 0.0
+        head_list = run_pipeline(array_data_structures)[0]
+        assert_same_head_list(self, head_list, snapshot_round_trip(head_list))
+
+    @patch('blender.array_structures.laplace')
+    @patch('blender.head_list.laplace')
+    @patch('blender.in_memory_structures.laplace')
+    def test_same_as_in_memory_structures(self, *laplace_mocks):
+        # with the noise removed, both implementations must arrive at the same values
+        for laplace_mock in laplace_mocks:
+            laplace_mock.return_value = 0.0
+
+        expected_results = run_pipeline(default_data_structures)
+        array_results = run_pipeline(array_data_structures)
+
+        for expected, actual in zip(expected_results, array_results):
+            self.assertEqual(sorted(expected.keys()), sorted(actual.keys()))
+            self.assertEqual(sorted(expected.iter_records()), sorted(actual.iter_records()))
+            self.assertEqual(expected.number_of_query_url_pairs, actual.number_of_query_url_pairs)
+            for query_str, url_str in expected.iter_records():
+                self.assertAlmostEqual(expected[query_str].probability, actual[query_str].probability)
+                self.assertAlmostEqual(expected[query_str].variance, actual[query_str].variance)
+                self.assertAlmostEqual(
+                    expected[query_str][url_str].probability,
+                    actual[query_str][url_str].probability
+                )
+                self.assertAlmostEqual(
+                    expected[query_str][url_str].variance,
+                    actual[query_str][url_str].variance
+                )
+
+        expected_head_list, _, expected_final = expected_results
+        array_head_list, _, array_final = array_results
+        self.assertAlmostEqual(expected_head_list.tau, array_head_list.tau)
+        for query_str in expected_head_list:
+            self.assertAlmostEqual(expected_head_list[query_str].tau, array_head_list[query_str].tau)
+        self.assertEqual(list(expected_final.iter_records()), list(array_final.iter_records()))
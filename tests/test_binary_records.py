@@ -0,0 +1,118 @@
+from unittest import TestCase
+
+from collections import (
+    Counter
+)
+import os
+import tempfile
+
+from configman.dotdict import (
+    DotDict
+)
+
+from blender.binary_records import (
+    BinaryRecords,
+    compile_json_records,
+    find_record_ranges,
+    is_binary_records,
+    iter_file_records,
+)
+from blender.in_memory_structures import (
+    Query,
+    QueryCollection,
+    URLStats,
+)
+from blender.tests.test_file_support import (
+    write_temporary_records
+)
+
+
+def create_query_collection():
+    config = DotDict()
+    config.query_class = Query
+    config.url_stats_class = URLStats
+    return QueryCollection(config)
+
+
+class TestBinaryRecords(TestCase):
+
+    def setUp(self):
+        self.records = (
+            [['q1', 'u1']] * 5 + [['q1', 'u2']] * 2 + [['q2', 'u1'], ['qé', 'u☃']] + [['q3', 'u3']] * 7
+        )
+        self.json_file_name = write_temporary_records(self.records)
+        handle, self.binary_file_name = tempfile.mkstemp(suffix='.bin')
+        os.close(handle)
+        compile_json_records(self.json_file_name, self.binary_file_name)
+
+    def tearDown(self):
+        os.unlink(self.json_file_name)
+        os.unlink(self.binary_file_name)
+
+    def test_is_binary_records(self):
+        self.assertTrue(is_binary_records(self.binary_file_name))
+        self.assertFalse(is_binary_records(self.json_file_name))
+
+    def test_round_trip(self):
+        binary_records = BinaryRecords(self.binary_file_name)
+
+        self.assertEqual(len(binary_records), 5)
+        self.assertEqual(binary_records.number_of_records, len(self.records))
+        self.assertEqual(binary_records.q_u_counts(), Counter(tuple(record) for record in self.records))
+        self.assertEqual(sorted(binary_records.iter_records()), sorted(self.records))
+        self.assertEqual(
+            sorted(binary_records.iter_records(chunk_size=2)),
+            sorted(binary_records.iter_records())
+        )
+        self.assertEqual(
+            [q_u_counts for q_u_counts in binary_records.iter_count_chunks(2)],
+            [{('q1', 'u1'): 5, ('q1', 'u2'): 2}, {('q2', 'u1'): 1, ('qé', 'u☃'): 1}, {('q3', 'u3'): 7}]
+        )
+
+    def test_empty(self):
+        empty_file_name = write_temporary_records([])
+        try:
+            compile_json_records(empty_file_name, self.binary_file_name)
+            binary_records = BinaryRecords(self.binary_file_name)
+            self.assertEqual(len(binary_records), 0)
+            self.assertEqual(list(binary_records.iter_records()), [])
+            self.assertEqual(binary_records.find_ranges(3), [])
+        finally:
+            os.unlink(empty_file_name)
+
+    def test_close(self):
+        with BinaryRecords(self.binary_file_name) as binary_records:
+            a_mmap = binary_records.data._mmap
+            self.assertEqual(binary_records.number_of_records, len(self.records))
+        self.assertTrue(a_mmap.closed)
+        self.assertTrue(binary_records.counts is None)
+
+    def test_not_binary_records(self):
+        self.assertRaises(ValueError, BinaryRecords, self.json_file_name)
+
+    def test_ranges(self):
+        for number_of_ranges in (1, 2, 3, 10):
+            record_ranges = find_record_ranges(self.binary_file_name, number_of_ranges)
+            self.assertTrue(len(record_ranges) <= number_of_ranges)
+            self.assertEqual(
+                sorted(record for start, end in record_ranges for record in iter_file_records(self.binary_file_name, start, end)),
+                sorted(self.records)
+            )
+        self.assertEqual(find_record_ranges(self.binary_file_name, 2), [(0, 3), (3, 5)])
+        self.assertEqual(list(iter_file_records(self.json_file_name)), self.records)
+
+    def test_load_binary(self):
+        json_collection = create_query_collection()
+        json_collection.bulk_load(self.json_file_name)
+        binary_collection = create_query_collection()
+        binary_collection.load_binary(self.binary_file_name)
+
+        self.assertEqual(binary_collection.number_of_query_url_pairs, json_collection.number_of_query_url_pairs)
+        self.assertEqual(list(binary_collection.keys()), list(json_collection.keys()))
+        for query in json_collection:
+            self.assertEqual(binary_collection[query].number_of_urls, json_collection[query].number_of_urls)
+            for url in json_collection[query]:
+                self.assertEqual(
+                    binary_collection[query][url].number_of_repetitions,
+                    json_collection[query][url].number_of_repetitions
+                )
@@ -0,0 +1,90 @@
+from unittest import TestCase
+
+import os
+import tempfile
+
+from configman.dotdict import (
+    DotDict
+)
+from numpy import (
+    savez
+)
+
+from blender.client_head_list import (
+    ClientHeadList,
+)
+from blender.tests.client_support import (
+    HeadListSampler,
+    batch_local_alg,
+    sharded_local_alg,
+)
+from blender.tests.test_client_support import (
+    create_head_list
+)
+from blender.tests.test_file_support import (
+    write_temporary_records
+)
+
+
+class TestClientHeadList(TestCase):
+
+    def setUp(self):
+        handle, self.file_name = tempfile.mkstemp(suffix='.npz')
+        os.close(handle)
+
+    def tearDown(self):
+        os.unlink(self.file_name)
+
+    def test_round_trip(self):
+        head_list = create_head_list()
+        head_list.tau = 0.125
+        head_list.export_for_client_distribution(self.file_name)
+
+        client_head_list = ClientHeadList(self.file_name)
+
+        self.assertEqual(client_head_list.number_of_query_url_pairs, head_list.number_of_query_url_pairs)
+        self.assertEqual(client_head_list.tau, 0.125)
+        self.assertEqual(list(client_head_list.keys()), ['*', 'q1', 'q2'])
+        self.assertEqual(list(client_head_list['q1'].keys()), ['*', 'u1', 'u2'])
+        self.assertEqual(client_head_list['q1'].tau, 0.75)
+        self.assertEqual(client_head_list['*'].tau, 0.25)
+        self.assertTrue('q2' in client_head_list)
+        self.assertFalse('q9' in client_head_list)
+        self.assertTrue('u3' in client_head_list['q2'])
+        self.assertFalse('u1' in client_head_list['q2'])
+        self.assertFalse('zzz' in client_head_list['q2'])
+
+    def test_client_simulation(self):
+        head_list = create_head_list()
+        head_list.export_for_client_distribution(self.file_name)
+        client_head_list = ClientHeadList(self.file_name)
+
+        sampler = HeadListSampler(client_head_list)
+        self.assertEqual(set(sampler.q_u_pairs), set(HeadListSampler(head_list).q_u_pairs))
+        self.assertEqual(sampler.taus, HeadListSampler(head_list).taus)
+
+        config = DotDict({'epsilon_prime_q': 1.0, 'delta_prime_q': 0.0})
+        counts = batch_local_alg(config, client_head_list, lambda: iter([('q2', 'u3')] * 100))
+        self.assertEqual(sum(counts.values()), 100)
+        self.assertTrue(set(counts.keys()) <= set(sampler.q_u_pairs))
+
+    def test_sharded_client_simulation(self):
+        head_list = create_head_list()
+        head_list.export_for_client_distribution(self.file_name)
+        client_head_list = ClientHeadList(self.file_name)
+        self.assertTrue(client_head_list['q1']['u1'].probability == 0.0)
+        self.assertRaises(KeyError, client_head_list['q1'].__getitem__, 'u3')
+
+        records_file_name = write_temporary_records([['q1', 'u1'], ['q2', 'u3'], ['q9', 'u9']] * 100)
+        try:
+            config = DotDict({'epsilon_prime_q': 1.0, 'delta_prime_q': 0.0})
+            counts = sharded_local_alg(config, client_head_list, records_file_name, 3, seed=7, block_size=50)
+        finally:
+            os.unlink(records_file_name)
+        self.assertEqual(sum(counts.values()), 300)
+        self.assertTrue(set(counts.keys()) <= set(HeadListSampler(head_list).q_u_pairs))
+
+    def test_version(self):
+        with open(self.file_name, mode='wb') as f:
+            savez(f, version=2)
+        self.assertRaises(ValueError, ClientHeadList, self.file_name)
@@ -1,11 +1,15 @@
 from unittest import TestCase
 from mock import (
     Mock,
+    patch,
 )
 
 from collections import (
     defaultdict
 )
+from configman import (
+    configuration,
+)
 from configman.dotdict import (
     DotDict
 )
@@ -15,6 +19,16 @@ from blender.client_structures import (
     ClientURLStats,
     ClientQueryCollection
 )
+from blender.main import (
+    required_config,
+    default_data_structures,
+    create_preliminary_headlist,
+    estimate_optin_probabilities,
+)
+from blender.tests.synthetic_data import (
+    standard_constants,
+    load_small_data,
+)
 
 
 class TestClientUrlStats(TestCase):
@@ -153,3 +167,47 @@ class TestClientQueryCollection(TestCase):
         client_query_collection.add(('some_other_query', 'some_other_url'))
         self.assertEqual(client_query_collection.number_of_queries, 2)
         self.assertEqual(client_query_collection.number_of_query_url_pairs, 3)
+
+    @patch('blender.head_list.laplace')
+    @patch('blender.in_memory_structures.laplace')
+    def test_vectorized_estimation(self, *laplace_mocks):
+        for laplace_mock in laplace_mocks:
+            laplace_mock.return_value = 0.0
+        client_databases = []
+        for vectorized_estimation in (False, True):
+            config = configuration(
+                definition_source=required_config,
+                values_source_list=[
+                    default_data_structures,
+                    standard_constants,
+                    {
+                        "head_list_db.m": 3,
+                        "client_db.vectorized_estimation": vectorized_estimation,
+                    },
+                ]
+            )
+            optin_database_s = load_small_data(config.optin_db.optin_db_class(config.optin_db))
+            optin_database_t = load_small_data(config.optin_db.optin_db_class(config.optin_db))
+            head_list = estimate_optin_probabilities(
+                create_preliminary_headlist(config, optin_database_s),
+                optin_database_t
+            )
+            client_database = load_small_data(config.client_db.client_db_class(config.client_db))
+            client_database.subsume_those_not_present_in(head_list)
+            client_database.add(('q4', 'q4u1'), 50)
+            client_database.calculate_probabilities(head_list)
+            client_databases.append(client_database)
+
+        scalar, vectorized = client_databases
+        self.assertEqual(sorted(scalar.iter_records()), sorted(vectorized.iter_records()))
+        for query_str, url_str in scalar.iter_records():
+            self.assertAlmostEqual(scalar[query_str].probability, vectorized[query_str].probability)
+            self.assertAlmostEqual(scalar[query_str].variance, vectorized[query_str].variance)
+            self.assertAlmostEqual(
+                scalar[query_str][url_str].probability,
+                vectorized[query_str][url_str].probability
+            )
+            self.assertAlmostEqual(
+                scalar[query_str][url_str].variance,
+                vectorized[query_str][url_str].variance
+            )
@@ -1 +1,184 @@
+from unittest import TestCase
+import os
+from mock import (
+    patch
+)
 
+from numpy import (
+    ones,
+    zeros,
+)
+from configman.dotdict import (
+    DotDict
+)
+
+from blender.head_list import (
+    HeadList,
+    HeadListQuery,
+)
+from blender.in_memory_structures import (
+    URLStats,
+)
+from blender.shared_head_list import (
+    SharedHeadList,
+    SharedHeadListBlock,
+)
+from blender.tests.client_support import (
+    HeadListSampler,
+    local_alg,
+    batch_local_alg,
+    sharded_local_alg,
+)
+from blender.tests.test_file_support import (
+    write_temporary_records
+)
+
+
+def create_head_list():
+    config = DotDict()
+    config.url_stats_class = URLStats
+    config.query_class = HeadListQuery
+    head_list = HeadList(config)
+    for q_u_pair in [('q1', 'u1'), ('q1', 'u2'), ('q2', 'u3'), ('*', '*')]:
+        head_list.add(q_u_pair)
+    head_list.append_star_values()
+    head_list['q1'].tau = 0.75
+    head_list['q2'].tau = 0.5
+    head_list['*'].tau = 0.25
+    return head_list
+
+
+class TestHeadListSampler(TestCase):
+
+    def test_instantiation(self):
+        sampler = HeadListSampler(create_head_list())
+
+        self.assertEqual(sampler.query_strs, ['q1', 'q2', '*'])
+        self.assertEqual(sampler.url_strs['q1'], ['u1', 'u2', '*'])
+        self.assertEqual(sampler.url_strs['*'], ['*'])
+        self.assertEqual(sampler.taus, {'q1': 0.75, 'q2': 0.5, '*': 0.25})
+
+    @patch('blender.tests.client_support.random')
+    def test_choose(self, random_mock):
+        sampler = HeadListSampler(create_head_list())
+
+        random_mock.return_value = 0.0
+        self.assertEqual(sampler.choose_query(), 'q1')
+        self.assertEqual(sampler.choose_url('q1'), 'u1')
+        random_mock.return_value = 0.999
+        self.assertEqual(sampler.choose_query(), '*')
+        self.assertEqual(sampler.choose_url('q1'), '*')
+        self.assertEqual(sampler.choose_url('q2'), '*')
+
+
+class TestLocalAlg(TestCase):
+
+    @patch('blender.tests.client_support.random')
+    def test_local_alg_without_replacement(self, random_mock):
+        random_mock.return_value = 1.0
+        config = DotDict({'epsilon_prime_q': 1.0, 'delta_prime_q': 0.0})
+        reports = [('q1', 'u1'), ('q1', 'u9'), ('q9', 'u1')]
+
+        self.assertEqual(
+            list(local_alg(config, create_head_list(), lambda: iter(reports))),
+            [('q1', 'u1'), ('q1', '*'), ('*', '*')]
+        )
+
+    @patch('blender.tests.client_support.random')
+    def test_local_alg_with_replacement(self, random_mock):
+        random_mock.return_value = 0.0
+        config = DotDict({'epsilon_prime_q': 1.0, 'delta_prime_q': 0.0})
+
+        self.assertEqual(
+            list(local_alg(config, create_head_list(), lambda: iter([('q2', 'u3')]))),
+            [('q1', 'u1')]
+        )
+
+
+class TestBatchLocalAlg(TestCase):
+
+    def test_find_pair_id(self):
+        sampler = HeadListSampler(create_head_list())
+
+        self.assertEqual(sampler.q_u_pairs[sampler.find_pair_id('q1', 'u2')], ('q1', 'u2'))
+        self.assertEqual(sampler.q_u_pairs[sampler.find_pair_id('q1', 'u9')], ('q1', '*'))
+        self.assertEqual(sampler.q_u_pairs[sampler.find_pair_id('q9', 'u1')], ('*', '*'))
+        self.assertEqual(list(sampler.pair_offsets), [0, 3, 5])
+
+    def test_find_pair_ids(self):
+        head_list = create_head_list()
+        head_list.add(('q\u00e9', 'u\u00e9'))
+        head_list.add(('q10', 'u1'))
+        head_list.append_star_values()
+        sampler = HeadListSampler(head_list)
+        records = [
+            ('q1', 'u2'), ('q1', 'u9'), ('q9', 'u1'), ('q2', 'u3'), ('q\u00e9', 'u\u00e9'),
+            ('q10', 'u1'), ('q10', 'u2'), ('q', ''), ('q1', 'u1'), ('*', '*'),
+        ]
+
+        self.assertEqual(
+            list(sampler.find_pair_ids(*zip(*records))),
+            [sampler.find_pair_id(query_str, url_str) for query_str, url_str in records]
+        )
+        self.assertEqual(len(sampler.find_pair_ids((), ())), 0)
+
+        # the workers of sharded_local_alg look up their records in the tables of the shared memory
+        with SharedHeadListBlock(head_list) as head_list_block:
+            shared_head_list = SharedHeadList(head_list_block.handle)
+            shared_sampler = HeadListSampler(shared_head_list)
+            self.assertEqual(list(shared_sampler.find_pair_ids(*zip(*records))), list(sampler.find_pair_ids(*zip(*records))))
+            del shared_sampler
+            shared_head_list.close()
+
+        without_star = HeadList(head_list.config)
+        without_star.add(('q1', 'u1'))
+        self.assertRaises(KeyError, HeadListSampler(without_star).find_pair_ids, ('q1', 'q9'), ('u1', 'u1'))
+
+    @patch('blender.tests.client_support.random')
+    def test_batch_local_alg_without_replacement(self, random_mock):
+        random_mock.side_effect = lambda size: ones(size)
+        config = DotDict({'epsilon_prime_q': 1.0, 'delta_prime_q': 0.0})
+        reports = [('q1', 'u1'), ('q1', 'u9'), ('q9', 'u1'), ('q1', 'u1'), ('q2', 'u3')]
+
+        self.assertEqual(
+            batch_local_alg(config, create_head_list(), lambda: iter(reports), block_size=2),
+            {('q1', 'u1'): 2, ('q1', '*'): 1, ('*', '*'): 1, ('q2', 'u3'): 1}
+        )
+
+    @patch('blender.tests.client_support.random')
+    def test_batch_local_alg_with_replacement(self, random_mock):
+        random_mock.side_effect = lambda size: zeros(size)
+        config = DotDict({'epsilon_prime_q': 1.0, 'delta_prime_q': 0.0})
+
+        self.assertEqual(
+            batch_local_alg(config, create_head_list(), lambda: iter([('q2', 'u3')] * 3)),
+            {('q1', 'u1'): 3}
+        )
+
+    def test_batch_local_alg_counts(self):
+        config = DotDict({'epsilon_prime_q': 1.0, 'delta_prime_q': 0.0})
+        counts = batch_local_alg(config, create_head_list(), lambda: iter([('q2', 'u3')] * 1000), block_size=300)
+
+        self.assertEqual(sum(counts.values()), 1000)
+        self.assertTrue(set(counts.keys()) <= set(HeadListSampler(create_head_list()).q_u_pairs))
+
+
+class TestShardedLocalAlg(TestCase):
+
+    def setUp(self):
+        self.file_name = write_temporary_records(
+            [['q1', 'u1'], ['q1', 'u2'], ['q2', 'u3'], ['q9', 'u9']] * 250
+        )
+
+    def tearDown(self):
+        os.unlink(self.file_name)
+
+    def test_reproducible(self):
+        config = DotDict({'epsilon_prime_q': 1.0, 'delta_prime_q': 0.0})
+        head_list = create_head_list()
+        counts = sharded_local_alg(config, head_list, self.file_name, 3, seed=7, block_size=100)
+
+        self.assertEqual(sum(counts.values()), 1000)
+        self.assertTrue(set(counts.keys()) <= set(HeadListSampler(head_list).q_u_pairs))
+        self.assertEqual(counts, sharded_local_alg(config, head_list, self.file_name, 3, seed=7, block_size=100))
+        self.assertNotEqual(counts, sharded_local_alg(config, head_list, self.file_name, 3, seed=8, block_size=100))
@@ -0,0 +1,124 @@
+from unittest import TestCase
+
+import bz2
+import gzip
+import json
+import lzma
+import os
+import tempfile
+
+from collections import (
+    Counter
+)
+
+from blender.file_support import (
+    count_record_range,
+    count_records,
+    find_decompressor,
+    find_line_ranges,
+    iter_json_records,
+    iter_record_chunks,
+    open_records,
+)
+
+
+def write_temporary_records(records):
+    handle, file_name = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(handle, mode='w', encoding='utf-8') as f:
+        for record in records:
+            f.write('{}\n'.format(json.dumps(record)))
+    return file_name
+
+
+class TestLineRanges(TestCase):
+
+    def setUp(self):
+        self.records = [['q{}'.format(i), 'u{}'.format(i * i)] for i in range(100)]
+        self.file_name = write_temporary_records(self.records)
+
+    def tearDown(self):
+        os.unlink(self.file_name)
+
+    def test_find_line_ranges(self):
+        for number_of_ranges in (1, 2, 3, 7, 100, 1000):
+            line_ranges = find_line_ranges(self.file_name, number_of_ranges)
+            self.assertTrue(len(line_ranges) <= number_of_ranges)
+            self.assertEqual(line_ranges[0][0], 0)
+            self.assertEqual(line_ranges[-1][1], os.path.getsize(self.file_name))
+            for (start, end), (next_start, next_end) in zip(line_ranges, line_ranges[1:]):
+                self.assertEqual(end, next_start)
+
+    def test_iter_json_records(self):
+        self.assertEqual(list(iter_json_records(self.file_name)), self.records)
+        for number_of_ranges in (1, 2, 3, 7, 100, 1000):
+            records = []
+            for start, end in find_line_ranges(self.file_name, number_of_ranges):
+                records.extend(iter_json_records(self.file_name, start, end))
+            self.assertEqual(records, self.records)
+
+    def test_count_record_range(self):
+        expected = Counter(tuple(record) for record in self.records)
+        self.assertEqual(count_record_range(self.file_name), expected)
+        for number_of_ranges in (2, 3, 7):
+            q_u_counter = Counter()
+            for start, end in find_line_ranges(self.file_name, number_of_ranges):
+                # chunks of a few lines, so that most chunks straddle the end of their range
+                q_u_counter.update(count_record_range(self.file_name, start, end, chunk_size=40))
+            self.assertEqual(q_u_counter, expected)
+
+
+class TestWeightedRecords(TestCase):
+
+    def test_count_records(self):
+        q_u_counter = Counter()
+        count_records(q_u_counter, [['q1', 'u1'], ['q1', 'u1', 4], ['q2', 'u2', 2], ['q2', 'u2']])
+        self.assertEqual(q_u_counter, {('q1', 'u1'): 5, ('q2', 'u2'): 3})
+
+    def test_iter_json_records(self):
+        file_name = write_temporary_records([['q1', 'u1', 3], ['q2', 'u2'], ['q3', 'u3', 0]])
+        try:
+            self.assertEqual(list(iter_json_records(file_name)), [['q1', 'u1']] * 3 + [['q2', 'u2']])
+        finally:
+            os.unlink(file_name)
+
+
+class TestCompressedRecords(TestCase):
+
+    def setUp(self):
+        self.records = [['q{}'.format(i), 'u{}'.format(i * i)] for i in range(100)]
+        self.file_names = []
+
+    def tearDown(self):
+        for file_name in self.file_names:
+            os.unlink(file_name)
+
+    def write_compressed_records(self, open_function, suffix):
+        handle, file_name = tempfile.mkstemp(suffix=suffix)
+        os.close(handle)
+        self.file_names.append(file_name)
+        with open_function(file_name, mode='wt', encoding='utf-8') as f:
+            for record in self.records:
+                f.write('{}\n'.format(json.dumps(record)))
+        return file_name
+
+    def test_compressed_records(self):
+        for open_function, suffix in ((gzip.open, '.gz'), (bz2.open, '.bz2'), (lzma.open, '.xz')):
+            # recognized by extension and, renamed, by the leading bytes alone
+            for file_name in (
+                self.write_compressed_records(open_function, suffix),
+                self.write_compressed_records(open_function, '.json')
+            ):
+                self.assertEqual(find_decompressor(file_name), open_function)
+                self.assertEqual(list(iter_json_records(file_name)), self.records)
+                self.assertEqual(
+                    [record for records in iter_record_chunks(file_name, 100) for record in records],
+                    self.records
+                )
+                self.assertEqual(find_line_ranges(file_name, 3), [(0, None)])
+                with open_records(file_name, encoding='utf-8') as f:
+                    self.assertEqual(json.loads(f.readline()), self.records[0])
+
+    def test_uncompressed_records(self):
+        file_name = write_temporary_records(self.records)
+        self.file_names.append(file_name)
+        self.assertIsNone(find_decompressor(file_name))
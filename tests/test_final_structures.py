@@ -6,6 +6,12 @@ from mock import (
 from collections import (
     Mapping
 )
+from numpy import (
+    array
+)
+from configman import (
+    configuration,
+)
 from configman.dotdict import (
     DotDict,
     DotDictWithAcquisition
@@ -20,9 +26,100 @@ from blender.in_memory_structures import (
     Query,
     QueryCollection
 )
+from blender.final_structures import (
+    FinalURLStats,
+    blend_url_probabilities,
+)
 from blender.main import (
+    required_config,
+    default_data_structures,
     create_preliminary_headlist,
-    estimate_optin_probabilities
+    estimate_optin_probabilities,
 )
 
 
+def load_stats(query_collection, q_u_stats):
+    for (query_str, url_str), (probability, variance) in q_u_stats.items():
+        url_stats = query_collection[query_str][url_str]
+        url_stats.probability = probability
+        url_stats.variance = variance
+    return query_collection
+
+
+class TestFinalQueryCollection(TestCase):
+
+    def test_blend_url_probabilities(self):
+        omega, probability = blend_url_probabilities(0.5, 1.0, 0.25, 3.0)
+        self.assertEqual(omega, 0.75)
+        self.assertEqual(probability, 0.4375)
+
+    def test_blend_without_variance(self):
+        # the vectorized blend fails on a pair whose variances are both 0, as the scalar one does
+        self.assertRaises(ZeroDivisionError, blend_url_probabilities, 0.5, 0.0, 0.25, 0.0)
+        self.assertRaises(
+            ZeroDivisionError,
+            blend_url_probabilities,
+            array([0.5, 0.5]),
+            array([1.0, 0.0]),
+            array([0.25, 0.25]),
+            array([3.0, 0.0])
+        )
+        url_stats = FinalURLStats(DotDict())
+        zero_variance = MagicMock(probability=0.5, variance=0.0)
+        self.assertRaises(
+            ZeroDivisionError,
+            url_stats.calculate_probability_relative_to,
+            {'q1': {'u1': zero_variance}},
+            'q1',
+            'u1',
+            {'q1': {'u1': zero_variance}}
+        )
+
+    def test_vectorized_blending(self):
+        final_probabilities = []
+        for vectorized_blending in (False, True):
+            config = configuration(
+                definition_source=required_config,
+                values_source_list=[
+                    default_data_structures,
+                    {"final_probabilities.vectorized_blending": vectorized_blending},
+                ]
+            )
+            head_list = load_stats(
+                config.head_list_db.head_list_class(config.head_list_db),
+                {
+                    ('q1', 'u1'): (0.25, 0.01),
+                    ('q1', 'u2'): (0.125, 0.02),
+                    ('q1', '*'): (0.0, 0.03),
+                    ('*', '*'): (0.5, 0.04),
+                }
+            )
+            client = load_stats(
+                config.client_db.client_db_class(config.client_db),
+                {
+                    ('q1', 'u1'): (0.5, 0.02),
+                    ('q1', 'u2'): (0.25, 0.01),
+                    ('*', '*'): (0.25, 0.04),
+                }
+            )
+            final = config.final_probabilities.final_probabilites_db_class(config.final_probabilities)
+            final.calculate_probability_relative_to(client.frozen(), head_list.frozen())
+            final_probabilities.append(final)
+
+            # the blend does not add missing pairs to the client database
+            self.assertTrue('*' not in client['q1'])
+
+        scalar, vectorized = final_probabilities
+        self.assertEqual(list(scalar.iter_records()), list(vectorized.iter_records()))
+        self.assertEqual(
+            list(vectorized.iter_records()),
+            [('q1', 'u1'), ('q1', 'u2'), ('q1', '*'), ('*', '*')]
+        )
+        for query_str, url_str in scalar.iter_records():
+            self.assertAlmostEqual(scalar[query_str][url_str].omega, vectorized[query_str][url_str].omega)
+            self.assertAlmostEqual(
+                scalar[query_str][url_str].probability,
+                vectorized[query_str][url_str].probability
+            )
+        self.assertAlmostEqual(vectorized['q1']['u1'].probability, 0.25 * 2.0 / 3.0 + 0.5 / 3.0)
+        self.assertAlmostEqual(vectorized['*']['*'].probability, 0.375)
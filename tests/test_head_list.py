@@ -5,6 +5,8 @@ from mock import (
 from collections import (
     Mapping
 )
+import os
+import tempfile
 
 import jsonpickle
 
@@ -27,7 +29,9 @@ from blender.in_memory_structures import (
 from blender.main import (
     required_config,
     default_data_structures,
+    slotted_url_stats,
     create_preliminary_headlist,
+    estimate_optin_probabilities,
 )
 
 from blender.tests.synthetic_data import (
@@ -112,6 +116,27 @@ class TestHeadList(TestCase):
         self.assertTrue('q7u1' in head_list['q7'])
         self.assertTrue('q7u2' in head_list['q7'])
 
+    @patch('blender.head_list.laplace',)
+    def test_create_headlist_draws_noise_once(self, laplace_mock):
+        laplace_mock.side_effect = lambda loc, scale, size: [0.0] * (size - 1) + [-100.0]
+        config = configuration(
+            definition_source=required_config,
+            values_source_list=[
+                default_data_structures,
+                standard_constants,
+            ]
+        )
+        optin_db = load_tiny_data(config.optin_db.optin_db_class(config.optin_db))
+
+        head_list = create_preliminary_headlist(config.head_list_db, optin_db)
+
+        laplace_mock.assert_called_once_with(0.0, 5.0, size=12)
+        # the last <q, u> pair is over the threshold but was given noise to push it under
+        self.assertEqual(
+            sorted(head_list.iter_records()),
+            [('*', '*'), ('q4', 'q4u1'), ('q4', 'q4u2'), ('q6', 'q6u1'), ('q7', 'q7u1')]
+        )
+
     @patch('blender.in_memory_structures.laplace',)
     def test_calculate_probabilities_relative_to(self, laplace_mock):
 
@@ -224,6 +249,77 @@ class TestHeadList(TestCase):
             sum += head_list[query_str].probability
         self.assertAlmostEqual(sum, 1.0)
 
+    @patch('blender.in_memory_structures.laplace',)
+    def test_streaming_top_m(self, laplace_mock):
+        laplace_mock.return_value = 0.0
+        head_lists = []
+        for streaming_top_m in (False, True):
+            config = configuration(
+                definition_source=required_config,
+                values_source_list=[
+                    default_data_structures,
+                    standard_constants,
+                    {
+                        "head_list_db.m": 3,
+                        "head_list_db.streaming_top_m": streaming_top_m,
+                    },
+                ]
+            )
+            optin_db = load_small_data(config.optin_db.optin_db_class(config.optin_db))
+            head_list = config.head_list_db.head_list_class(config.head_list_db)
+            for query_str, url_str in optin_db.iter_records():
+                head_list.add((query_str, url_str))
+            head_list.add(('*', '*'))
+            optin_db.subsume_those_not_present_in(head_list)
+            head_list.calculate_probabilities_relative_to(optin_db)
+            if streaming_top_m:
+                self.assertEqual(len(head_list.probability_sorted_index), 0)
+                self.assertEqual(len(head_list.top_m_heap), 3)
+            else:
+                self.assertEqual(head_list.top_m_heap, None)
+            head_list.subsume_entries_beyond_max_size()
+            head_lists.append(head_list)
+
+        indexed, streamed = head_lists
+        self.assertFalse(HeadList.required_config.streaming_top_m.default)
+        self.assertEqual(list(indexed.keys()), list(streamed.keys()))
+        self.assertEqual(
+            list(indexed.probability_sorted_index.iter_records()),
+            list(streamed.probability_sorted_index.iter_records())
+        )
+        self.assertEqual(indexed.number_of_query_url_pairs, streamed.number_of_query_url_pairs)
+        self.assertAlmostEqual(indexed['*'].probability, streamed['*'].probability)
+
+    def test_subsume_entries_beyond_max_size_with_ties(self):
+        config = DotDict()
+        config.url_stats_class = URLStats
+        config.query_class = HeadListQuery
+        config.m = 3
+        head_list = HeadList(config)
+        for i in range(10):
+            for j in range(i % 3 + 1):
+                head_list.add(('q{}'.format(i), 'u{}'.format(j)))
+        head_list.add(('*', '*'))
+        for query_str, url_str in head_list.iter_records():
+            head_list[query_str][url_str].probability = 0.025
+            head_list[query_str].update_probability(head_list[query_str][url_str])
+        head_list['q4']['u1'].probability = 0.1
+        head_list['q4'].probability = 0.125
+
+        head_list.subsume_entries_beyond_max_size()
+
+        # q4 has the highest probability, q2, q5 and q8 tie at 0.075 and the first added win
+        self.assertEqual(sorted(head_list.keys()), ['*', 'q2', 'q4', 'q5'])
+        self.assertEqual(
+            [query_str for probability, query_str in head_list.probability_sorted_index.iter_records()],
+            ['q4', 'q2', 'q5']
+        )
+        self.assertEqual(head_list.number_of_query_url_pairs, 3 + 2 + 3 + 1)
+        # the 11 urls of the 7 subsumed queries
+        self.assertAlmostEqual(head_list['*'].probability, 0.025 + 11 * 0.025)
+        self.assertAlmostEqual(head_list['*']['*'].probability, 0.025 + 11 * 0.025)
+        self.assertAlmostEqual(sum(head_list[query_str].probability for query_str in head_list), 0.575)
+
     @patch('blender.in_memory_structures.laplace',)
     def test_calculate_sigma_relative_to(self, laplace_mock):
 
@@ -294,3 +390,75 @@ class TestHeadList(TestCase):
         equivalent = jsonpickle.decode(frozen)
         frozen2 = jsonpickle.encode(equivalent)
         self.assertEqual(frozen, frozen2)
+
+    @patch('blender.in_memory_structures.laplace',)
+    @patch('blender.head_list.laplace',)
+    def test_slotted_url_stats(self, *laplace_mocks):
+        for laplace_mock in laplace_mocks:
+            laplace_mock.return_value = 0.0
+
+        head_lists = []
+        for values_source_list in (
+            [default_data_structures, standard_constants],
+            [default_data_structures, slotted_url_stats, standard_constants],
+        ):
+            config = configuration(definition_source=required_config, values_source_list=values_source_list)
+            optin_db = load_small_data(config.optin_db.optin_db_class(config.optin_db))
+            head_list = create_preliminary_headlist(config.head_list_db, optin_db)
+            optin_db.subsume_those_not_present_in(head_list)
+            head_list.calculate_probabilities_relative_to(optin_db)
+            head_list.subsume_entries_beyond_max_size()
+            head_list.calculate_variance_relative_to(optin_db)
+            head_lists.append(head_list)
+
+        head_list, slotted_head_list = head_lists
+        self.assertEqual(slotted_head_list['*']['*'].__class__.__name__, 'SlottedURLStats')
+        for query, url in head_list.iter_records():
+            self.assertAlmostEqual(head_list[query][url].probability, slotted_head_list[query][url].probability)
+            self.assertAlmostEqual(head_list[query][url].variance, slotted_head_list[query][url].variance)
+
+        frozen = jsonpickle.encode(slotted_head_list)
+        equivalent = jsonpickle.decode(frozen)
+        self.assertEqual(frozen, jsonpickle.encode(equivalent))
+        self.assertEqual(
+            equivalent['*']['*'].number_of_repetitions,
+            slotted_head_list['*']['*'].number_of_repetitions
+        )
+
+    def test_snapshot(self):
+        config = configuration(
+            definition_source=required_config,
+            values_source_list=[
+                default_data_structures,
+                standard_constants,
+            ]
+        )
+        optin_db_s = load_small_data(config.optin_db.optin_db_class(config.optin_db))
+        optin_db_t = load_small_data(config.optin_db.optin_db_class(config.optin_db))
+        head_list = estimate_optin_probabilities(
+            create_preliminary_headlist(config.head_list_db, optin_db_s),
+            optin_db_t
+        )
+
+        handle, file_name = tempfile.mkstemp(suffix='.npz')
+        os.close(handle)
+        try:
+            head_list.save_snapshot(file_name)
+            restored = config.head_list_db.head_list_class(config.head_list_db)
+            restored.load_snapshot(file_name)
+            with patch('blender.head_list.SNAPSHOT_VERSION', 2):
+                self.assertRaises(
+                    ValueError,
+                    config.head_list_db.head_list_class(config.head_list_db).load_snapshot,
+                    file_name
+                )
+        finally:
+            os.unlink(file_name)
+
+        self.assertEqual(restored.number_of_query_url_pairs, head_list.number_of_query_url_pairs)
+        self.assertEqual(restored.tau, head_list.tau)
+        self.assertEqual(list(restored.keys()), list(head_list.keys()))
+        for query_str in head_list:
+            self.assertEqual(restored[query_str].tau, head_list[query_str].tau)
+            self.assertEqual(list(restored[query_str].keys()), list(head_list[query_str].keys()))
+        self.assertEqual(jsonpickle.encode(restored), jsonpickle.encode(head_list))
@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+import pickle
+
+from blender.head_list_index import (
+    HeadListIndex
+)
+from blender.tests.test_client_support import (
+    create_head_list
+)
+
+
+class TestHeadListIndex(TestCase):
+
+    def test_lookups(self):
+        head_list = create_head_list()
+        head_list.add(('qé', 'u☃'))
+        head_list.add(('a', 'z'))
+        head_list.append_star_values()
+        index = HeadListIndex(head_list)
+
+        self.assertEqual(index.number_of_queries, head_list.number_of_queries)
+        self.assertEqual(index.number_of_pairs, sum(len(head_list[query_str]) for query_str in head_list))
+        pair_id = 0
+        for query_id, query_str in enumerate(head_list.keys()):
+            self.assertEqual(index.find_query_id(query_str), query_id)
+            self.assertEqual(index.query_str(query_id), query_str)
+            for url_str in head_list[query_str].keys():
+                self.assertEqual(index.find_url_pair_id(query_id, url_str), pair_id)
+                self.assertEqual(index.find_pair_id(query_str, url_str), pair_id)
+                self.assertEqual(index.q_u_pair(pair_id), (query_str, url_str))
+                pair_id += 1
+
+        self.assertEqual(index.find_query_id('q0'), -1)
+        self.assertEqual(index.find_query_id('zzz'), -1)
+        self.assertEqual(index.find_url_pair_id(index.find_query_id('q2'), 'u1'), -1)
+        self.assertEqual(index.q_u_pair(index.find_pair_id('q1', 'u9')), ('q1', '*'))
+        self.assertEqual(index.q_u_pair(index.find_pair_id('q9', 'u1')), ('*', '*'))
+        self.assertEqual(index.find_report_ids('qé', 'nope'), (index.find_query_id('qé'), index.find_pair_id('qé', '*')))
+
+    def test_missing_star(self):
+        head_list = create_head_list()
+        del head_list['*']
+        index = HeadListIndex(head_list)
+        self.assertRaises(KeyError, index.find_pair_id, 'q9', 'u1')
+
+    def test_pickle(self):
+        index = HeadListIndex(create_head_list())
+        copy = pickle.loads(pickle.dumps(index))
+        self.assertEqual(copy.find_pair_id('q2', 'u3'), index.find_pair_id('q2', 'u3'))
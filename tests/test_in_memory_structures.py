@@ -8,14 +8,25 @@ from mock import (
 from collections import (
     Mapping
 )
+import os
+
 from configman.dotdict import (
     DotDict
 )
 
 from blender.in_memory_structures import (
     URLStats,
+    SlottedURLStats,
     Query,
     QueryCollection,
+    ZERO_URL_STATS,
+    ZERO_QUERY,
+)
+from blender.instrumentation import (
+    ProgressCounter
+)
+from blender.tests.test_file_support import (
+    write_temporary_records
 )
 
 
@@ -121,6 +132,63 @@ class TestURLStats(TestCase):
         self.assertAlmostEqual(stats_counter_1.variance, 0.00111111)
 
 
+class TestSlottedURLStats(TestCase):
+
+    def test_instantiation(self):
+        url_stats = SlottedURLStats(DotDict(), 16)
+        self.assertFalse(hasattr(url_stats, '__dict__'))
+        self.assertFalse(hasattr(url_stats, 'config'))
+        self.assertEqual(url_stats.number_of_repetitions, 16)
+        with self.assertRaises(AttributeError):
+            url_stats.something_else = 1
+
+    def test_subsume(self):
+        url_stats1 = SlottedURLStats(None, 17)
+        url_stats1.probability = 0.5
+        url_stats_2 = SlottedURLStats(None, 1)
+        url_stats_2.probability = 0.25
+
+        url_stats1.subsume(url_stats_2)
+
+        self.assertEqual(url_stats1.number_of_repetitions, 18)
+        self.assertEqual(url_stats_2.number_of_repetitions, 0)
+        self.assertEqual(url_stats1.probability, 0.75)
+
+    @patch('blender.in_memory_structures.laplace',)
+    def test_calculate_relative_to(self, laplace_mock):
+        laplace_mock.return_value = 0.0
+
+        other_query_collection = MagicMock()
+        other_query_collection['q1']['u1'].number_of_repetitions = 10.0
+        other_query_collection.number_of_query_url_pairs = 100.0
+
+        # the configuration comes from the owner rather than the instance
+        url_stats = SlottedURLStats()
+        url_stats.calculate_probability_relative_to(
+            other_query_collection,
+            query_str='q1',
+            url_str='u1',
+            config=DotDict({'b': 1})
+        )
+        laplace_mock.assert_called_once_with(0.0, 1)
+        self.assertEqual(url_stats.probability, 0.1)
+
+        url_stats.calculate_variance_relative_to(other_query_collection, config=DotDict({'b': 1}))
+        self.assertAlmostEqual(url_stats.variance, 0.00111111)
+
+    def test_state(self):
+        url_stats = SlottedURLStats(None, 3)
+        url_stats.probability = 0.5
+
+        state = url_stats.__getstate__()
+        self.assertEqual(state, {'number_of_repetitions': 3, 'probability': 0.5, 'variance': 0.0})
+
+        equivalent = SlottedURLStats()
+        equivalent.__setstate__(state)
+        self.assertEqual(equivalent.number_of_repetitions, 3)
+        self.assertEqual(equivalent.probability, 0.5)
+
+
 class TestQuery(TestCase):
 
     def test_instantiation(self):
@@ -302,6 +370,36 @@ class TestQueryCollection(TestCase):
         self.assertEqual(test_query_collection['*']['*'].number_of_repetitions, 8)
         self.assertTrue('u9' not in test_query_collection['q4'])
 
+    def test_subsume_those_not_present_statistics(self):
+        config = DotDict()
+        config.url_stats_class = URLStats
+        config.query_class = Query
+        reference_query_collection = QueryCollection(config)
+        for query_url_pair in [('q1', 'u2'), ('q1', 'u4'), ('q2', 'u1')]:
+            reference_query_collection.add(query_url_pair)
+
+        test_query_collection = QueryCollection(config)
+        for query_url_pair in [('q1', 'u1'), ('q1', 'u2'), ('q1', 'u3'), ('q1', 'u4'), ('q3', 'u1'), ('q3', 'u1')]:
+            test_query_collection.add(query_url_pair)
+        for query_str, url_str in test_query_collection.iter_records():
+            test_query_collection[query_str][url_str].probability = 0.125
+            test_query_collection[query_str].probability += 0.125
+
+        test_query_collection.subsume_those_not_present_in(reference_query_collection)
+
+        # the surviving urls keep their order
+        self.assertEqual(
+            list(test_query_collection.iter_records()),
+            [('q1', 'u2'), ('q1', 'u4'), ('*', '*')]
+        )
+        self.assertEqual(test_query_collection['q1'].number_of_urls, 2)
+        self.assertEqual(test_query_collection['q1'].probability, 0.25)
+        self.assertEqual(test_query_collection['*'].number_of_urls, 4)
+        self.assertEqual(test_query_collection['*'].probability, 0.375)
+        self.assertEqual(test_query_collection['*']['*'].number_of_repetitions, 4)
+        self.assertEqual(test_query_collection['*']['*'].probability, 0.375)
+        self.assertEqual(test_query_collection.number_of_query_url_pairs, 6)
+
     @patch("builtins.open", new_callable=mock_open, read_data=
         '["q1","u1"]\n'
         '["q1","u2"]\n'
@@ -326,3 +424,181 @@ class TestQueryCollection(TestCase):
         self.assertTrue("q2" in reference_query_collection)
         self.assertTrue("u3" in reference_query_collection["q2"])
         self.assertEqual(reference_query_collection["q2"].number_of_urls, 1)
+
+    def test_shared_strings(self):
+        config = DotDict()
+        config.url_stats_class = URLStats
+        config.query_class = Query
+        a_query_collection = QueryCollection(config)
+        another_query_collection = QueryCollection(config)
+        a_query_collection.add((''.join(['q', '1']), ''.join(['u', '1'])))
+        another_query_collection.add((''.join(['q', '1']), ''.join(['u', '1'])))
+
+        # both collections key on interned strings
+        self.assertTrue(list(a_query_collection)[0] is list(another_query_collection)[0])
+        self.assertTrue(list(a_query_collection['q1'])[0] is list(another_query_collection['q1'])[0])
+
+    def test_add_counts(self):
+        config = DotDict()
+        config.url_stats_class = URLStats
+        config.query_class = Query
+        a_query_collection = QueryCollection(config)
+        a_query_collection.add_counts({
+            ('q1', 'u1'): 2,
+            ('q1', 'u2'): 1,
+            ('q2', 'u3'): 5,
+        })
+
+        self.assertEqual(a_query_collection.number_of_query_url_pairs, 8)
+        self.assertEqual(a_query_collection['q1']['u1'].number_of_repetitions, 2)
+        self.assertEqual(a_query_collection['q1']['u2'].number_of_repetitions, 1)
+        self.assertEqual(a_query_collection['q1'].number_of_urls, 3)
+        self.assertEqual(a_query_collection['q2']['u3'].number_of_repetitions, 5)
+        self.assertEqual(a_query_collection['q2'].number_of_urls, 5)
+
+    @patch("builtins.open", new_callable=mock_open, read_data=
+        '["q1","u1"]\n'
+        '["q1","u2"]\n'
+        '["q1","u1"]\n'
+        '\n'
+        '["q2","u3"]\n'
+    )
+    def test_bulk_load(self, mocked_open):
+        config = DotDict()
+        config.url_stats_class = URLStats
+        config.query_class = Query
+        reference_query_collection = QueryCollection(config)
+
+        reference_query_collection.bulk_load("somefile")
+
+        self.assertEqual(reference_query_collection.number_of_query_url_pairs, 4)
+        self.assertEqual(reference_query_collection["q1"]["u1"].number_of_repetitions, 2)
+        self.assertEqual(reference_query_collection["q1"]["u2"].number_of_repetitions, 1)
+        self.assertEqual(reference_query_collection["q1"].number_of_urls, 3)
+        self.assertEqual(reference_query_collection["q2"]["u3"].number_of_repetitions, 1)
+        self.assertEqual(reference_query_collection["q2"].number_of_urls, 1)
+
+    @patch("builtins.open", new_callable=mock_open, read_data=
+        '["q1","u1",2]\n'
+        '["q1","u2"]\n'
+        '["q2","u3",5]\n'
+        '["q1","u1"]\n'
+    )
+    def test_bulk_load_weighted(self, mocked_open):
+        config = DotDict()
+        config.url_stats_class = URLStats
+        config.query_class = Query
+        reference_query_collection = QueryCollection(config)
+
+        reference_query_collection.bulk_load("somefile")
+
+        self.assertEqual(reference_query_collection.number_of_query_url_pairs, 9)
+        self.assertEqual(reference_query_collection["q1"]["u1"].number_of_repetitions, 3)
+        self.assertEqual(reference_query_collection["q1"]["u2"].number_of_repetitions, 1)
+        self.assertEqual(reference_query_collection["q2"]["u3"].number_of_repetitions, 5)
+
+    def test_add_many(self):
+        config = DotDict()
+        config.url_stats_class = URLStats
+        config.query_class = Query
+        a_query_collection = QueryCollection(config)
+
+        a_query_collection.add_many([('q1', 'u1', 2), ('q2', 'u3', 5), ('q1', 'u1', 3)])
+
+        self.assertEqual(a_query_collection.number_of_query_url_pairs, 10)
+        self.assertEqual(a_query_collection['q1']['u1'].number_of_repetitions, 5)
+        self.assertEqual(a_query_collection['q1'].number_of_urls, 5)
+        self.assertEqual(a_query_collection['q2']['u3'].number_of_repetitions, 5)
+        self.assertEqual(list(a_query_collection.keys()), ['q1', 'q2'])
+
+    def test_parallel_load(self):
+        records = [['q{}'.format(i % 7), 'u{}'.format(i % 5)] for i in range(200)] + [['q1', 'u1', 10]]
+        file_name = write_temporary_records(records)
+        try:
+            config = DotDict()
+            config.url_stats_class = URLStats
+            config.query_class = Query
+            reference_query_collection = QueryCollection(config)
+            reference_progress = ProgressCounter()
+            reference_query_collection.bulk_load(file_name, chunk_size=100, progress=reference_progress)
+            a_query_collection = QueryCollection(config)
+            progress = ProgressCounter()
+            a_query_collection.parallel_load(file_name, 3, progress=progress)
+        finally:
+            os.unlink(file_name)
+
+        self.assertEqual(reference_progress.value, 210)
+        self.assertEqual(progress.value, 210)
+        self.assertEqual(a_query_collection.number_of_query_url_pairs, 210)
+        self.assertEqual(list(a_query_collection.keys()), list(reference_query_collection.keys()))
+        for a_query in reference_query_collection:
+            self.assertEqual(list(a_query_collection[a_query].keys()), list(reference_query_collection[a_query].keys()))
+            self.assertEqual(a_query_collection[a_query].number_of_urls, reference_query_collection[a_query].number_of_urls)
+            for a_url in reference_query_collection[a_query]:
+                self.assertEqual(
+                    a_query_collection[a_query][a_url].number_of_repetitions,
+                    reference_query_collection[a_query][a_url].number_of_repetitions
+                )
+
+    def test_merge(self):
+        config = DotDict()
+        config.url_stats_class = URLStats
+        config.query_class = Query
+        a_query_collection = QueryCollection(config)
+        a_query_collection.add_counts({('q1', 'u1'): 2, ('q2', 'u3'): 1})
+        another_query_collection = QueryCollection(config)
+        another_query_collection.add_counts({('q1', 'u1'): 3, ('q1', 'u2'): 4})
+
+        a_query_collection.merge(another_query_collection)
+
+        self.assertEqual(a_query_collection.number_of_query_url_pairs, 10)
+        self.assertEqual(a_query_collection['q1']['u1'].number_of_repetitions, 5)
+        self.assertEqual(a_query_collection['q1']['u2'].number_of_repetitions, 4)
+        self.assertEqual(a_query_collection['q1'].number_of_urls, 9)
+        self.assertEqual(a_query_collection['q2'].number_of_urls, 1)
+
+
+class TestFrozenQueryCollection(TestCase):
+
+    def test_lookups_do_not_add(self):
+        config = DotDict()
+        config.url_stats_class = URLStats
+        config.query_class = Query
+        a_query_collection = QueryCollection(config)
+        a_query_collection.add(('q1', 'u1'))
+        a_query_collection.add(('q1', 'u1'))
+        frozen = a_query_collection.frozen()
+
+        self.assertEqual(frozen['q1']['u1'].number_of_repetitions, 2)
+        self.assertEqual(frozen['q1'].number_of_urls, 2)
+        self.assertEqual(frozen.number_of_query_url_pairs, 2)
+        self.assertTrue(frozen['q1']['u9'] is ZERO_URL_STATS)
+        self.assertTrue(frozen['q9'] is ZERO_QUERY)
+        self.assertEqual(frozen['q9']['u1'].number_of_repetitions, 0)
+        self.assertEqual(frozen['q9'].probability, 0.0)
+        self.assertEqual(list(frozen.iter_records()), [('q1', 'u1')])
+
+        self.assertTrue('u9' not in a_query_collection['q1'])
+        self.assertTrue('q9' not in a_query_collection)
+        with self.assertRaises(AttributeError):
+            frozen['q9']['u1'].probability = 0.5
+
+    def test_only_reads_are_delegated(self):
+        config = DotDict()
+        config.url_stats_class = URLStats
+        config.query_class = Query
+        a_query_collection = QueryCollection(config)
+        a_query_collection.add(('q1', 'u1'))
+        frozen = a_query_collection.frozen()
+
+        self.assertEqual(frozen['q1'].probability, 0.0)
+        with self.assertRaises(AttributeError):
+            frozen['q1']['u1'].number_of_repetitions = 5
+        with self.assertRaises(AttributeError):
+            frozen['q1']['u1'].probability = 0.5
+        self.assertRaises(AttributeError, getattr, frozen['q1']['u1'], 'increment_count')
+        self.assertEqual(a_query_collection['q1']['u1'].number_of_repetitions, 1)
+        for name in ('urls', 'add', 'touch'):
+            self.assertRaises(AttributeError, getattr, frozen['q1'], name)
+        for name in ('queries', 'add', 'subsume_those_not_present_in'):
+            self.assertRaises(AttributeError, getattr, frozen, name)
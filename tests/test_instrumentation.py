@@ -0,0 +1,68 @@
+from unittest import TestCase
+
+import io
+import json
+import os
+import tempfile
+import time
+
+from blender.instrumentation import (
+    Instrumentation,
+)
+
+
+class TestInstrumentation(TestCase):
+
+    def test_stages(self):
+        instrumentation = Instrumentation(trace_memory=True)
+        records = []
+        with instrumentation.stage('append', lambda: len(records)):
+            records.extend(range(10000))
+        with instrumentation.stage('untimed'):
+            pass
+
+        report = instrumentation.report()
+        self.assertEqual([a_stage['name'] for a_stage in report['stages']], ['append', 'untimed'])
+        append_stage = report['stages'][0]
+        self.assertEqual(append_stage['records'], 10000)
+        self.assertTrue(append_stage['wall_time'] > 0)
+        self.assertAlmostEqual(append_stage['records_per_second'], 10000 / append_stage['wall_time'])
+        self.assertTrue(append_stage['peak_traced_bytes'] > 0)
+        self.assertTrue(append_stage['peak_rss_bytes'] > 0)
+        self.assertFalse('records' in report['stages'][1])
+        self.assertTrue(report['total']['wall_time'] >= append_stage['wall_time'])
+
+    def test_stage_with_exception(self):
+        instrumentation = Instrumentation()
+        with self.assertRaises(ValueError):
+            with instrumentation.stage('failing'):
+                raise ValueError('failing')
+        self.assertEqual(instrumentation.stages[0]['name'], 'failing')
+
+    def test_progress_line(self):
+        progress_stream = io.StringIO()
+        instrumentation = Instrumentation(progress_interval=0.01, progress_stream=progress_stream)
+        with instrumentation.stage('waiting') as progress:
+            progress.add(7)
+            time.sleep(0.05)
+        progress_lines = progress_stream.getvalue()
+        self.assertTrue(progress_lines.startswith('\rwaiting: '))
+        self.assertTrue(progress_lines.endswith('\n'))
+        self.assertTrue('7 records' in progress_lines)
+        self.assertEqual(instrumentation.stages[0]['records'], 7)
+
+    def test_write_report(self):
+        instrumentation = Instrumentation()
+        with instrumentation.stage('nothing', lambda: 0):
+            pass
+        handle, file_name = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        try:
+            instrumentation.write_report(file_name)
+            with open(file_name, encoding='utf-8') as f:
+                report = json.load(f)
+        finally:
+            os.unlink(file_name)
+        self.assertEqual(report['stages'][0]['name'], 'nothing')
+        self.assertEqual(report['stages'][0]['records'], 0)
+        self.assertEqual(set(report['total']), set(instrumentation.report()['total']))
@@ -0,0 +1,76 @@
+from unittest import TestCase
+
+from multiprocessing import (
+    Pool
+)
+
+from blender.in_memory_structures import (
+    ZERO_QUERY,
+    ZERO_URL_STATS,
+)
+from blender.shared_head_list import (
+    SharedHeadList,
+    SharedHeadListBlock,
+)
+from blender.tests.test_client_support import (
+    create_head_list
+)
+
+
+def create_head_list_with_statistics():
+    head_list = create_head_list()
+    head_list.tau = 0.375
+    for i, (query_str, url_str) in enumerate(head_list.iter_records()):
+        head_list[query_str][url_str].probability = i / 10.0
+        head_list[query_str][url_str].variance = i / 100.0
+        head_list[query_str].probability += i / 10.0
+    return head_list
+
+
+def _read_shared_probability(handle, query_str, url_str):
+    shared_head_list = SharedHeadList(handle)
+    return shared_head_list[query_str][url_str].probability
+
+
+class TestSharedHeadList(TestCase):
+
+    def test_view(self):
+        head_list = create_head_list_with_statistics()
+        with SharedHeadListBlock(head_list) as head_list_block:
+            shared_head_list = SharedHeadList(head_list_block.handle)
+
+            self.assertEqual(shared_head_list.number_of_query_url_pairs, head_list.number_of_query_url_pairs)
+            self.assertEqual(shared_head_list.tau, 0.375)
+            self.assertEqual(list(shared_head_list.keys()), list(head_list.keys()))
+            for query_str in head_list:
+                shared_query = shared_head_list[query_str]
+                self.assertEqual(list(shared_query.keys()), list(head_list[query_str].keys()))
+                self.assertEqual(shared_query.tau, head_list[query_str].tau)
+                self.assertEqual(shared_query.probability, head_list[query_str].probability)
+                self.assertEqual(shared_query.number_of_urls, head_list[query_str].number_of_urls)
+                self.assertEqual(shared_query.kappa_q, len(head_list[query_str]))
+                for url_str in head_list[query_str]:
+                    url_stats = head_list[query_str][url_str]
+                    self.assertEqual(shared_query[url_str].number_of_repetitions, url_stats.number_of_repetitions)
+                    self.assertEqual(shared_query[url_str].probability, url_stats.probability)
+                    self.assertEqual(shared_query[url_str].variance, url_stats.variance)
+
+            self.assertTrue('q1' in shared_head_list)
+            self.assertFalse('q9' in shared_head_list)
+            self.assertFalse('u3' in shared_head_list['q1'])
+            self.assertTrue(shared_head_list['q9'] is ZERO_QUERY)
+            self.assertTrue(shared_head_list['q1']['u3'] is ZERO_URL_STATS)
+
+            shared_head_list.close()
+
+    def test_attach_in_workers(self):
+        head_list = create_head_list_with_statistics()
+        with SharedHeadListBlock(head_list) as head_list_block, Pool(processes=2) as pool:
+            probabilities = pool.starmap(
+                _read_shared_probability,
+                [(head_list_block.handle, query_str, url_str) for query_str, url_str in head_list.iter_records()]
+            )
+        self.assertEqual(
+            probabilities,
+            [head_list[query_str][url_str].probability for query_str, url_str in head_list.iter_records()]
+        )
@@ -35,7 +35,12 @@ class TestSortedDictOfLists(TestCase):
             [('z', 88), ('o', 44), ('o', 22), ('n', 33), ('b', 32), ('b', 19)]
         )
 
+    def test_frozen(self):
+        sd = SortedDictOfLists()
+        sd['a'].append(15)
+        frozen = sd.frozen()
 
-
-
-
+        self.assertEqual(frozen['a'], [15])
+        self.assertEqual(frozen['b'], ())
+        self.assertTrue('b' not in sd)
+        self.assertEqual(list(frozen.iter_records()), [('a', 15)])
@@ -0,0 +1,199 @@
+from unittest import TestCase
+from mock import (
+    patch
+)
+import os
+
+from configman import (
+    configuration,
+)
+from configman.dotdict import (
+    DotDict
+)
+
+from blender.sqlite_structures import (
+    SQLiteURLStats,
+    SQLiteQuery,
+    SQLiteQueryCollection,
+    SQLiteHeadList,
+    SQLiteClientQueryCollection,
+    SQLiteFinalQueryCollection,
+)
+from blender.main import (
+    required_config,
+    default_data_structures,
+    sqlite_data_structures,
+)
+
+from blender.tests.synthetic_data import (
+    standard_constants,
+)
+from blender.tests.test_array_structures import (
+    assert_same_head_list,
+    run_pipeline,
+    snapshot_round_trip,
+)
+from blender.tests.test_file_support import (
+    write_temporary_records
+)
+
+
+class TestSQLiteQueryCollection(TestCase):
+
+    def _create_collection(self):
+        config = DotDict()
+        config.url_stats_class = SQLiteURLStats
+        config.query_class = SQLiteQuery
+        config.database_file_name = ''
+        return SQLiteQueryCollection(config)
+
+    def test_add(self):
+        a_query_collection = self._create_collection()
+        a_query_collection.add(('a_query', 'a_url'))
+        a_query_collection.add(('a_query', 'a_url'))
+        a_query_collection.add(('a_query', 'another_url'), 3)
+
+        self.assertTrue('a_query' in a_query_collection)
+        self.assertTrue('a_url' in a_query_collection['a_query'])
+        self.assertTrue('no_url' not in a_query_collection['a_query'])
+        self.assertEqual(a_query_collection.number_of_query_url_pairs, 5)
+        self.assertEqual(a_query_collection['a_query'].number_of_urls, 5)
+        self.assertEqual(a_query_collection['a_query'].number_of_unique_urls, 2)
+        self.assertEqual(a_query_collection['a_query']['a_url'].number_of_repetitions, 2)
+        self.assertEqual(a_query_collection['a_query']['another_url'].number_of_repetitions, 3)
+        self.assertEqual(
+            list(a_query_collection.iter_records()),
+            [('a_query', 'a_url'), ('a_query', 'another_url')]
+        )
+
+    def test_bulk_load(self):
+        file_name = write_temporary_records([['q2', 'u1'], ['q1', 'u1'], ['q2', 'u1'], ['q2', 'u2']])
+        try:
+            a_query_collection = self._create_collection()
+            a_query_collection.bulk_load(file_name, chunk_size=10)
+        finally:
+            os.unlink(file_name)
+
+        self.assertEqual(list(a_query_collection), ['q2', 'q1'])
+        self.assertEqual(a_query_collection.number_of_query_url_pairs, 4)
+        self.assertEqual(a_query_collection['q2']['u1'].number_of_repetitions, 2)
+
+    def test_delitem(self):
+        a_query_collection = self._create_collection()
+        a_query_collection.add(('q1', 'u1'))
+        a_query_collection.add(('q1', 'u2'))
+        a_query_collection.add(('q2', 'u1'))
+
+        del a_query_collection['q1']['u1']
+        self.assertFalse(a_query_collection.connection.in_transaction)
+        self.assertEqual(list(a_query_collection['q1']), ['u2'])
+        del a_query_collection['q1']
+        self.assertFalse(a_query_collection.connection.in_transaction)
+        self.assertTrue('q1' not in a_query_collection)
+        self.assertEqual(list(a_query_collection.iter_records()), [('q2', 'u1')])
+
+    def test_subsume_those_not_present(self):
+        reference_query_collection = self._create_collection()
+        test_query_collection = self._create_collection()
+        reference_list_of_query_url_pairs = [
+            ('q1', 'u1'),
+            ('q1', 'u1'),
+            ('q2', 'u1'),
+            ('q2', 'u2'),
+            ('q4', 'u4'),
+        ]
+        for query_url_pair in reference_list_of_query_url_pairs:
+            reference_query_collection.add(query_url_pair)
+            test_query_collection.add(query_url_pair)
+        for query_url_pair in [('q5', 'u1'), ('q6', 'u1'), ('q4', 'u9'), ('q4', 'u9')]:
+            test_query_collection.add(query_url_pair)
+
+        test_query_collection.subsume_those_not_present_in(reference_query_collection)
+        self.assertFalse(test_query_collection.connection.in_transaction)
+
+        self.assertEqual(test_query_collection['*']['*'].number_of_repetitions, 4)
+        self.assertEqual(test_query_collection['*'].number_of_urls, 4)
+        self.assertEqual(test_query_collection['q4'].number_of_urls, 1)
+        self.assertTrue('u9' not in test_query_collection['q4'])
+        self.assertTrue('q5' not in test_query_collection)
+        self.assertEqual(test_query_collection['q1']['u1'].number_of_repetitions, 2)
+        self.assertEqual(test_query_collection.number_of_query_url_pairs, 9)
+
+
+class TestSQLitePipeline(TestCase):
+
+    def test_configuration(self):
+        config = configuration(
+            definition_source=required_config,
+            values_source_list=[
+                sqlite_data_structures,
+                standard_constants,
+            ]
+        )
+        self.assertEqual(config.optin_db.optin_db_class, SQLiteQueryCollection)
+        self.assertEqual(config.head_list_db.head_list_class, SQLiteHeadList)
+        self.assertEqual(config.client_db.client_db_class, SQLiteClientQueryCollection)
+        self.assertEqual(config.final_probabilities.final_probabilites_db_class, SQLiteFinalQueryCollection)
+        self.assertEqual(config.head_list_db.database_file_name, '')
+        self.assertFalse('streaming_top_m' in config.head_list_db)
+
+    @patch('blender.sqlite_structures.laplace')
+    @patch('blender.head_list.laplace')
+    @patch('blender.in_memory_structures.laplace')
+    def test_stages_commit(self, *laplace_mocks):
+        for laplace_mock in laplace_mocks:
+            laplace_mock.return_value = 0.0
+        with patch.object(SQLiteQueryCollection, 'commit', autospec=True) as commit:
+            head_list, client_stats, final_stats = run_pipeline(sqlite_data_structures)
+        committed = [call[0][0] for call in commit.call_args_list]
+        for collection in (head_list, client_stats, final_stats):
+            self.assertTrue(any(a_collection is collection for a_collection in committed))
+        self.assertTrue(committed[-1] is final_stats)
+        final_stats.commit()
+        self.assertFalse(final_stats.connection.in_transaction)
+
+    @patch('blender.sqlite_structures.laplace')
+    @patch('blender.head_list.laplace')
+    @patch('blender.in_memory_structures.laplace')
+    def test_snapshot(self, *laplace_mocks):
+        for laplace_mock in laplace_mocks:
+            laplace_mock.return_value = 0.0
+        head_list = run_pipeline(sqlite_data_structures)[0]
+        assert_same_head_list(self, head_list, snapshot_round_trip(head_list))
+
+    @patch('blender.sqlite_structures.laplace')
+    @patch('blender.head_list.laplace')
+    @patch('blender.in_memory_structures.laplace')
+    def test_same_as_in_memory_structures(self, *laplace_mocks):
+        # with the noise removed, both implementations must arrive at the same values
+        for laplace_mock in laplace_mocks:
+            laplace_mock.return_value = 0.0
+
+        expected_results = run_pipeline(default_data_structures)
+        sqlite_results = run_pipeline(sqlite_data_structures)
+
+        for expected, actual in zip(expected_results, sqlite_results):
+            self.assertEqual(list(expected.keys()), list(actual.keys()))
+            self.assertEqual(list(expected.iter_records()), list(actual.iter_records()))
+            self.assertEqual(expected.number_of_query_url_pairs, actual.number_of_query_url_pairs)
+            for query_str, url_str in expected.iter_records():
+                self.assertAlmostEqual(expected[query_str].probability, actual[query_str].probability)
+                self.assertAlmostEqual(expected[query_str].variance, actual[query_str].variance)
+                self.assertEqual(
+                    expected[query_str][url_str].number_of_repetitions,
+                    actual[query_str][url_str].number_of_repetitions
+                )
+                self.assertAlmostEqual(
+                    expected[query_str][url_str].probability,
+                    actual[query_str][url_str].probability
+                )
+                self.assertAlmostEqual(
+                    expected[query_str][url_str].variance,
+                    actual[query_str][url_str].variance
+                )
+
+        expected_head_list = expected_results[0]
+        sqlite_head_list = sqlite_results[0]
+        self.assertAlmostEqual(expected_head_list.tau, sqlite_head_list.tau)
+        for query_str in expected_head_list:
+            self.assertAlmostEqual(expected_head_list[query_str].tau, sqlite_head_list[query_str].tau)
@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from blender.vocabulary import (
+    Vocabulary,
+)
+
+
+class TestVocabulary(TestCase):
+
+    def test_find_id(self):
+        a_vocabulary = Vocabulary()
+        self.assertEqual(a_vocabulary.find_id('q1'), 0)
+        self.assertEqual(a_vocabulary.find_id('u1'), 1)
+        self.assertEqual(a_vocabulary.find_id('q1'), 0)
+        self.assertEqual(a_vocabulary.find_id('q2', create=False), None)
+        self.assertEqual(len(a_vocabulary), 2)
+        self.assertEqual(a_vocabulary[1], 'u1')
+        self.assertTrue('q1' in a_vocabulary)
+        self.assertTrue('q2' not in a_vocabulary)
+
+    def test_reset(self):
+        a_vocabulary = Vocabulary()
+        strs = a_vocabulary.strs
+        a_vocabulary.find_id('q1')
+        a_vocabulary.find_id('u1')
+
+        a_vocabulary.reset()
+        self.assertEqual(len(a_vocabulary), 0)
+        self.assertTrue('q1' not in a_vocabulary)
+        self.assertEqual(a_vocabulary.find_id('u1'), 0)
+        # cleared in place, so the module level vocabulary stays the one imported everywhere
+        self.assertTrue(a_vocabulary.strs is strs)
+
+    def test_intern(self):
+        a_vocabulary = Vocabulary()
+        a_str = ''.join(['q', '1'])
+        an_equal_str = ''.join(['q', '1'])
+        self.assertFalse(a_str is an_equal_str)
+
+        self.assertTrue(a_vocabulary.intern(a_str) is a_str)
+        self.assertTrue(a_vocabulary.intern(an_equal_str) is a_str)
@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from collections import (
+    Counter
+)
+import os
+import tempfile
+
+from blender.file_support import (
+    iter_json_records
+)
+from blender.tests.zipf_data import (
+    ZipfWorkload,
+    split_sizes,
+)
+
+
+class TestZipfWorkload(TestCase):
+
+    def test_draw(self):
+        workload = ZipfWorkload(50, 200, query_exponent=1.2, urls_per_query=4, seed=3)
+        query_ids, url_ids = workload.draw(20000)
+
+        self.assertEqual(len(query_ids), 20000)
+        self.assertTrue(0 <= query_ids.min() and query_ids.max() < 50)
+        self.assertTrue(0 <= url_ids.min() and url_ids.max() < 200)
+        query_counts = Counter(query_ids.tolist())
+        # the most popular query is the first rank
+        self.assertEqual(query_counts.most_common(1)[0][0], 0)
+        self.assertTrue(query_counts[0] > query_counts[9] > 0)
+        # each query draws only from its own run of urls
+        for query_id, url_id in zip(query_ids.tolist(), url_ids.tolist()):
+            self.assertTrue((url_id - workload.url_offsets[query_id]) % 200 < workload.numbers_of_urls[query_id])
+
+    def test_urls_per_query_distributions(self):
+        constant = ZipfWorkload(100, 1000, urls_per_query=5, urls_per_query_distribution='constant', seed=1)
+        self.assertEqual(set(constant.numbers_of_urls.tolist()), {5})
+        uniform = ZipfWorkload(100, 1000, urls_per_query=5, urls_per_query_distribution='uniform', seed=1)
+        self.assertTrue(1 <= uniform.numbers_of_urls.min() and uniform.numbers_of_urls.max() <= 9)
+        capped = ZipfWorkload(100, 3, urls_per_query=50, seed=1)
+        self.assertTrue(capped.numbers_of_urls.max() <= 3)
+        self.assertRaises(ValueError, ZipfWorkload, 10, 10, urls_per_query_distribution='poisson')
+
+    def test_reproducible(self):
+        first = list(ZipfWorkload(100, 1000, seed=7).iter_blocks(1000, 300))
+        second = list(ZipfWorkload(100, 1000, seed=7).iter_blocks(1000, 300))
+        self.assertEqual([len(lines) for lines in first], [300, 300, 300, 100])
+        self.assertEqual(first, second)
+
+    def test_write(self):
+        for suffix in ('.json', '.json.gz'):
+            handle, file_name = tempfile.mkstemp(suffix=suffix)
+            os.close(handle)
+            try:
+                ZipfWorkload(100, 1000, seed=2).write(file_name, 250, block_size=100)
+                records = list(iter_json_records(file_name))
+            finally:
+                os.unlink(file_name)
+            self.assertEqual(len(records), 250)
+            self.assertTrue(all(query_str.startswith('q') and url_str.startswith('u') for query_str, url_str in records))
+
+    def test_split_sizes(self):
+        self.assertEqual(split_sizes(1000000, 0.05, 0.95), (47500, 2500, 950000))
+        self.assertEqual(sum(split_sizes(12345, 0.1, 0.7)), 12345)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+# A synthetic workload for benchmarking without the AOL dataset.  Queries are drawn from a Zipf
+# distribution over 'number_of_queries' ranks.  Each query has its own number of urls, and the urls of
+# a query are drawn from a Zipf distribution over that many ranks.  The url ranks of a query map onto a
+# run of the 'number_of_urls' url ids beginning at a random offset, so popular urls are shared between
+# queries.
+
+# Records are drawn independently, so rather than shuffling the whole data set like tests/aol_prep.py,
+# the generator streams the first records to optin_s, the next to optin_t and the rest to the client
+# file, in blocks of ZIPF_BLOCK_SIZE records.  An output file name with a compressed extension, such as
+# '.gz', is compressed as it is written.
+
+#    python -m blender.tests.zipf_data --number_of_records=100000000 --number_of_queries=10000000
+
+import os
+
+from numpy import (
+    arange,
+    cumsum,
+    full,
+    maximum,
+    minimum,
+    searchsorted,
+)
+from numpy.random import (
+    default_rng
+)
+
+from blender.file_support import (
+    COMPRESSIONS
+)
+
+# the number of records drawn and written at a time
+ZIPF_BLOCK_SIZE = 1 << 20
+
+URLS_PER_QUERY_DISTRIBUTIONS = ('constant', 'uniform', 'geometric')
+
+
+def zipf_cdf(number_of_ranks, exponent):
+    """the unnormalized cumulative weights of ranks 1 through 'number_of_ranks' of a Zipf distribution"""
+    return cumsum(arange(1, number_of_ranks + 1, dtype=float) ** -exponent)
+
+
+def split_sizes(number_of_records, optin_percentage, optin_s_percentage):
+    """the numbers of records of the optin_s, optin_t and client files, in the proportions of
+    tests/aol_prep.py"""
+    total_optin = int(number_of_records * optin_percentage)
+    optin_s_size = int(total_optin * optin_s_percentage)
+    return optin_s_size, total_optin - optin_s_size, number_of_records - total_optin
+
+
+def open_output(file_name):
+    """open a file for writing text, compressed if its extension is that of one of the COMPRESSIONS"""
+    for magic, extensions, open_function in COMPRESSIONS:
+        if file_name.endswith(extensions):
+            return open_function(file_name, mode='wt', encoding='utf-8')
+    return open(file_name, mode='w', encoding='utf-8')
+
+
+class ZipfWorkload(object):
+    """a random source of <q, u> records with Zipf distributed queries and urls"""
+    def __init__(
+        self,
+        number_of_queries,
+        number_of_urls,
+        query_exponent=1.0,
+        url_exponent=1.0,
+        urls_per_query=10,
+        urls_per_query_distribution='geometric',
+        seed=None,
+    ):
+        if urls_per_query_distribution not in URLS_PER_QUERY_DISTRIBUTIONS:
+            raise ValueError('unknown urls_per_query_distribution {}'.format(urls_per_query_distribution))
+        self.rng = default_rng(seed)
+        self.query_cdf = zipf_cdf(number_of_queries, query_exponent)
+        if urls_per_query_distribution == 'constant':
+            numbers_of_urls = full(number_of_queries, urls_per_query)
+        elif urls_per_query_distribution == 'uniform':
+            numbers_of_urls = self.rng.integers(1, 2 * urls_per_query, number_of_queries)
+        else:
+            numbers_of_urls = self.rng.geometric(1.0 / urls_per_query, number_of_queries)
+        # a query cannot have more urls than there are
+        self.numbers_of_urls = minimum(maximum(numbers_of_urls, 1), number_of_urls)
+        self.url_cdf = zipf_cdf(int(self.numbers_of_urls.max()), url_exponent)
+        self.url_offsets = self.rng.integers(0, number_of_urls, number_of_queries)
+        self.number_of_urls = number_of_urls
+
+    def draw(self, number_of_records):
+        """the query ids and url ids of 'number_of_records' records as two arrays"""
+        query_ids = searchsorted(self.query_cdf, self.rng.random(number_of_records) * self.query_cdf[-1], side='right')
+        # the Zipf distribution over the urls of each query is the url cdf truncated to its number of urls
+        url_ranks = searchsorted(
+            self.url_cdf,
+            self.rng.random(number_of_records) * self.url_cdf[self.numbers_of_urls[query_ids] - 1],
+            side='right'
+        )
+        url_ids = (self.url_offsets[query_ids] + url_ranks) % self.number_of_urls
+        return query_ids, url_ids
+
+    def iter_blocks(self, number_of_records, block_size=ZIPF_BLOCK_SIZE):
+        """yield the lines of 'number_of_records' JSON [q, u] records, 'block_size' records at a time"""
+        while number_of_records > 0:
+            query_ids, url_ids = self.draw(min(block_size, number_of_records))
+            number_of_records -= len(query_ids)
+            yield [
+                '["q{}", "u{}"]\n'.format(query_id, url_id)
+                for query_id, url_id in zip(query_ids.tolist(), url_ids.tolist())
+            ]
+
+    def write(self, file_name, number_of_records, block_size=ZIPF_BLOCK_SIZE):
+        with open_output(file_name) as o:
+            for lines in self.iter_blocks(number_of_records, block_size):
+                o.writelines(lines)
+
+
+if __name__ == '__main__':
+
+    from configman import (
+        Namespace,
+        configuration
+    )
+
+    required_config = Namespace()
+
+    required_config.add_option(
+        "number_of_records",
+        default=1000000,
+        doc="the total number of records of the three output files"
+    )
+    required_config.add_option(
+        "number_of_queries",
+        default=100000,
+        doc="the number of distinct queries that records may be drawn from"
+    )
+    required_config.add_option(
+        "number_of_urls",
+        default=1000000,
+        doc="the number of distinct urls that records may be drawn from"
+    )
+    required_config.add_option(
+        "query_exponent",
+        default=1.0,
+        doc="the exponent of the Zipf distribution of the queries"
+    )
+    required_config.add_option(
+        "url_exponent",
+        default=1.0,
+        doc="the exponent of the Zipf distribution of the urls of each query"
+    )
+    required_config.add_option(
+        "urls_per_query",
+        default=10,
+        doc="the mean number of distinct urls of each query"
+    )
+    required_config.add_option(
+        "urls_per_query_distribution",
+        default='geometric',
+        doc="the distribution of the number of distinct urls of each query: {}".format(
+            ', '.join(URLS_PER_QUERY_DISTRIBUTIONS)
+        )
+    )
+    required_config.add_option(
+        "seed",
+        default=None,
+        from_string_converter=int,
+        doc="the seed of the random records, given the same seed and options the output is reproducible"
+    )
+    required_config.add_option(
+        "optin_percentage",
+        default=0.05,
+        doc="percentage of the records for the optin users"
+    )
+    required_config.add_option(
+        "optin_s_percentage",
+        default=0.95,
+        doc="percentage of the optin records in the S group"
+    )
+    required_config.add_option(
+        "optin_s_output_file_name",
+        default="optin_s.data.json",
+        doc="the pathname for the output optin_s file"
+    )
+    required_config.add_option(
+        "optin_t_output_file_name",
+        default="optin_t.data.json",
+        doc="the pathname for the output optin_t file"
+    )
+    required_config.add_option(
+        "client_output_file_name",
+        default="client.data.json",
+        doc="the pathname for the output client file"
+    )
+
+    config = configuration(
+        definition_source=required_config,
+    )
+
+    workload = ZipfWorkload(
+        config.number_of_queries,
+        config.number_of_urls,
+        config.query_exponent,
+        config.url_exponent,
+        config.urls_per_query,
+        config.urls_per_query_distribution,
+        config.seed,
+    )
+    output_sizes = zip(
+        (config.optin_s_output_file_name, config.optin_t_output_file_name, config.client_output_file_name),
+        split_sizes(config.number_of_records, config.optin_percentage, config.optin_s_percentage)
+    )
+    for file_name, number_of_records in output_sizes:
+        print('writing {} records to {}'.format(number_of_records, file_name))
+        workload.write(file_name, number_of_records)
+        print('{}: {} bytes'.format(file_name, os.path.getsize(file_name)))
@@ -0,0 +1,58 @@
+# The same query and URL strings appear in every database of the Blender algorithm: optin_database_s,
+# optin_database_t, the head list, the client database and the final probabilities.  The array based
+# collections of array_structures pass them through a single process wide Vocabulary that gives each
+# distinct string a dense integer id, and key their <q, u> pairs on those ids, so comparisons between
+# databases are integer comparisons.  The text is only needed again when the final probabilities are
+# written.
+
+# The Vocabulary is append only: a string keeps its id after every collection that used it has
+# dropped it, because the ids are held in the columns of the other collections.  Its size is therefore
+# bounded by the number of distinct query and url strings read by the process, which for a single run
+# of main is the vocabulary of the input files.  A process that runs the algorithm repeatedly should
+# call vocabulary.reset() between runs, once the array collections of the previous run are discarded.
+
+# The dictionary based collections of in_memory_structures key on the strings themselves, interned
+# with sys.intern, so the databases still share the storage for the text without the Vocabulary's
+# table of ids, which would outlive them.
+
+
+class Vocabulary(object):
+    """a two way mapping between strings and dense integer ids.  Ids are never removed or reused, so
+    they remain valid for the life of the process"""
+    def __init__(self):
+        self.ids = {}  # string to id
+        self.strs = []  # id to string
+
+    def find_id(self, a_str, create=True):
+        try:
+            return self.ids[a_str]
+        except KeyError:
+            if not create:
+                return None
+        an_id = len(self.strs)
+        self.ids[a_str] = an_id
+        self.strs.append(a_str)
+        return an_id
+
+    def reset(self):
+        """forget every string.  The ids given out before are no longer valid, so this is only for
+        when every collection using this vocabulary has been discarded"""
+        self.ids.clear()
+        del self.strs[:]
+
+    def intern(self, a_str):
+        """return the canonical object for a string"""
+        return self.strs[self.find_id(a_str)]
+
+    def __getitem__(self, an_id):
+        return self.strs[an_id]
+
+    def __len__(self):
+        return len(self.strs)
+
+    def __contains__(self, a_str):
+        return a_str in self.ids
+
+
+# the Vocabulary shared by all the databases of this process
+vocabulary = Vocabulary()